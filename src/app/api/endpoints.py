@@ -15,20 +15,23 @@ from langchain_core.output_parsers import StrOutputParser
 # 1. 数据库与鉴权
 from app.core.db_auth import get_session, get_password_hash, verify_password, create_access_token, SECRET_KEY, ALGORITHM
 from app.core.models import User, ChatSession, ChatMessage, UserProfile
-from app.core.stream_manager import init_stream_queue
-from app.graph.workflow import app_graph
+from app.graph.workflow import get_app_graph, GRAPH_TOPOLOGY, NODE_DEPENDENCIES
+from app.core.config import settings
+from app.core.run_profiler import start_run, finish_run
 
 # 2. Schema 数据模型
 from app.schemas.interview import JDRequest, InterviewReport
 
 # 3. 业务服务逻辑
-from app.services.interview_service import generate_interview_guide
+from app.services.interview_service import generate_interview_guide, start_interview_guide, get_report_cache_stats
 from app.services.memory_service import update_long_term_memory
 from app.services.mock_service import run_mock_interview_stream
 
 # 4. 核心工具与链
 from app.core.llm_factory import get_llm
+from app.core.llm_scheduler import Priority, set_llm_priority, llm_scheduler
 from app.utils.file_parser import parse_resume_file
+from app.core.user_kb import add_user_document, list_user_documents
 from app.chains.resume_extractor import extract_resume_features
 
 # ==========================================
@@ -59,6 +62,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
     return user
 
 
+async def get_admin_user(user: User = Depends(get_current_user)):
+    """
+    运维接口鉴权：登录用户且在 ADMIN_USERNAMES 中
+    """
+    if user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return user
+
+
 # ==========================================
 # 1. 认证接口 (Auth)
 # ==========================================
@@ -130,6 +142,13 @@ async def upload_resume(
 
     db.commit()
 
+    # 4. 简历原文写入用户私有知识库 (出题时与博客库一起检索)；失败不影响画像更新
+    if settings.USER_KB_ENABLED:
+        try:
+            await asyncio.to_thread(add_user_document, user.id, resume_text, file.filename, "resume")
+        except Exception as e:
+            logger.warning(f"⚠️ [UserKB] 简历写入私有知识库失败: {e}")
+
     return {
         "msg": "简历解析成功！已更新个人画像。",
         "extracted_facts": [f.content for f in facts],
@@ -137,6 +156,32 @@ async def upload_resume(
     }
 
 
+@router.post("/user-kb/upload")
+async def upload_user_document(
+        file: UploadFile = File(...),
+        doc_type: str = "note",
+        user: User = Depends(get_current_user),
+):
+    """
+    上传笔记 / 资料到个人私有知识库 (PDF/DOCX/TXT)：解析 -> 切片向量化 -> 写入该用户的独立索引
+    同名文件再次上传会替换旧内容
+    """
+    if not settings.USER_KB_ENABLED:
+        raise HTTPException(status_code=403, detail="私有知识库未开启")
+    text = await parse_resume_file(file)
+    try:
+        result = await asyncio.to_thread(add_user_document, user.id, text, file.filename, doc_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"msg": "已加入私有知识库", **result}
+
+
+@router.get("/user-kb/documents")
+async def get_user_documents(user: User = Depends(get_current_user)):
+    """当前用户私有知识库中的文档及片段数"""
+    return await asyncio.to_thread(list_user_documents, user.id)
+
+
 # ==========================================
 # 3. 历史记录接口 (History)
 # ==========================================
@@ -211,6 +256,7 @@ async def stream_system_design(tech_stack: str, topic: str):
     chain = prompt | llm | StrOutputParser()
 
     async def generate_stream():
+        set_llm_priority(Priority.INTERACTIVE)
         async for chunk in chain.astream({"tech_stack": tech_stack, "topic": topic}):
             yield f"data: {chunk}\n\n"
         yield "data: [DONE]\n\n"
@@ -301,6 +347,8 @@ async def stream_chat(
     # 或者你可以使用一个回调函数在生成结束后保存。
 
     async def generate_and_stream():
+        # 用户正在等待的对话，LLM 准入时优先放行
+        set_llm_priority(Priority.INTERACTIVE)
         full_response = ""
         async for chunk in chain.astream(lc_messages):
             full_response += chunk
@@ -415,6 +463,7 @@ async def agent_feedback(thread_id: str, feedback: str, action: str = "retry"):
     action: "approve" (强制通过) | "retry" (带意见重试)
     """
     config = {"configurable": {"thread_id": thread_id}}
+    app_graph = get_app_graph()
 
     if action == "approve":
         # 强制更新状态：把分数改成 100，这样路由就会通过
@@ -425,8 +474,14 @@ async def agent_feedback(thread_id: str, feedback: str, action: str = "retry"):
 
     # 恢复执行 (Resume)
     # 这里的 None 表示继续执行下一步 (即进入 tech_lead 重写)
-    async for event in app_graph.astream(None, config=config):
-        pass
+    # 重写轮次同样计入 Graph 运行统计，便于对比 targeted / full 两种质检策略
+    trace = start_run(GRAPH_TOPOLOGY, review_mode=settings.REVIEW_MODE,
+                      candidates=settings.TECH_CANDIDATES_N, resumed=True)
+    try:
+        async for event in app_graph.astream(None, config=config):
+            pass
+    finally:
+        finish_run(trace, NODE_DEPENDENCIES[GRAPH_TOPOLOGY])
 
     return {"status": "Resumed"}
 
@@ -439,74 +494,34 @@ async def stream_generate_guide(
 ):
     """
     L5 级 Agent 流式生成接口 (支持 DeepSeek 思考过程)
+    事件类型:
+    - thought: 思考过程
+    - question: 单道题目生成完毕 (source=tech/hr)
+    - meta / company_info / hr_questions / tech_questions(带 version) / review: 节点完成时的部分结果
+    - result: 最终完整报告 (与旧版兼容)
     """
 
-    # 1. 初始化队列 (ContextVar 会自动绑定到当前 task)
-    queue = init_stream_queue()
-
-    # 2. 定义后台运行任务
-    async def run_graph_background():
-        try:
-            initial_state = {
-                "jd_text": request.jd_text,
-                "user_id": user.id,
-                "iteration_count": 0,
-                "tech_stack": [],
-                "years_required": ""
-            }
-
-            thread_id = f"user_{user.id}_job_{hash(request.jd_text)}"
-            config = {"configurable": {"thread_id": thread_id}}
-
-            # 运行 Graph
-            final_state = await app_graph.ainvoke(initial_state, config=config)
-
-            # 运行结束，把最终结果构造成 token 类型发出去
-            # 注意：这里我们把整个 Report 打包成一个 JSON 字符串发过去
-            # 前端收到 type='result' 时，直接渲染最终报告
-            from app.schemas.interview import InterviewReport, JDMetaData
-
-            # ... 组装 Report 逻辑 (同 interview_service) ...
-            # 为了演示，简单组装
-            final_report = {
-                "meta": {
-                    "company_name": final_state.get("company_name"),
-                    "tech_stack": final_state.get("tech_stack"),
-                    "years_required": final_state.get("years_required"),
-                    "soft_skills": []
-                },
-                "tech_questions": final_state.get("tech_questions"),
-                "hr_questions": final_state.get("hr_questions"),
-                "company_analysis": final_state.get("company_info")
-            }
-
-            await queue.put({
-                "type": "result",  # 标记为最终结果
-                "content": json.dumps(final_report)
-            })
-
-        except Exception as e:
-            await queue.put({"type": "error", "content": str(e)})
-        finally:
-            # 发送结束信号
-            await queue.put(None)
-
-            # 3. 启动后台任务
-
-    task = asyncio.create_task(run_graph_background())
+    # 1. 获取 (或复用) 本次生成任务
+    # 相同 JD + 相同画像版本：缓存命中直接回放结果；正在运行则挂到同一个 Graph 运行上
+    flight = start_interview_guide(request, db, user.id)
 
-    # 4. 定义生成器 (消费队列)
+    # 2. 定义生成器 (消费队列)
+    # 在生成器里订阅 (订阅时会先回放历史事件)，客户端断开或生成器被关闭时退订，队列不会一直挂在 flight 上
     async def event_generator():
-        while True:
-            # 等待队列消息
-            data = await queue.get()
+        queue = flight.subscribe()
+        try:
+            while True:
+                # 等待队列消息
+                data = await queue.get()
 
-            if data is None:  # 结束信号
-                yield "data: [DONE]\n\n"
-                break
+                if data is None:  # 结束信号
+                    yield "data: [DONE]\n\n"
+                    break
 
-            # 发送 SSE
-            yield f"data: {json.dumps(data)}\n\n"
+                # 发送 SSE
+                yield f"data: {json.dumps(data)}\n\n"
+        finally:
+            flight.unsubscribe(queue)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -515,16 +530,23 @@ import platform
 import subprocess
 import tempfile
 import os
+import threading
 import uuid
-import pyttsx3  # 用于 Windows/Linux
 from fastapi.responses import Response
 
-# 预初始化 Windows/Linux 的引擎 (Mac 不用这个)
-try:
-    if platform.system() != "Darwin":
-        engine = pyttsx3.init()
-except Exception as e:
-    logger.error(f"⚠️ pyttsx3 init failed: {e}")
+# Windows/Linux 的 pyttsx3 引擎在第一次 TTS 请求时才初始化 (Mac 不用这个)
+_tts_engine = None
+_tts_lock = threading.Lock()
+
+
+def get_tts_engine():
+    global _tts_engine
+    if _tts_engine is None:
+        with _tts_lock:
+            if _tts_engine is None:
+                import pyttsx3  # 用于 Windows/Linux
+                _tts_engine = pyttsx3.init()
+    return _tts_engine
 
 
 @router.post("/audio/tts")
@@ -574,6 +596,7 @@ async def text_to_speech(text: str):
 
             # 使用 pyttsx3 (SAPI5 / eSpeak)
             # 注意：pyttsx3 是同步阻塞的，高并发建议放入线程池，单人使用无所谓
+            engine = get_tts_engine()
             engine.save_to_file(text, output_path)
             engine.runAndWait()
 
@@ -596,4 +619,92 @@ async def text_to_speech(text: str):
         # 尝试清理残余文件
         if 'output_path' in locals() and os.path.exists(output_path):
             os.remove(output_path)
-        raise HTTPException(status_code=500, detail=f"TTS生成失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"TTS生成失败: {str(e)}")
+
+
+# ==========================================
+# 7. 运维监控接口 (Admin)
+# ==========================================
+from app.core.llm_factory import get_pool_stats
+from app.core.llm_cache import llm_cache
+from app.core.jd_semantic_cache import jd_semantic_cache
+from app.core.run_profiler import get_profile_report
+from app.core.knowledge_base import get_kb_engine, is_kb_initialized
+from app.core.user_kb import user_index_cache
+from app.core.retrieval_cache import get_retrieval_cache_stats
+
+
+@router.get("/admin/llm/pool", dependencies=[Depends(get_admin_user)])
+async def llm_pool_stats():
+    """LLM HTTP 连接池统计 (连接复用率、响应状态分布)"""
+    return get_pool_stats()
+
+
+@router.get("/admin/cache/llm", dependencies=[Depends(get_admin_user)])
+async def llm_cache_stats():
+    """确定性链 (JD 解析 / 简历提取 / 画像提取) 的响应缓存命中统计"""
+    return llm_cache.stats()
+
+
+@router.get("/admin/cache/jd-semantic", dependencies=[Depends(get_admin_user)])
+async def jd_semantic_cache_stats():
+    """JD 语义近重复缓存：命中率与抽样审计得到的误命中率"""
+    return jd_semantic_cache.stats()
+
+
+@router.get("/admin/cache/report", dependencies=[Depends(get_admin_user)])
+async def report_cache_stats():
+    """/generate-guide 报告缓存与 single-flight 合并统计"""
+    return get_report_cache_stats()
+
+
+@router.get("/admin/llm/scheduler", dependencies=[Depends(get_admin_user)])
+async def llm_scheduler_stats():
+    """LLM 准入控制器：当前并发上限、各优先级排队深度与等待时间"""
+    return llm_scheduler.stats()
+
+
+@router.get("/admin/graph/profile", dependencies=[Depends(get_admin_user)])
+async def graph_profile(limit: int = 50):
+    """最近 N 次 Graph 运行：各节点耗时 (墙钟 / LLM / 排队) 与关键路径"""
+    return get_profile_report(limit)
+
+
+@router.get("/admin/kb/search", dependencies=[Depends(get_admin_user)])
+async def kb_search_stats():
+    """博客知识库检索：微批处理效果 (平均批大小) 与检索延迟 p50 / p99"""
+    # 查看统计不应触发模型与索引加载
+    if not is_kb_initialized():
+        return {"loaded": False, "initialized": False}
+    return get_kb_engine().stats()
+
+
+@router.post("/admin/kb/reload", dependencies=[Depends(get_admin_user)])
+async def kb_reload(force: bool = False):
+    """
+    热切换知识库索引：读取 CURRENT 指针，有新版本时后台加载后原子替换，进行中的检索不受影响
+    只作用于收到请求的 worker；多 worker 部署依赖 KB_INDEX_WATCH_INTERVAL 轮询各自发现新版本
+    """
+    if not is_kb_initialized():
+        return {"status": "not_initialized"}
+    return await asyncio.to_thread(get_kb_engine().reload, force)
+
+
+@router.get("/admin/kb/user-indexes", dependencies=[Depends(get_admin_user)])
+async def user_index_stats():
+    """用户私有知识库的常驻情况：常驻用户数 / 常驻字节数 / 内存预算，以及加载、淘汰与命中次数"""
+    return user_index_cache.stats()
+
+
+@router.get("/admin/kb/metadata", dependencies=[Depends(get_admin_user)])
+async def kb_metadata_values(field: str = "source"):
+    """知识库元数据倒排表：某个字段 (source / Header 1 / Header 2 / Header 3) 的可选取值及片段数"""
+    if not is_kb_initialized():
+        return {"field": field, "values": {}}
+    return {"field": field, "values": get_kb_engine().metadata_values(field)}
+
+
+@router.get("/admin/cache/retrieval", dependencies=[Depends(get_admin_user)])
+async def retrieval_cache_stats():
+    """检索两级缓存 (query 向量 / top-k 结果) 的命中率与当前索引版本"""
+    return get_retrieval_cache_stats()
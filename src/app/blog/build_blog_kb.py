@@ -5,20 +5,38 @@ import sys
 # 这会让下载速度从 0kb/s 变成 10MB/s
 os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
 
+import argparse
 import glob
+import hashlib
+import json
+import shutil
+import time
 from loguru import logger  # 使用我们统一的日志库
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
-
-# 🔴 核心修复 2：使用新版库，消除 DeprecationWarning
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from tqdm import tqdm
 
+# 让脚本直接运行时也能导入 app 包
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if SRC_PATH not in sys.path:
+    sys.path.append(SRC_PATH)
+
+from app.blog.chunking import make_splitters, split_markdown
+from app.blog.embedding_cache import ChunkEmbeddingCache
+from app.core.embedding_registry import get_embeddings
+from app.core.ann_index import apply_search_params, build_langchain_store, supports_remove, write_index_meta
+from app.core.index_versions import new_version_dir, publish_version, resolve_index_dir
+from app.core.mmap_store import export_langchain_faiss
+
 # === 配置区域 ===
 # 请确认你的博客路径是否正确
 BLOG_DIR = "/Users/caozhaoqi/Downloads/hexo-bamboo-blog/source/_posts"
 DB_SAVE_PATH = "../../../blog_faiss_index"
+MODEL_NAME = "BAAI/bge-small-zh-v1.5"
+MANIFEST_NAME = "manifest.json"  # 文件路径 -> 内容哈希 -> 片段 ID，保存在索引目录内
+EMBED_BATCH_SIZE = 64
+# 索引规格 (FAISS index_factory 字符串，见 app/core/ann_index.py) 与查询期参数
+INDEX_SPEC = "Flat"
+SEARCH_PARAMS = ""
 
 # 配置日志格式
 logger.remove()
@@ -27,78 +45,168 @@ logger.add(sys.stderr, format="<green>{time:HH:mm:ss}</green> | <level>{message}
 
 def init_embedding_model():
     logger.info("⏳ 正在通过国内镜像加载 BGE 模型...")
-    # 使用新版 HuggingFaceEmbeddings
-    return HuggingFaceEmbeddings(
-        model_name="BAAI/bge-small-zh-v1.5",
-        model_kwargs={'device': 'cpu'},  # 如果你是 M芯片 Mac，也可以尝试 'mps'
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    # 与线上服务共用同一套模型注册表 (自动选择 MPS / CUDA / CPU)
+    # 文档向量固定用 torch 全精度计算 (与片段向量缓存保持一致)，ONNX 后端只用于线上查询向量化
+    return get_embeddings(MODEL_NAME, backend="torch").load()
 
 
-def load_and_split_markdown(directory: str):
-    md_files = glob.glob(os.path.join(directory, "**/*.md"), recursive=True)
-    logger.info(f"📂 发现 {len(md_files)} 个 Markdown 文件")
+def list_markdown_files(directory: str):
+    return sorted(glob.glob(os.path.join(directory, "**/*.md"), recursive=True))
 
-    all_splits = []
 
-    # 1. 标题切分规则
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-    ]
-    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+def _chunk_ids(rel_path: str, count: int):
+    """片段 ID = 文件路径哈希 + 序号，同一文件重建后 ID 不变，便于按文件删除"""
+    prefix = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:12]
+    return [f"{prefix}-{i}" for i in range(count)]
 
-    # 2. 字符长度切分规则
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50
-    )
 
-    for file_path in tqdm(md_files, desc="处理进度"):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-
-            # 第一刀：按 Markdown 标题切
-            md_header_splits = markdown_splitter.split_text(text)
-
-            # 注入元数据
-            for doc in md_header_splits:
-                doc.metadata["source"] = os.path.basename(file_path)
+def load_manifest(db_path: str) -> dict:
+    path = os.path.join(db_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-            # 第二刀：按长度切
-            splits = text_splitter.split_documents(md_header_splits)
-            all_splits.extend(splits)
-
-        except Exception as e:
-            logger.error(f"❌ 读取文件 {file_path} 失败: {e}")
 
-    return all_splits
+def save_manifest(db_path: str, manifest: dict):
+    path = os.path.join(db_path, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
 
 
-def build_index():
+def build_index(incremental: bool = True, index_spec: str = INDEX_SPEC, search_params: str = SEARCH_PARAMS):
+    """
+    构建博客向量库
+    - incremental=True：对比 manifest，只切分 / 向量化新增或修改过的文章，删除已删除文章的向量
+    - incremental=False：全量重建 (片段向量仍然优先从磁盘缓存读取)
+    - index_spec / search_params：索引规格与查询期参数，记录在 manifest 和 index_meta.json 中
+    """
+    start = time.time()
     # 1. 初始化模型
     embedding_model = init_embedding_model()
-
-    # 2. 加载与切分
+    cache = ChunkEmbeddingCache(MODEL_NAME)
+
+    # 增量构建的基线是 CURRENT 指向的线上版本 (没有 CURRENT 时为旧布局的根目录)
+    current_dir, _ = resolve_index_dir(DB_SAVE_PATH)
+    manifest = load_manifest(current_dir) if incremental else {}
+    vector_store = None
+    if (manifest and manifest.get("model") == MODEL_NAME and manifest.get("index_spec", "Flat") == index_spec
+            and os.path.exists(os.path.join(current_dir, "index.faiss"))):
+        vector_store = FAISS.load_local(current_dir, embedding_model, allow_dangerous_deserialization=True)
+        apply_search_params(vector_store.index, search_params)
+    else:
+        if incremental:
+            logger.info("ℹ️ 没有可用的 manifest / 索引 (或模型、索引规格已变化)，执行全量构建")
+        manifest = {}
+    resolved_spec = manifest.get("resolved_spec", index_spec)
+    old_files = manifest.get("files", {})
+
+    # 2. 扫描文件，按内容哈希找出变化
+    md_files = list_markdown_files(BLOG_DIR)
+    logger.info(f"📂 发现 {len(md_files)} 个 Markdown 文件")
+    new_files, changed = {}, []
+    for file_path in md_files:
+        rel_path = os.path.relpath(file_path, BLOG_DIR)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except Exception as e:
+            logger.error(f"❌ 读取文件 {file_path} 失败: {e}")
+            continue
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        old = old_files.get(rel_path)
+        if old and old["hash"] == digest:
+            new_files[rel_path] = old
+        else:
+            changed.append((rel_path, file_path, text, digest))
+
+    deleted = [p for p in old_files if p not in new_files and p not in {c[0] for c in changed}]
+    logger.info(f"🔎 新增/修改 {len(changed)} 篇，删除 {len(deleted)} 篇，未变化 {len(new_files)} 篇")
+
+    # 3. 删除已删除 / 已修改文章的旧向量
+    stale_ids = [cid for p in deleted for cid in old_files[p]["chunk_ids"]]
+    stale_ids += [cid for p, *_ in changed if p in old_files for cid in old_files[p]["chunk_ids"]]
+    if vector_store is not None and stale_ids:
+        if not supports_remove(vector_store.index):
+            # HNSW / IVF 索引不能按位置压缩删除向量：全量重建 (向量都在磁盘缓存里，只是重新建图)
+            logger.info(f"ℹ️ 索引 {resolved_spec} 不支持增量删除向量，改为全量重建")
+            cache.close()
+            return build_index(incremental=False, index_spec=index_spec, search_params=search_params)
+        vector_store.delete(stale_ids)
+
+    # 4. 切分 + 向量化变化的文章 (命中磁盘缓存的片段不再计算)
     logger.info("🔪 开始切分文档...")
-    docs = load_and_split_markdown(BLOG_DIR)
-
-    if not docs:
+    splitters = make_splitters()
+    docs, ids = [], []
+    for rel_path, file_path, text, digest in tqdm(changed, desc="处理进度"):
+        splits = split_markdown(text, file_path, splitters)
+        chunk_ids = _chunk_ids(rel_path, len(splits))
+        new_files[rel_path] = {"hash": digest, "chunk_ids": chunk_ids}
+        docs.extend(splits)
+        ids.extend(chunk_ids)
+
+    if docs:
+        logger.info(f"🧠 正在向量化 {len(docs)} 个片段...")
+        texts = [d.page_content for d in docs]
+        vectors = cache.embed(texts, embedding_model.embed_documents, batch_size=EMBED_BATCH_SIZE)
+        logger.info(f"💾 向量缓存命中 {cache.hits}，新计算 {cache.misses}")
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [d.metadata for d in docs]
+        if vector_store is None:
+            vector_store, resolved_spec = build_langchain_store(
+                index_spec, text_embeddings, embedding_model, metadatas, ids, search_params
+            )
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    cache.close()
+
+    if vector_store is None:
         logger.warning("⚠️ 没有找到任何文档，请检查 BLOG_DIR 路径是否正确！")
         return
 
-    logger.success(f"✅ 共生成 {len(docs)} 个知识片段")
-
-    # 3. 向量化并建库
-    logger.info("🧠 正在向量化 (这可能需要几分钟)...")
-    vector_store = FAISS.from_documents(docs, embedding_model)
+    if not changed and not deleted and manifest.get("search_params", "") == search_params:
+        logger.success(f"✅ 知识库无变化，耗时 {time.time() - start:.1f}s")
+        return
 
-    # 4. 保存
-    vector_store.save_local(DB_SAVE_PATH)
-    logger.success(f"🎉 知识库已构建完成，保存在: {DB_SAVE_PATH}")
+    # 5. 写入新的版本目录：保存索引与 manifest，同时导出 mmap 格式 (线上服务加载它，不反序列化 pickle)
+    #    全部写完后才切换 CURRENT，线上 worker 轮询到新版本后热切换，无需重启
+    out_dir, version = new_version_dir(DB_SAVE_PATH)
+    vector_store.save_local(out_dir)
+    export_langchain_faiss(vector_store, out_dir)
+    write_index_meta(out_dir, resolved_spec, search_params, vector_store.index,
+                     requested_spec=index_spec, model=MODEL_NAME)
+    save_manifest(out_dir, {"model": MODEL_NAME, "index_spec": index_spec, "resolved_spec": resolved_spec,
+                            "search_params": search_params, "files": new_files})
+    publish_version(DB_SAVE_PATH, version)
+    logger.success(f"🎉 知识库已构建完成 ({vector_store.index.ntotal} 个片段，耗时 {time.time() - start:.1f}s)，"
+                   f"版本 {version} 保存在: {out_dir}")
+
+
+def convert_index():
+    """把已有的 pickle 格式索引转换为 mmap 格式，不重新向量化 (转换结果作为新版本发布)"""
+    current_dir, _ = resolve_index_dir(DB_SAVE_PATH)
+    vector_store = FAISS.load_local(current_dir, init_embedding_model(), allow_dangerous_deserialization=True)
+    out_dir, version = new_version_dir(DB_SAVE_PATH)
+    for name in os.listdir(current_dir):
+        # 复制 pickle 索引、manifest 与 index_meta (旧布局根目录下的 versions/ 子目录不复制)
+        if os.path.isfile(os.path.join(current_dir, name)):
+            shutil.copy2(os.path.join(current_dir, name), out_dir)
+    export_langchain_faiss(vector_store, out_dir)
+    publish_version(DB_SAVE_PATH, version)
+    logger.success(f"🎉 已转换为 mmap 格式: {out_dir} (版本 {version})")
 
 
 if __name__ == "__main__":
-    build_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="构建博客向量库")
+    parser.add_argument("--full", action="store_true", help="忽略 manifest，全量重建")
+    parser.add_argument("--convert", action="store_true", help="只把现有索引转换为 mmap 格式")
+    parser.add_argument("--index-spec", default=INDEX_SPEC,
+                        help="索引规格，如 Flat / HNSW32 / IVFauto,Flat / IVFauto,PQ16 / SQ8 / PCA256,IVFauto,PQ16")
+    parser.add_argument("--search-params", default=SEARCH_PARAMS, help="查询期参数，如 nprobe=16 / efSearch=64")
+    args = parser.parse_args()
+    if args.convert:
+        convert_index()
+    else:
+        build_index(incremental=not args.full, index_spec=args.index_spec, search_params=args.search_params)
\ No newline at end of file
@@ -0,0 +1,41 @@
+import os
+
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+# 切片规则在全量构建、增量构建与语料入库流水线之间共用，保证同一篇文章切出的片段一致
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+def make_splitters():
+    # 1. 标题切分规则
+    headers_to_split_on = [
+        ("#", "Header 1"),
+        ("##", "Header 2"),
+        ("###", "Header 3"),
+    ]
+    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+
+    # 2. 字符长度切分规则
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    return markdown_splitter, text_splitter
+
+
+def split_markdown(text: str, file_path: str, splitters=None, metadata: dict = None):
+    """单篇文章切片：先按 Markdown 标题切，再按长度切"""
+    markdown_splitter, text_splitter = splitters or make_splitters()
+
+    # 第一刀：按 Markdown 标题切
+    md_header_splits = markdown_splitter.split_text(text)
+
+    # 注入元数据
+    for doc in md_header_splits:
+        doc.metadata["source"] = os.path.basename(file_path)
+        if metadata:
+            doc.metadata.update(metadata)
+
+    # 第二刀：按长度切
+    return text_splitter.split_documents(md_header_splits)
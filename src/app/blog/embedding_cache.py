@@ -0,0 +1,83 @@
+import hashlib
+import os
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 默认放在项目根目录的 .cache 下，与索引目录分开：删掉索引全量重建时缓存依然有效
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "blog_embeddings.sqlite")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """
+    片段向量的磁盘缓存 (SQLite)
+    key = (模型名, 片段内容哈希)，value = float32 向量字节
+    同一段文字无论出现在哪篇文章、哪次构建，都只向量化一次。
+    """
+
+    def __init__(self, model_name: str, path: str = DEFAULT_CACHE_PATH):
+        self.model_name = model_name
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        # SQLite 单条语句的参数个数有上限，分批查询
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT hash, vector FROM chunk_embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                [self.model_name, *part],
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype="float32").tolist()
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunk_embeddings (model, hash, vector) VALUES (?, ?, ?)",
+            [(self.model_name, h, np.asarray(v, dtype="float32").tobytes()) for h, v in items.items()],
+        )
+        self._conn.commit()
+
+    def embed(self, texts: List[str], embed_fn, batch_size: Optional[int] = None) -> List[List[float]]:
+        """返回与 texts 顺序一致的向量：缓存命中的直接取，其余调用 embed_fn 批量计算后写回缓存"""
+        hashes = [chunk_hash(t) for t in texts]
+        vectors = self.get_many(hashes)
+        missing = {h: t for h, t in zip(hashes, texts) if h not in vectors}
+        if missing:
+            todo = list(missing.items())
+            step = batch_size or len(todo)
+            for i in range(0, len(todo), step):
+                part = todo[i:i + step]
+                computed = embed_fn([t for _, t in part])
+                new = {h: v for (h, _), v in zip(part, computed)}
+                self.put_many(new)
+                vectors.update(new)
+        return [vectors[h] for h in hashes]
+
+    def close(self):
+        self._conn.close()
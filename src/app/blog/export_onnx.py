@@ -0,0 +1,78 @@
+import os
+import sys
+
+os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+
+import argparse
+
+from loguru import logger
+
+# 让脚本直接运行时也能导入 app 包
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if SRC_PATH not in sys.path:
+    sys.path.append(SRC_PATH)
+
+from app.core.embedding_registry import DEFAULT_MODEL, get_embeddings
+from app.core.onnx_embeddings import OnnxEmbeddings, default_onnx_dir, export_onnx_model, parity_check
+
+# ==========================================
+# 导出 BGE 的 ONNX / int8 模型，并校验与 torch 输出的一致性
+# ==========================================
+# 用法 (在 src 目录下):
+#   python app/blog/export_onnx.py                  # 导出 fp32 + int8 到 项目根目录/models/bge-small-zh-v1.5-onnx
+#   python app/blog/export_onnx.py --check-only     # 只对已导出的模型做一致性校验
+# 校验不通过 (最小余弦相似度低于阈值) 时以非零状态退出，此时不应切换 EMBEDDING_BACKEND
+
+PARITY_TEXTS = [
+    "Redis 的持久化机制有哪些？RDB 和 AOF 的区别",
+    "如何排查 Java 应用的内存泄漏",
+    "FastAPI 依赖注入的原理",
+    "Kubernetes 中 Deployment 与 StatefulSet 的区别",
+    "介绍一下 Transformer 的自注意力机制",
+    "MySQL 索引为什么使用 B+ 树",
+    "负责推荐系统召回与排序模块的设计与优化，熟悉 Faiss、Milvus 等向量检索引擎",
+    "Explain the difference between processes and threads.",
+    "How does Python's GIL affect multi-threaded CPU-bound code?",
+    "熟悉 Go 语言，有高并发服务开发经验者优先",
+    "分布式事务的常见解决方案：2PC、TCC、Saga、本地消息表",
+    "LangChain",
+]
+
+
+def check(model_dir: str, model_name: str, threshold: float) -> bool:
+    reference = get_embeddings(model_name, backend="torch").load()
+    passed = True
+    checked = 0
+    for quantized in (False, True):
+        try:
+            candidate = OnnxEmbeddings(model_dir, quantized=quantized)
+        except FileNotFoundError as e:
+            logger.warning(f"⚠️ {e}")
+            continue
+        result = parity_check(reference, candidate, PARITY_TEXTS)
+        checked += 1
+        ok = result["min_cosine"] >= threshold
+        passed = passed and ok
+        logger.info(f"{'✅' if ok else '❌'} {'int8' if quantized else 'fp32'}: "
+                    f"min cosine {result['min_cosine']:.5f} | mean {result['mean_cosine']:.5f} "
+                    f"(threshold {threshold})")
+    if not checked:
+        # 一个模型都没校验到 (未导出 / 目录写错) 不能算通过，否则会据此切换 EMBEDDING_BACKEND
+        logger.error(f"❌ No ONNX model found under {model_dir}")
+        return False
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 BGE 的 ONNX / int8 模型并校验一致性")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--out", default=None, help="导出目录 (默认 项目根目录/models/<模型名>-onnx)")
+    parser.add_argument("--no-quantize", action="store_true", help="只导出 fp32 模型")
+    parser.add_argument("--check-only", action="store_true", help="跳过导出，只做一致性校验")
+    parser.add_argument("--threshold", type=float, default=0.99, help="最小余弦相似度阈值")
+    args = parser.parse_args()
+
+    out_dir = args.out or default_onnx_dir(args.model)
+    if not args.check_only:
+        export_onnx_model(args.model, out_dir, quantize=not args.no_quantize)
+    sys.exit(0 if check(out_dir, args.model, args.threshold) else 1)
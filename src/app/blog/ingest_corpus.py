@@ -0,0 +1,355 @@
+import os
+import sys
+
+os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+
+import argparse
+import glob
+import hashlib
+import json
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# 让脚本直接运行时也能导入 app 包
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if SRC_PATH not in sys.path:
+    sys.path.append(SRC_PATH)
+
+from app.blog.chunking import make_splitters, split_markdown
+
+# ==========================================
+# 面经语料流式入库
+# ==========================================
+# 加载 (生成器) -> 切片 (进程池) -> 向量化 (有界批次) -> 按段落盘 (segment) -> 流式合并
+# 任何阶段都不持有整个语料：在途切片任务数、向量化批大小、段大小都是固定上限，
+# 内存占用不随语料规模增长；每落盘一个段就写一次 checkpoint，崩溃后从最后一个段继续。
+# 合并同样逐段进行，输出 mmap 格式 (IVF 倒排数据在磁盘上 + SQLite 文档库)，见 merge_segments。
+
+DEFAULT_OUT_DIR = "../../../corpus_faiss_index"
+CHECKPOINT_NAME = "checkpoint.json"
+SEGMENTS_DIR = "segments"
+MERGED_IVF_DATA = "index.ivfdata"  # 合并后索引的倒排数据 (OnDiskInvertedLists，检索时 mmap 读取)
+TRAIN_SAMPLE = 100_000  # 训练 IVF 量化器的最少样本数 (不超过语料规模)
+DEFAULT_NPROBE = 16
+
+Doc = Tuple[str, str, dict]  # (文档 key, 正文, 元数据)
+
+
+# --- 1. 加载：逐条产出文档，不整体读入 ---
+def iter_documents(inputs: List[str]) -> Iterator[Doc]:
+    """支持 Markdown / txt 文件、目录 (递归) 和 JSONL (每行 {"text"|"content", "source", ...})"""
+    for path in inputs:
+        if os.path.isdir(path):
+            files = sorted(
+                f for ext in ("md", "txt", "jsonl")
+                for f in glob.glob(os.path.join(path, f"**/*.{ext}"), recursive=True)
+            )
+        else:
+            files = [path]
+        for file_path in files:
+            if file_path.endswith(".jsonl"):
+                yield from _iter_jsonl(file_path)
+                continue
+            with open(file_path, "r", encoding="utf-8") as f:
+                yield file_path, f.read(), {}
+
+
+def _iter_jsonl(file_path: str) -> Iterator[Doc]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"⚠️ 跳过无法解析的行: {file_path}:{line_no + 1}")
+                continue
+            text = record.pop("text", None) or record.pop("content", "")
+            source = record.pop("source", None) or f"{os.path.basename(file_path)}:{line_no + 1}"
+            record.pop("id", None)
+            # 只保留简单类型的元数据，避免把大字段带进 docstore
+            meta = {k: v for k, v in record.items() if isinstance(v, (str, int, float, bool))}
+            yield f"{file_path}:{line_no + 1}", text, {"source": source, **meta}
+
+
+# --- 2. 切片：在子进程中执行 ---
+_splitters = None
+
+
+def _split_doc(doc: Doc) -> Tuple[str, List[Tuple[str, dict]]]:
+    global _splitters
+    if _splitters is None:
+        _splitters = make_splitters()
+    key, text, meta = doc
+    chunks = split_markdown(text, meta.get("source", key), _splitters, metadata=meta)
+    return key, [(c.page_content, c.metadata) for c in chunks if c.page_content.strip()]
+
+
+def bounded_map(pool: ProcessPoolExecutor, fn, items: Iterable, max_inflight: int) -> Iterator:
+    """按输入顺序返回结果；在途任务数不超过 max_inflight，下游处理慢时上游自动停下 (背压)"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_inflight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# --- 3. checkpoint ---
+def load_checkpoint(out_dir: str, signature: str) -> dict:
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+        if ckpt.get("signature") == signature:
+            return ckpt
+        logger.warning("⚠️ 输入或参数已变化，忽略旧的 checkpoint，从头开始")
+    return {"signature": signature, "docs_done": 0, "chunks_done": 0, "segments": [], "merged": False}
+
+
+def save_checkpoint(out_dir: str, ckpt: dict):
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ckpt, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        # Windows 没有 resource 模块：有 psutil 时读峰值工作集，否则不统计
+        try:
+            import psutil
+        except ImportError:
+            return 0.0
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class SegmentWriter:
+    """攒够 segment_size 个片段就向量化并落盘成一个独立的 FAISS 段，然后释放内存"""
+
+    def __init__(self, out_dir: str, embedding_model, cache, batch_size: int):
+        self.seg_root = os.path.join(out_dir, SEGMENTS_DIR)
+        os.makedirs(self.seg_root, exist_ok=True)
+        self.embedding_model = embedding_model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.ids: List[str] = []
+
+    def add(self, key: str, chunks: List[Tuple[str, dict]]):
+        prefix = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        for i, (text, meta) in enumerate(chunks):
+            self.texts.append(text)
+            self.metadatas.append(meta)
+            self.ids.append(f"{prefix}-{i}")
+
+    def __len__(self):
+        return len(self.texts)
+
+    def flush(self, seg_no: int) -> Optional[str]:
+        if not self.texts:
+            return None
+        from langchain_community.vectorstores import FAISS
+
+        # 分批向量化，单批大小固定，命中磁盘缓存的片段不再计算
+        vectors = self.cache.embed(self.texts, self.embedding_model.embed_documents, batch_size=self.batch_size)
+        store = FAISS.from_embeddings(list(zip(self.texts, vectors)), self.embedding_model,
+                                      metadatas=self.metadatas, ids=self.ids)
+        name = f"seg_{seg_no:05d}"
+        tmp = os.path.join(self.seg_root, name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        store.save_local(tmp)
+        final = os.path.join(self.seg_root, name)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)  # 段目录原子可见，半写入的段不会被 checkpoint 引用
+        self.texts, self.metadatas, self.ids = [], [], []
+        return name
+
+
+def _train_sample(seg_dirs: List[str], total: int, limit: int):
+    """从各段按比例抽取训练样本，每次只读一个段的向量"""
+    import faiss
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    parts = []
+    for path in seg_dirs:
+        index = faiss.read_index(os.path.join(path, "index.faiss"))
+        vectors = index.reconstruct_n(0, index.ntotal)
+        take = min(len(vectors), max(1, round(len(vectors) * limit / total)))
+        parts.append(vectors[rng.choice(len(vectors), take, replace=False)])
+    return np.concatenate(parts)
+
+
+def merge_segments(out_dir: str, segments: List[str], embedding_model, nprobe: int = DEFAULT_NPROBE):
+    """
+    把所有段逐个合并成最终索引 (mmap 格式，保存在 out_dir 根目录，load_vector_store / MmapVectorStore 直接加载)
+    峰值内存 ≈ 一个段 + IVF 训练样本，与语料总规模无关：
+      - 向量：抽样训练 IVF 量化器，各段分别写成同一量化器下的倒排块，再用 merge_ondisk 合并进磁盘上的倒排文件
+      - 文本 / 元数据：逐段追加进 docstore.sqlite (DocstoreWriter)，元数据倒排表由 SQLite 排序生成
+    BM25 需要全语料的词表与倒排表，合并后的语料索引不生成 bm25/ (检索走纯向量)
+    """
+    import faiss
+    import numpy as np
+    from faiss.contrib.ondisk import merge_ondisk
+    from langchain_community.vectorstores import FAISS
+
+    from app.core.ann_index import resolve_spec, write_index_meta
+    from app.core.bm25_index import BM25_DIR
+    from app.core.mmap_store import INDEX_FILE, DocstoreWriter
+
+    seg_dirs = [os.path.join(out_dir, SEGMENTS_DIR, name) for name in segments]
+    if not seg_dirs:
+        return
+    total = sum(faiss.read_index(os.path.join(p, "index.faiss"), faiss.IO_FLAG_MMAP).ntotal for p in seg_dirs)
+
+    # 1. 训练量化器 (FAISS 建议每个聚类中心约 39 个以上的训练样本)
+    spec = resolve_spec("IVFauto,Flat", total)
+    dim = faiss.read_index(os.path.join(seg_dirs[0], "index.faiss"), faiss.IO_FLAG_MMAP).d
+    trained = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    sample = _train_sample(seg_dirs, total, min(total, max(TRAIN_SAMPLE, 39 * faiss.extract_index_ivf(trained).nlist)))
+    start = time.time()
+    trained.train(sample)
+    logger.info(f"🏋️ 已用 {len(sample)} 个样本训练 {spec}，耗时 {time.time() - start:.1f}s")
+    del sample
+
+    # 2. 逐段：向量 -> 倒排块文件，文本 -> docstore
+    blocks_dir = os.path.join(out_dir, "blocks.tmp")
+    shutil.rmtree(blocks_dir, ignore_errors=True)
+    os.makedirs(blocks_dir)
+    trained_path = os.path.join(blocks_dir, "trained.index")
+    faiss.write_index(trained, trained_path)
+    docstore = DocstoreWriter(out_dir)
+    blocks, offset = [], 0
+    for name, path in zip(segments, seg_dirs):
+        seg = FAISS.load_local(path, embedding_model, allow_dangerous_deserialization=True)
+        n = seg.index.ntotal
+        block = faiss.read_index(trained_path)
+        block.add_with_ids(seg.index.reconstruct_n(0, n), np.arange(offset, offset + n, dtype="int64"))
+        blocks.append(os.path.join(blocks_dir, f"{name}.index"))
+        faiss.write_index(block, blocks[-1])
+        docstore.add([(offset + pos, doc_id, doc.page_content, doc.metadata)
+                      for pos, doc_id in seg.index_to_docstore_id.items()
+                      for doc in [seg.docstore.search(doc_id)]])
+        offset += n
+        del seg, block
+        logger.info(f"🧩 已合并段 {name} ({offset}/{total}) | 峰值内存 {peak_rss_mb():.0f} MB")
+    docstore.close()
+
+    # 3. 倒排块合并到磁盘 (索引文件里记录的是倒排数据的绝对路径)
+    ivf_data = os.path.abspath(os.path.join(out_dir, MERGED_IVF_DATA))
+    if os.path.exists(ivf_data):
+        os.remove(ivf_data)
+    merge_ondisk(trained, blocks, ivf_data)
+    tmp = os.path.join(out_dir, INDEX_FILE + ".tmp")
+    faiss.write_index(trained, tmp)
+    os.replace(tmp, os.path.join(out_dir, INDEX_FILE))
+    write_index_meta(out_dir, spec, f"nprobe={nprobe}", trained, segments=len(segments))
+    shutil.rmtree(blocks_dir, ignore_errors=True)
+
+    # 旧版合并产物 (pickle 格式 / 与新位置不对应的 BM25) 删除，避免被误加载
+    for stale in ("index.pkl", BM25_DIR):
+        stale_path = os.path.join(out_dir, stale)
+        if os.path.isdir(stale_path):
+            shutil.rmtree(stale_path)
+        elif os.path.exists(stale_path):
+            os.remove(stale_path)
+    logger.success(f"🎉 已合并 {len(segments)} 个段，共 {trained.ntotal} 个片段 -> {out_dir} "
+                   f"(峰值内存 {peak_rss_mb():.0f} MB)")
+
+
+def ingest(inputs: List[str], out_dir: str, workers: int, segment_size: int, batch_size: int,
+           max_inflight: int, merge: bool = True):
+    from app.blog.build_blog_kb import MODEL_NAME, init_embedding_model
+    from app.blog.embedding_cache import ChunkEmbeddingCache
+
+    os.makedirs(out_dir, exist_ok=True)
+    signature = hashlib.sha1(json.dumps(
+        {"inputs": [os.path.abspath(p) for p in inputs], "model": MODEL_NAME, "segment_size": segment_size}
+    ).encode("utf-8")).hexdigest()[:12]
+    ckpt = load_checkpoint(out_dir, signature)
+    skip = ckpt["docs_done"]
+    if skip:
+        logger.info(f"⏩ 从 checkpoint 继续：已完成 {skip} 篇文档，{len(ckpt['segments'])} 个段")
+
+    embedding_model = init_embedding_model()
+    writer = SegmentWriter(out_dir, embedding_model, ChunkEmbeddingCache(MODEL_NAME), batch_size)
+
+    start = time.time()
+    docs_run = 0
+    pending_docs = 0  # 已进入当前段、尚未落盘的文档数
+    last_report = start
+
+    def _skip(docs: Iterator[Doc]) -> Iterator[Doc]:
+        for i, doc in enumerate(docs):
+            if i >= skip:
+                yield doc
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for key, chunks in bounded_map(pool, _split_doc, _skip(iter_documents(inputs)), max_inflight):
+            writer.add(key, chunks)
+            pending_docs += 1
+            docs_run += 1
+
+            # 只在文档边界切段，checkpoint 记录的文档数始终对应完整落盘的段
+            if len(writer) >= segment_size:
+                ckpt["chunks_done"] += len(writer)
+                ckpt["segments"].append(writer.flush(len(ckpt["segments"])))
+                ckpt["docs_done"] += pending_docs
+                ckpt["merged"] = False
+                pending_docs = 0
+                save_checkpoint(out_dir, ckpt)
+
+            now = time.time()
+            if now - last_report >= 10:
+                last_report = now
+                logger.info(f"📈 {docs_run / (now - start):.1f} docs/sec | 已完成 {ckpt['docs_done'] + pending_docs} 篇 | "
+                            f"峰值内存 {peak_rss_mb():.0f} MB")
+
+    if len(writer):
+        ckpt["chunks_done"] += len(writer)
+        ckpt["segments"].append(writer.flush(len(ckpt["segments"])))
+        ckpt["docs_done"] += pending_docs
+        ckpt["merged"] = False
+        save_checkpoint(out_dir, ckpt)
+
+    elapsed = time.time() - start
+    logger.success(f"✅ 入库完成：本次 {docs_run} 篇，{docs_run / elapsed if elapsed else 0:.1f} docs/sec，"
+                   f"累计 {ckpt['docs_done']} 篇 / {ckpt['chunks_done']} 个片段，"
+                   f"向量缓存命中 {writer.cache.hits} / 新计算 {writer.cache.misses}，峰值内存 {peak_rss_mb():.0f} MB")
+    writer.cache.close()
+
+    if merge and not ckpt.get("merged"):
+        merge_segments(out_dir, ckpt["segments"], embedding_model)
+        ckpt["merged"] = True
+        save_checkpoint(out_dir, ckpt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="面经语料流式入库 (Markdown / txt / JSONL)")
+    parser.add_argument("inputs", nargs="+", help="文件或目录")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="输出目录 (段、checkpoint 与合并后的索引)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="切片进程数")
+    parser.add_argument("--segment-size", type=int, default=20000, help="每个段的片段数")
+    parser.add_argument("--batch-size", type=int, default=64, help="向量化批大小")
+    parser.add_argument("--max-inflight", type=int, default=256, help="在途切片任务上限 (背压)")
+    parser.add_argument("--no-merge", action="store_true", help="只生成段，不合并成单一索引")
+    args = parser.parse_args()
+
+    ingest(args.inputs, args.out, args.workers, args.segment_size, args.batch_size,
+           args.max_inflight, merge=not args.no_merge)
@@ -27,44 +27,67 @@ if src_path not in sys.path:
 
 # 🔴 修复依赖导入
 # 必须先安装新版库: pip install langchain-huggingface
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.core.llm_factory import get_llm
+from app.core.retrieval_cache import get_retrieval_cache
+from app.core.index_versions import resolve_index_dir
+from app.core.mmap_store import load_vector_store
+from app.core.embedding_registry import get_embeddings
+from app.core.ann_index import to_similarity
+from app.core.context_packer import load_encoding, pack_context, with_similarity
 
 # 路径配置 (指向生成的向量库文件夹)
 DB_LOAD_PATH = "../../../blog_faiss_index"
 
+retrieval_cache = get_retrieval_cache("blog_cli")
 
-def query_blog_knowledge(question: str):
-    # 1. 初始化 Embedding 模型 (使用新版)
-    logger.debug("⏳ 正在加载 BGE 模型...")
-    embedding_model = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-small-zh-v1.5",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
 
+def _retrieve(question: str, k: int = 3):
+    """检索相关片段：命中缓存时不必加载模型和索引；索引文件变化后缓存自动失效"""
+    index_dir, version = resolve_index_dir(DB_LOAD_PATH)
+    retrieval_cache.bind_version(version)
+    docs = retrieval_cache.get_results(question, k)
+    if docs is not None:
+        logger.debug(f"♻️ 命中检索缓存: {question}")
+        return docs
+
+    # 1. 共享的 Embedding 模型 (交互式多次查询只加载一次)
+    embedding_model = get_embeddings()
+
+    # 加载向量库 (优先 mmap 格式；找不到时抛出异常，由调用方提示)
+    vector_store = load_vector_store(index_dir, embedding_model)
+    if vector_store is None:
+        raise FileNotFoundError(DB_LOAD_PATH)
+
+    vector = retrieval_cache.get_embedding(question)
+    if vector is None:
+        vector = embedding_model.embed_query(question)
+        retrieval_cache.set_embedding(question, vector)
+    # 记下向量相似度，组装上下文时丢弃相关度过低的片段
+    docs = [with_similarity(doc, to_similarity(vector_store.index, score))
+            for doc, score in vector_store.similarity_search_with_score_by_vector(vector, k=k)]
+    retrieval_cache.set_results(question, k, docs)
+    return docs
+
+
+def query_blog_knowledge(question: str):
     try:
-        # 加载向量库
-        vector_store = FAISS.load_local(
-            DB_LOAD_PATH,
-            embedding_model,
-            allow_dangerous_deserialization=True
-        )
+        # 2. 检索 (Retrieve)
+        logger.debug(f"🔍 正在检索问题: {question}")
+        docs = _retrieve(question, k=3)
     except Exception as e:
         return f"❌ 找不到知识库目录 '{DB_LOAD_PATH}'。\n请先确保你运行了 build_blog_kb.py 并且生成了索引文件。\n错误详情: {e}"
 
-    # 2. 检索 (Retrieve)
-    logger.debug(f"🔍 正在检索问题: {question}")
-    docs = vector_store.similarity_search(question, k=3)
-
     if not docs:
         return "博客里好像没有相关内容。"
 
-    # 拼接上下文
-    context = "\n\n".join([f"---片段来源: {d.metadata.get('source', '未知')}---\n{d.page_content}" for d in docs])
+    # 组装上下文：同源片段合并、去掉切片重叠，按 token 预算打包 (CLI 同步执行，直接加载 tiktoken 编码)
+    load_encoding()
+    packed = pack_context(docs)
+    if not packed["context"]:
+        return "博客里好像没有相关内容。"
+    context = packed["context"]
 
     # 3. 生成 (Generate)
     llm = get_llm(temperature=0.3)
@@ -84,7 +107,7 @@ def query_blog_knowledge(question: str):
 
     chain = prompt | llm | StrOutputParser()
 
-    logger.debug(f"📄 参考文章: {[d.metadata.get('source') for d in docs]}")
+    logger.debug(f"📄 参考文章: {packed['sources']} (上下文 {packed['tokens']} tokens)")
 
     response = chain.invoke({"context": context, "question": question})
     return response
@@ -1,9 +1,11 @@
-from typing import List
+from typing import Awaitable, Callable, List, Optional
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
+from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel
 from app.core.llm_factory import get_llm
 from app.schemas.interview import InterviewQuestion
+from app.utils.json_stream import stream_json_items
 
 
 # 辅助模型
@@ -11,11 +13,16 @@ class QuestionList(BaseModel):
     questions: List[InterviewQuestion]
 
 
-async def generate_hr_async(soft_skills: List[str], company_info: str = "") -> List[InterviewQuestion]:
+async def generate_hr_async(
+        soft_skills: List[str],
+        company_info: str = "",
+        on_question: Optional[Callable[[InterviewQuestion], Awaitable[None]]] = None,
+) -> List[InterviewQuestion]:
     """
     异步生成 HR 行为面试题
     :param soft_skills: JD 中提取的软技能列表
     :param company_info: (可选) 公司背景调研信息
+    :param on_question: (可选) 流式模式，每生成完一道题就立即回调
     """
     llm = get_llm(temperature=0.8)  # HR 题目可以灵活一点
     parser = PydanticOutputParser(pydantic_object=QuestionList)
@@ -42,12 +49,19 @@ async def generate_hr_async(soft_skills: List[str], company_info: str = "") -> L
         """
     )
 
-    chain = prompt | llm | parser
-
-    result = await chain.ainvoke({
+    inputs = {
         "context_str": context_str,
         "soft_skills": ", ".join(soft_skills),
         "format_instructions": parser.get_format_instructions()
-    })
+    }
+
+    if on_question is None:
+        chain = prompt | llm | parser
+        result = await chain.ainvoke(inputs)
+        return result.questions
 
+    # 流式模式：边生成边解析，最后仍用 PydanticOutputParser 校验完整输出
+    text_chain = prompt | llm | StrOutputParser()
+    full_text = await stream_json_items(text_chain.astream(inputs), "questions", InterviewQuestion, on_question)
+    result = parser.parse(full_text)
     return result.questions
\ No newline at end of file
@@ -1,8 +1,11 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from app.core.llm_factory import get_llm
+from app.core.llm_cache import cached_ainvoke
 from app.schemas.interview import JDMetaData
 
+PROMPT_VERSION = "v1"
+
 
 # 异步解析函数
 async def parse_jd_async(jd_text: str) -> JDMetaData:
@@ -25,9 +28,10 @@ async def parse_jd_async(jd_text: str) -> JDMetaData:
     chain = prompt | llm | parser
 
     # 注意：这里使用的是 ainvoke (Async Invoke)
-    result = await chain.ainvoke({
+    # 同一份 JD 重复提交时直接命中缓存，跳过 LLM 调用
+    result = await cached_ainvoke(chain, {
         "jd_text": jd_text,
         "format_instructions": parser.get_format_instructions()
-    })
+    }, namespace="jd_parser", version=PROMPT_VERSION, output_model=JDMetaData)
 
     return result
\ No newline at end of file
@@ -3,8 +3,11 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from app.core.llm_factory import get_llm
+from app.core.llm_cache import cached_ainvoke
 from loguru import logger
 
+PROMPT_VERSION = "v1"
+
 # 定义输出结构
 class UserFact(BaseModel):
     category: str = Field(description="类别: tech_stack/experience/preference/other")
@@ -43,10 +46,10 @@ async def extract_user_profile(chat_history: str) -> List[UserFact]:
     chain = prompt | llm | parser
 
     try:
-        result = await chain.ainvoke({
+        result = await cached_ainvoke(chain, {
             "chat_history": chat_history,
             "format_instructions": parser.get_format_instructions()
-        })
+        }, namespace="memory_extractor", version=PROMPT_VERSION, output_model=UserProfileUpdate)
         return result.new_facts
     except Exception as e:
         logger.debug(f"❌ Memory extraction failed: {e}")
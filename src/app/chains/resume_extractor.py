@@ -3,8 +3,11 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from app.core.llm_factory import get_llm
+from app.core.llm_cache import cached_ainvoke
 from loguru import logger
 
+PROMPT_VERSION = "v1"
+
 # 定义输出结构 (复用之前的 UserFact 逻辑)
 class UserFact(BaseModel):
     category: str = Field(description="类别: tech_stack(技术栈)/experience(经验)/education(学历)/project(项目)")
@@ -45,10 +48,10 @@ async def extract_resume_features(resume_text: str) -> List[UserFact]:
 
     try:
         # 截断简历过长内容，防止 token 溢出 (一般简历不会太长，取前 3000 字符足够)
-        result = await chain.ainvoke({
+        result = await cached_ainvoke(chain, {
             "resume_text": resume_text[:3000],
             "format_instructions": parser.get_format_instructions()
-        })
+        }, namespace="resume_extractor", version=PROMPT_VERSION, output_model=ResumeAnalysis)
         return result.facts
     except Exception as e:
         logger.debug(f"❌ Resume extraction failed: {e}")
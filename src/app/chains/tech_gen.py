@@ -1,9 +1,11 @@
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
+from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel, Field
 from app.core.llm_factory import get_llm
 from app.schemas.interview import InterviewQuestion
+from app.utils.json_stream import stream_json_items
 
 
 # 辅助模型：用于解析列表
@@ -17,7 +19,17 @@ async def generate_tech_async(
         kb_context: str = "",
         chat_history: List[str] = None,
         user_profile: str = "",  # 接收参数
+        count: int = 3,
+        feedback: str = "",
+        temperature: float = 0.7,
+        on_question: Optional[Callable[[InterviewQuestion], Awaitable[None]]] = None,
 ) -> List[InterviewQuestion]:
+    """
+    :param count: 生成题目数量 (质检定向重写时只补齐不合格的那几道)
+    :param feedback: (可选) 质检员对上一版不合格题目的意见
+    :param temperature: 采样温度 (Best-of-N 模式下每组候选使用不同温度)
+    :param on_question: (可选) 流式模式，每生成完一道题就立即回调，不必等 3 道题全部生成
+    """
     # 1. 处理默认值
     if chat_history is None:
         chat_history = []
@@ -25,7 +37,7 @@ async def generate_tech_async(
     # 2. 拼接历史记录字符串
     history_str = "\n".join(chat_history[-5:]) if chat_history else "无历史对话"
 
-    llm = get_llm(temperature=0.7)
+    llm = get_llm(temperature=temperature)
     parser = PydanticOutputParser(pydantic_object=QuestionList)
 
     # 3. 动态构建上下文指令
@@ -37,16 +49,26 @@ async def generate_tech_async(
         {kb_context}
         """
 
+    feedback_instruction = ""
+    if feedback:
+        feedback_instruction = f"""
+        【质检反馈】：
+        以下题目未通过质检，请不要重复它们，针对问题重新出题：
+        {feedback}
+        """
+
     # 4. 构建 Prompt
     prompt = ChatPromptTemplate.from_template(
         """
         你是一个资深技术面试官。
 
         【当前任务】：
-        基于技术栈 [{tech_stack}] 和职级 [{level}] 生成 3 道面试题。
+        基于技术栈 [{tech_stack}] 和职级 [{level}] 生成 {count} 道面试题。
 
         {context_instruction}
 
+        {feedback_instruction}
+
         {user_profile}
 
         【历史对话上下文（Memory）】：
@@ -63,16 +85,25 @@ async def generate_tech_async(
         """
     )
 
-    chain = prompt | llm | parser
-
     # 5. 执行 (🔴 核心修复：必须把 user_profile 传进去！)
-    result = await chain.ainvoke({
+    inputs = {
         "tech_stack": ", ".join(tech_stack),
         "level": level,
         "history_str": history_str,
         "user_profile": user_profile,  # <--- 之前漏了这行，导致 KeyError
         "context_instruction": context_instruction,
+        "count": count,
+        "feedback_instruction": feedback_instruction,
         "format_instructions": parser.get_format_instructions()
-    })
+    }
+
+    if on_question is None:
+        chain = prompt | llm | parser
+        result = await chain.ainvoke(inputs)
+        return result.questions
 
+    # 流式模式：边生成边解析，最后仍用 PydanticOutputParser 校验完整输出
+    text_chain = prompt | llm | StrOutputParser()
+    full_text = await stream_json_items(text_chain.astream(inputs), "questions", InterviewQuestion, on_question)
+    result = parser.parse(full_text)
     return result.questions
\ No newline at end of file
@@ -0,0 +1,121 @@
+import json
+import math
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+from loguru import logger
+
+# ==========================================
+# 可插拔的 ANN 索引
+# ==========================================
+# 索引规格直接使用 FAISS index_factory 字符串，例如：
+#   Flat            精确检索 (默认，与 LangChain FAISS.from_documents 一致)
+#   HNSW32          图索引，不支持删除向量
+#   IVFauto,Flat    倒排 + 原始向量，nlist 按语料规模自动取 ~4*sqrt(N)
+#   IVFauto,PQ16    倒排 + 乘积量化 (16 个子空间)
+#   SQ8             int8 标量量化
+#   PCA256,IVFauto,PQ16   先 PCA 降维再建索引
+# 查询期参数 (nprobe / efSearch) 单独记录，加载索引时自动应用。
+
+INDEX_META_FILE = "index_meta.json"
+_SUPPORTED = re.compile(r"^(PCA\d+,)?(Flat|HNSW\d+(,Flat)?|IVF(\d+|auto),(Flat|PQ\d+|SQ8)|SQ8|SQfp16)$")
+
+
+def resolve_spec(spec: str, n_vectors: int) -> str:
+    """校验规格，并把 IVFauto 换成具体的 nlist；训练样本不足时退回 Flat"""
+    spec = spec.replace(" ", "")
+    if not _SUPPORTED.match(spec):
+        raise ValueError(f"Unsupported index spec: {spec}")
+    if "IVFauto" in spec:
+        nlist = max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+        spec = spec.replace("IVFauto", f"IVF{nlist}")
+    nlist_match = re.search(r"IVF(\d+)", spec)
+    pq_match = re.search(r"PQ(\d+)", spec)
+    # FAISS 训练 IVF 至少需要 nlist 个样本，PQ 每个子空间需要 256 个样本
+    min_train = max(int(nlist_match.group(1)) if nlist_match else 0, 256 if pq_match else 0)
+    if n_vectors < min_train:
+        logger.warning(f"⚠️ [ANN] Only {n_vectors} vectors, not enough to train {spec}; falling back to Flat")
+        return "Flat"
+    return spec
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """
+    能否增量删除向量 (remove_ids 后其余向量的位置依次前移)，否则需要整体重建：
+    - HNSW 不支持 remove_ids
+    - IVF 的 remove_ids 不压缩编号 (其余向量保留原位置)，而 LangChain FAISS.delete / docstore 行号 / BM25
+      都按位置前移重新编号，删除后检索结果会对应到错误的片段
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    return not isinstance(inner, (faiss.IndexHNSW, faiss.IndexIVF))
+
+
+def build_index(spec: str, vectors: np.ndarray, max_train: int = 100_000) -> Tuple[faiss.Index, str]:
+    """按规格创建并训练一个空索引 (不添加向量)，返回 (索引, 实际使用的规格)"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    resolved = resolve_spec(spec, len(vectors))
+    index = faiss.index_factory(vectors.shape[1], resolved, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > max_train:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), max_train, replace=False)]
+        start = time.time()
+        index.train(sample)
+        logger.info(f"🏋️ [ANN] Trained {resolved} on {len(sample)} vectors in {time.time() - start:.1f}s")
+    return index, resolved
+
+
+def apply_search_params(index: faiss.Index, params: str):
+    """例如 "nprobe=16" / "efSearch=64"，空字符串表示使用默认值"""
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+
+
+def build_langchain_store(spec: str, text_embeddings: List[Tuple[str, List[float]]], embeddings,
+                          metadatas: List[dict], ids: Optional[List[str]], search_params: str = ""):
+    """用指定规格的索引创建 LangChain FAISS 对象，接口与 FAISS.from_embeddings 相同"""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    vectors = np.asarray([v for _, v in text_embeddings], dtype="float32")
+    index, resolved = build_index(spec, vectors)
+    apply_search_params(index, search_params)
+    store = FAISS(embedding_function=embeddings, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+    store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return store, resolved
+
+
+def write_index_meta(path: str, spec: str, search_params: str, index: faiss.Index, **extra):
+    meta = {
+        "spec": spec,
+        "search_params": search_params,
+        "dim": index.d,
+        "ntotal": index.ntotal,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        **extra,
+    }
+    with open(os.path.join(path, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_index_meta(path: str) -> Optional[dict]:
+    meta_path = os.path.join(path, INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def to_similarity(index: faiss.Index, score: float) -> float:
+    """FAISS 返回的分数换算成余弦相似度 (向量已归一化)：L2 距离平方 d -> 1 - d / 2，内积即余弦"""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return float(score)
+    return 1.0 - float(score) / 2.0
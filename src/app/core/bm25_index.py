@@ -0,0 +1,205 @@
+import json
+import math
+import os
+import re
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+# ==========================================
+# BM25 倒排索引 (中文分词 + ASCII 词)
+# ==========================================
+# 与 FAISS 索引一起构建 (mmap 导出时生成)，文档编号 = 向量位置 = docstore 行号，
+# 词法结果与向量结果可以直接按位置融合。磁盘格式 (索引目录下的 bm25/):
+#   meta.json     分词方式、文档数、平均长度、BM25 参数
+#   vocab.txt     词表，每行一个词，行号即词 ID
+#   offsets.npy   int64[V+1]，词 i 的倒排表位于 [offsets[i], offsets[i+1])
+#   doc_ids.npy   int32，按词拼接的倒排表 (文档编号升序)
+#   tfs.npy       uint16，对应的词频
+#   doc_len.npy   int32，每个文档的词数
+# 大数组以 mmap 方式打开，多个 worker 共享页缓存。
+
+BM25_DIR = "bm25"
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"([a-z0-9][a-z0-9_+#.]*)|([一-鿿]+)")
+_STOPWORDS = {"的", "了", "是", "在", "和", "与", "及", "或", "中", "对", "有", "也", "就", "都", "而", "等", "把", "被",
+              "一个", "我们", "你", "我", "他", "它", "这", "那", "吗", "呢", "啊", "如何", "什么", "怎么", "为什么"}
+
+try:
+    import jieba
+
+    jieba.setLogLevel(60)
+    DEFAULT_TOKENIZER = "jieba"
+except ImportError:  # 未安装 jieba 时退回中文二元组切分
+    jieba = None
+    DEFAULT_TOKENIZER = "bigram"
+
+
+def _segment_cjk(text: str, tokenizer: str) -> List[str]:
+    if tokenizer == "jieba":
+        # 搜索引擎模式：长词再切出子词，"持久化" -> 持久 / 持久化，召回更好
+        return jieba.lcut_for_search(text)
+    if len(text) == 1:
+        return [text]
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def tokenize(text: str, tokenizer: str = DEFAULT_TOKENIZER) -> List[str]:
+    tokens = []
+    for ascii_word, cjk in _TOKEN.findall(text.lower()):
+        if ascii_word:
+            tokens.append(ascii_word.rstrip("."))
+        else:
+            tokens.extend(t for t in _segment_cjk(cjk, tokenizer) if t not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, vocab: List[str], offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_len: np.ndarray, meta: dict):
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.tokenizer = meta["tokenizer"]
+        self.n_docs = meta["n_docs"]
+        self.avgdl = meta["avgdl"] or 1.0
+        self.k1 = meta.get("k1", K1)
+        self.b = meta.get("b", B)
+        self.meta = meta
+
+    # --- 构建 ---
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, str]], tokenizer: str = DEFAULT_TOKENIZER) -> "BM25Index":
+        """rows: (向量位置, 文本)"""
+        start = time.time()
+        postings = {}
+        lengths = {}
+        for pos, text in rows:
+            tokens = tokenize(text, tokenizer)
+            lengths[pos] = len(tokens)
+            counts = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, c in counts.items():
+                postings.setdefault(t, []).append((pos, c))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype="int64")
+        doc_ids, tfs = [], []
+        for i, term in enumerate(vocab):
+            plist = sorted(postings[term])
+            doc_ids.extend(p for p, _ in plist)
+            tfs.extend(min(c, 65535) for _, c in plist)
+            offsets[i + 1] = len(doc_ids)
+
+        n_docs = (max(lengths) + 1) if lengths else 0
+        doc_len = np.zeros(n_docs, dtype="int32")
+        for pos, n in lengths.items():
+            doc_len[pos] = n
+        meta = {"tokenizer": tokenizer, "n_docs": len(lengths), "avgdl": float(doc_len.sum()) / max(len(lengths), 1),
+                "vocab_size": len(vocab), "k1": K1, "b": B}
+        logger.info(f"🔤 [BM25] Indexed {len(lengths)} chunks, {len(vocab)} terms ({tokenizer}) "
+                    f"in {time.time() - start:.1f}s")
+        return cls(vocab, offsets, np.asarray(doc_ids, dtype="int32"), np.asarray(tfs, dtype="uint16"), doc_len, meta)
+
+    def save(self, path: str):
+        """写到 <path>/bm25.tmp 后整体替换，读者不会看到半写入的索引"""
+        final = os.path.join(path, BM25_DIR)
+        tmp = final + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        vocab = sorted(self.term_ids, key=self.term_ids.get)
+        with open(os.path.join(tmp, "vocab.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(vocab))
+        np.save(os.path.join(tmp, "offsets.npy"), self.offsets)
+        np.save(os.path.join(tmp, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(tmp, "tfs.npy"), self.tfs)
+        np.save(os.path.join(tmp, "doc_len.npy"), self.doc_len)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        if os.path.isdir(final):
+            old = final + ".old"
+            os.replace(final, old)
+            os.replace(tmp, final)
+            for name in os.listdir(old):
+                os.remove(os.path.join(old, name))
+            os.rmdir(old)
+        else:
+            os.replace(tmp, final)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        root = os.path.join(path, BM25_DIR)
+        if not os.path.exists(os.path.join(root, "meta.json")):
+            return None
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["tokenizer"] == "jieba" and jieba is None:
+            logger.warning("⚠️ [BM25] Index was built with jieba but jieba is not installed; lexical search disabled")
+            return None
+        with open(os.path.join(root, "vocab.txt"), "r", encoding="utf-8") as f:
+            vocab = f.read().split("\n") if meta.get("vocab_size") else []
+        index = cls(
+            vocab,
+            np.load(os.path.join(root, "offsets.npy")),
+            np.load(os.path.join(root, "doc_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(root, "tfs.npy"), mmap_mode="r"),
+            np.load(os.path.join(root, "doc_len.npy"), mmap_mode="r"),
+            meta,
+        )
+        if index.tokenizer == "jieba":
+            jieba.initialize()  # 词典加载约 1s，放在加载阶段而不是第一个请求
+        logger.info(f"🔤 [BM25] Loaded {meta['n_docs']} chunks / {meta['vocab_size']} terms ({index.tokenizer})")
+        return index
+
+    # --- 检索 ---
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None,
+               exact_k: Optional[int] = None) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        返回 (按 BM25 分数排序的 [(位置, 分数)], 是否完全命中)
+        完全命中：查询的每个词都出现在前 exact_k (默认 k) 个结果中 (用于跳过向量检索的快速路径)
+        allowed: 元数据过滤得到的位置集合 (None 表示不过滤)
+        """
+        terms = list(dict.fromkeys(tokenize(query, self.tokenizer)))
+        term_ids = [self.term_ids[t] for t in terms if t in self.term_ids]
+        if not term_ids:
+            return [], False
+
+        scores = np.zeros(len(self.doc_len), dtype="float32")
+        matched = np.zeros(len(self.doc_len), dtype="int16")
+        for tid in term_ids:
+            lo, hi = self.offsets[tid], self.offsets[tid + 1]
+            docs = np.asarray(self.doc_ids[lo:hi])
+            tf = np.asarray(self.tfs[lo:hi], dtype="float32")
+            idf = math.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+            matched[docs] += 1
+
+        if allowed is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[allowed[allowed < len(scores)]] = True
+            scores[~mask] = 0
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return [], False
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        exact_k = exact_k or k
+        exact = (len(term_ids) == len(terms) and len(top) >= exact_k
+                 and bool((matched[top[:exact_k]] == len(terms)).all()))
+        return [(int(p), float(scores[p])) for p in top], exact
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[int]:
+    """RRF：score(d) = Σ 1 / (k + rank)，只看名次不看分数，BM25 与向量距离无需归一化"""
+    fused = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking):
+            fused[pos] = fused.get(pos, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
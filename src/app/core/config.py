@@ -28,6 +28,10 @@ class Settings(BaseSettings):
     # 允许跨域请求的域名列表，生产环境建议设置为具体的域名
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
 
+    # --- 运维接口 (/admin/*) 鉴权 ---
+    # 允许访问运维接口的用户名，例如 .env 中 ADMIN_USERNAMES=["alice"]；为空时所有人都无权访问
+    ADMIN_USERNAMES: List[str] = []
+
     # --- LLM 模型配置 (核心) ---
     # 必填项：如果没有在 .env 中设置，程序启动会报错
     OPENAI_API_KEY: str
@@ -42,6 +46,115 @@ class Settings(BaseSettings):
     # 温度系数: 0-1，越低越严谨，越高越发散
     TEMPERATURE: float = 0.7
 
+    # --- LLM 连接池 (所有 ChatOpenAI 客户端共享) ---
+    LLM_POOL_MAX_CONNECTIONS: int = 50  # 连接池总连接上限
+    LLM_POOL_MAX_KEEPALIVE: int = 20  # 最多保留的空闲 keep-alive 连接
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 60.0  # 空闲连接保活时长 (秒)
+    LLM_HTTP2: bool = True  # 安装了 h2 时启用 HTTP/2 多路复用
+    LLM_REQUEST_TIMEOUT: float = 120.0  # 单次请求超时 (秒)
+    LLM_STREAM_USAGE: bool = True  # 流式请求携带 stream_options 以返回 token 用量；部分 OpenAI 兼容服务不支持，需关闭
+
+    # --- LLM 准入控制 (全局并发 + 优先级 + AIMD 自适应) ---
+    LLM_INITIAL_CONCURRENCY: int = 8
+    LLM_MIN_CONCURRENCY: int = 2
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_LATENCY_TARGET: float = 20.0  # 秒；非流式为总耗时，流式为首 token 耗时，超出则收缩并发
+
+    # --- LLM 响应缓存 (仅用于确定性链：JD 解析 / 简历提取 / 画像提取) ---
+    LLM_CACHE_ENABLED: bool = False  # 默认关闭，需要在 .env 中显式开启
+    LLM_CACHE_PATH: str = os.path.join(project_root, ".cache", "llm_cache.sqlite")
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_MAX_MB: int = 64  # 缓存值总大小上限，超出后按 LRU 淘汰
+    LLM_CACHE_TTL: int = 7 * 24 * 3600  # 过期时间 (秒)
+
+    # --- JD 语义近重复缓存 (BGE 向量 + 独立 FAISS 索引) ---
+    JD_SEMANTIC_CACHE_ENABLED: bool = True
+    JD_SEMANTIC_CACHE_THRESHOLD: float = 0.97  # 余弦相似度 >= 阈值时复用已解析的 JDMetaData
+    JD_SEMANTIC_CACHE_MAX_ENTRIES: int = 2000
+    JD_SEMANTIC_CACHE_AUDIT_RATE: float = 0.05  # 命中后抽样重新解析，用于统计误命中率
+
+    # --- 面试报告缓存 (/generate-guide 整份报告) ---
+    REPORT_CACHE_ENABLED: bool = True
+    REPORT_CACHE_TTL: int = 600  # 秒；主要吸收前端重试和短时间内的重复提交
+    REPORT_CACHE_MAX_ENTRIES: int = 256
+
+    # --- Graph 拓扑 ---
+    # fast: HR 与背调并行，HR 不使用公司信息 (延迟最低)
+    # rich: HR 等待背调结果再出题，背调设置截止时间，超时则不带公司信息继续
+    GRAPH_TOPOLOGY: str = "fast"
+    RESEARCH_DEADLINE: float = 15.0  # 秒，仅 rich 模式生效
+
+    # --- 质检循环 ---
+    # targeted: 质检逐题打分，只重写不合格的题目，合格题目保持不变
+    # full: 旧行为，整组题目重写
+    REVIEW_MODE: str = "targeted"
+    REVIEW_PASS_SCORE: int = 85
+    TECH_QUESTION_COUNT: int = 3
+    # Best-of-N：tech_lead 并发生成 N 组候选题，质检一次批量打分选最优 (1 = 关闭)
+    TECH_CANDIDATES_N: int = 1
+    TECH_CANDIDATE_TEMPERATURES: List[float] = [0.4, 0.7, 1.0]  # 候选数多于列表长度时循环使用
+
+    # --- 博客知识库检索 ---
+    # 检索 (BGE 向量化 + FAISS) 在专用线程池中执行，并发查询合并成一次批量前向计算
+    KB_SEARCH_WORKERS: int = 1  # 串行执行前向计算，并行度交给 torch 内部线程
+    KB_TORCH_THREADS: int = 4  # torch 算子线程数，0 表示沿用 torch 默认值
+    KB_BATCH_MAX_SIZE: int = 16  # 攒满即刻触发
+    KB_BATCH_WINDOW_MS: float = 5.0  # 首条查询到达后最多等待的时间
+    # 索引格式：mmap (mmap 索引 + SQLite 文档库，不反序列化 pickle) / pickle (FAISS.load_local) / auto (优先 mmap)
+    KB_INDEX_FORMAT: str = "auto"
+    # 索引热切换：每隔 N 秒检查 blog_faiss_index/CURRENT，构建脚本发布新版本后自动加载并替换 (0 = 只能手动 POST /admin/kb/reload)
+    KB_INDEX_WATCH_INTERVAL: float = 10.0
+    # RAGEngine 首次建库时使用的索引规格 (FAISS index_factory 字符串，见 app/core/ann_index.py)
+    RAG_INDEX_SPEC: str = "Flat"
+    RAG_INDEX_SEARCH_PARAMS: str = ""
+
+    # --- Graph 中的知识库检索节点 (与 JD 解析并行预取，结果注入 tech_lead) ---
+    KB_RETRIEVAL_ENABLED: bool = True
+    KB_RETRIEVAL_TOP_K: int = 3  # 原始 JD 检索条数
+    KB_REFINE_KEYWORDS: int = 3  # 解析出技术栈后，取前 N 个关键词追加检索
+    KB_REFINE_TOP_K: int = 2  # 每个关键词检索条数
+    KB_CONTEXT_MAX_CHUNKS: int = 5  # 注入 Prompt 的片段上限
+
+    # --- 检索上下文组装 (见 app/core/context_packer.py) ---
+    KB_CONTEXT_TOKEN_BUDGET: int = 1200  # 每次注入 Prompt 的知识库上下文 token 上限 (tiktoken 计数)
+    KB_MIN_SIMILARITY: float = 0.3  # 向量余弦相似度低于此值的片段不进入上下文 (只由 BM25 召回的片段不受影响)
+
+    # --- 混合检索 (BM25 词法 + 向量，RRF 融合；mmap 索引目录下有 bm25/ 时生效) ---
+    # hybrid: 两路各取候选后按名次融合 / vector: 只走向量
+    KB_SEARCH_MODE: str = "hybrid"
+    KB_HYBRID_CANDIDATES: int = 20  # 每一路取的候选数
+    KB_RRF_K: int = 60
+    # 词法快速路径：短关键词查询的每个词都命中 BM25 前 k 个片段时直接返回，跳过模型前向计算
+    KB_LEXICAL_FAST_PATH: bool = True
+    KB_FAST_PATH_MAX_TERMS: int = 4
+
+    # --- 用户私有知识库 (上传的简历 / 笔记，见 app/core/user_kb.py)，出题时与博客库一起检索 ---
+    USER_KB_ENABLED: bool = True
+    USER_KB_TOP_K: int = 2  # 从用户私有库检索的条数 (原始 JD 检索)
+    USER_KB_DIR: str = ""  # 留空则使用 项目根目录/user_kb_index
+    USER_KB_MEMORY_BUDGET_MB: int = 256  # 常驻进程的用户索引总大小上限，超出按 LRU 淘汰
+    USER_KB_MAX_CHUNKS: int = 2000  # 单个用户私有库的片段上限
+
+    # --- Embedding 推理后端 (见 app/core/embedding_registry.py) ---
+    # torch / onnx / onnx-int8；无 GPU 的节点建议 onnx-int8 (先运行 app/blog/export_onnx.py 导出模型)
+    EMBEDDING_BACKEND: str = "torch"
+    # ONNX 模型目录，留空则使用 项目根目录/models/<模型名>-onnx
+    EMBEDDING_ONNX_DIR: str = ""
+    # onnxruntime 算子内线程数 (0 = onnxruntime 默认)
+    EMBEDDING_ONNX_THREADS: int = 4
+
+    # --- 检索缓存 (query -> 向量, (query, k, filters) -> 文档)，随索引版本自动失效 ---
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_EMBED_CACHE_SIZE: int = 4096
+    RETRIEVAL_RESULT_CACHE_SIZE: int = 1024
+
+    # --- 启动预热 ---
+    # 重型子系统 (BGE 模型、知识库索引、Graph) 都是懒加载；lifespan 中按此模式预热：
+    # background: 启动后在后台预热，/readyz 在预热完成前返回 503 (默认)
+    # blocking: 预热完成后才开始接收请求
+    # off: 不预热，第一个用到的请求触发加载
+    STARTUP_WARMUP: str = "background"
+
     # --- LangChain Tracing (可选 - 用于调试) ---
     # 如果你想在 LangSmith 后台看到链的执行过程，开启这些配置
     LANGCHAIN_TRACING_V2: str = "false"
@@ -0,0 +1,204 @@
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.utils.logger import logger
+
+# ==========================================
+# 检索上下文组装 (按 token 预算打包)
+# ==========================================
+# 检索结果不再原样拼接，而是：
+#   1. 丢弃向量相似度低于阈值的片段 (纯词法命中的片段没有相似度，保留)
+#   2. 同一来源的片段归为一组：切片时的重叠部分只保留一份，完全重复的片段直接去掉
+#   3. 按检索名次把片段装进 token 预算 (tiktoken 计数)，装不下的最后一段按句子截断
+# 同一来源只输出一次 "引用自" 标题，顺序沿用检索名次。
+
+ENCODING = "cl100k_base"
+MIN_OVERLAP_CHARS = 10  # 短于此的首尾重合视为巧合，不合并
+MAX_OVERLAP_CHARS = 200  # 切片重叠为 CHUNK_OVERLAP (50 字)，留出余量
+MIN_TRUNCATE_TOKENS = 80  # 剩余预算少于此值时不再截断塞入半段内容
+RETRY_INTERVAL = 60.0  # 编码加载失败后，至少间隔这么久再重试 (秒)
+_SENTENCE_END = re.compile(r"[。！？!?；;\n]")
+
+_enc = None
+_enc_lock = threading.Lock()
+_enc_loading = False
+_enc_failed_at = float("-inf")
+
+
+def load_encoding() -> bool:
+    """
+    加载 tiktoken 编码 (首次要下载 BPE 文件，同步阻塞)：由启动预热在线程中调用，CLI 脚本可直接调用
+    失败不缓存，之后还会重试；加载成功前 token 数按估算值计算
+    """
+    global _enc, _enc_failed_at
+    if _enc is not None:
+        return True
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding(ENCODING)
+    except Exception as e:
+        # 离线环境加载 BPE 文件会失败，退回估算：中文约 1 字 1 token，其余约 4 字符 1 token
+        _enc_failed_at = time.monotonic()
+        logger.warning(f"⚠️ [Context] tiktoken unavailable ({e}), using estimated token counts for now")
+        return False
+    _enc = enc
+    logger.info(f"🔡 [Context] tiktoken encoding {ENCODING} loaded")
+    return True
+
+
+def _load_in_background():
+    global _enc_loading
+    try:
+        load_encoding()
+    finally:
+        _enc_loading = False
+
+
+def _encoding():
+    """检索路径上从不阻塞：编码未加载时返回 None (估算)，并在后台线程里 (重新) 加载"""
+    global _enc_loading
+    if _enc is not None:
+        return _enc
+    if time.monotonic() - _enc_failed_at >= RETRY_INTERVAL:
+        with _enc_lock:
+            if _enc_loading:
+                return None
+            _enc_loading = True
+        threading.Thread(target=_load_in_background, name="tiktoken-load", daemon=True).start()
+    return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """截断到 max_tokens 以内，尽量停在句子结尾"""
+    enc = _encoding()
+    if enc is not None:
+        cut = enc.decode(enc.encode(text)[:max_tokens])
+    else:
+        cut = text
+        while cut and count_tokens(cut) > max_tokens:
+            cut = cut[:int(len(cut) * 0.9)]
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= len(cut) * 0.6:
+        cut = cut[:ends[-1]]
+    return cut.rstrip() + " ……"
+
+
+def _overlap(head: str, tail: str) -> int:
+    """head 的结尾与 tail 的开头重合的字符数 (相邻切片的 chunk_overlap)"""
+    for n in range(min(len(head), len(tail), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:n]):
+            return n
+    return 0
+
+
+def _add_segment(segments: List[dict], text: str, rank: int):
+    """把片段并入同源的已有段落：包含关系去重、首尾重叠拼接，拼接后的段落继续尝试与其余段落合并"""
+    for seg in segments:
+        merged = None
+        if text in seg["text"]:
+            merged = seg["text"]
+        elif seg["text"] in text:
+            merged = text
+        elif _overlap(seg["text"], text):
+            merged = seg["text"] + text[_overlap(seg["text"], text):]
+        elif _overlap(text, seg["text"]):
+            merged = text + seg["text"][_overlap(text, seg["text"]):]
+        if merged is not None:
+            segments.remove(seg)
+            _add_segment(segments, merged, min(rank, seg["rank"]))
+            return
+    segments.append({"text": text, "rank": rank})
+
+
+class _PackingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.raw_tokens = 0
+        self.packed_tokens = 0
+        self.dropped_low_similarity = 0
+        self.truncated = 0
+
+    def record(self, raw: int, packed: int, dropped: int, truncated: bool):
+        with self._lock:
+            self.calls += 1
+            self.raw_tokens += raw
+            self.packed_tokens += packed
+            self.dropped_low_similarity += dropped
+            self.truncated += truncated
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_raw_tokens": round(self.raw_tokens / self.calls, 1) if self.calls else 0,
+                "avg_packed_tokens": round(self.packed_tokens / self.calls, 1) if self.calls else 0,
+                "dropped_low_similarity": self.dropped_low_similarity,
+                "truncated": self.truncated,
+            }
+
+
+packing_stats = _PackingStats()
+
+
+def with_similarity(doc, similarity: float):
+    """复制一份片段并记下向量相似度 (不修改 docstore / 缓存里的原对象)"""
+    return type(doc)(page_content=doc.page_content, metadata={**doc.metadata, "similarity": round(similarity, 4)})
+
+
+def _header(source: str) -> str:
+    return f"---[引用自: {source}]---\n"
+
+
+def pack_context(docs, max_tokens: Optional[int] = None, min_similarity: Optional[float] = None) -> dict:
+    """
+    把检索到的片段 (按名次排列) 组装成 Prompt 上下文
+    返回: {"context": 拼接好的内容, "sources": [来源文件...], "tokens": 上下文 token 数}
+    相似度取自 metadata["similarity"] (知识库检索时写入的向量余弦相似度)
+    """
+    max_tokens = settings.KB_CONTEXT_TOKEN_BUDGET if max_tokens is None else max_tokens
+    min_similarity = settings.KB_MIN_SIMILARITY if min_similarity is None else min_similarity
+
+    groups: Dict[str, List[dict]] = {}
+    dropped = 0
+    for rank, doc in enumerate(docs):
+        similarity = doc.metadata.get("similarity")
+        if similarity is not None and similarity < min_similarity:
+            dropped += 1
+            continue
+        _add_segment(groups.setdefault(doc.metadata.get("source", "未知来源"), []), doc.page_content, rank)
+
+    # 按名次依次装入预算；装不下的段落跳过 (后面更短的段落可能还装得下)，预算充足时截断后装入
+    packed: Dict[str, List[dict]] = {}
+    used, truncated = 0, False
+    candidates = sorted(((seg["rank"], source, seg["text"]) for source, segs in groups.items() for seg in segs))
+    for rank, source, text in candidates:
+        cost = count_tokens(text) + (0 if source in packed else count_tokens(_header(source)))
+        if used + cost > max_tokens:
+            room = max_tokens - used - (cost - count_tokens(text))
+            if room < MIN_TRUNCATE_TOKENS:
+                continue
+            text = _truncate(text, room - 2)  # 留出省略号的 token
+            cost = max_tokens - used - room + count_tokens(text)
+            truncated = True
+        packed.setdefault(source, []).append({"rank": rank, "text": text})
+        used += cost
+
+    parts = [_header(source) + "\n\n".join(seg["text"] for seg in sorted(segs, key=lambda s: s["rank"]))
+             for source, segs in packed.items()]
+    context = "\n\n".join(parts)
+    raw = sum(count_tokens(_header(doc.metadata.get("source", "未知来源")) + doc.page_content) for doc in docs)
+    tokens = count_tokens(context) if context else 0
+    packing_stats.record(raw, tokens, dropped, truncated)
+    return {"context": context, "sources": list(packed), "tokens": tokens}
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+
+# ==========================================
+# 进程级 Embedding 模型注册表
+# ==========================================
+# 知识库、RAG 引擎、博客 CLI、Flask 服务共用同一份 BGE 模型：
+# - get_embeddings() 立即返回一个轻量句柄，真正的模型在第一次向量化 (或 warmup) 时才加载
+# - 同一模型名 + 推理后端在进程内只加载一次
+# 推理后端 (settings.EMBEDDING_BACKEND)：
+#   torch      HuggingFaceEmbeddings (sentence-transformers)，自动选择 MPS / CUDA / CPU
+#   onnx       onnxruntime 全精度 (CPU)
+#   onnx-int8  onnxruntime 动态 int8 量化 (CPU)
+# ONNX 模型不存在或 onnxruntime 未安装时回退到 torch 并打印警告
+
+DEFAULT_MODEL = "BAAI/bge-small-zh-v1.5"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def detect_device() -> str:
+    """自动检测最佳硬件设备 (MPS > CUDA > CPU)"""
+    import torch
+
+    if torch.backends.mps.is_available():
+        # 适配 macOS M系列芯片 (M1/M2/M3/M4)
+        logger.info("🚀 [Embedding] Using Apple Metal (MPS) acceleration!")
+        return "mps"
+    if torch.cuda.is_available():
+        # 适配 NVIDIA 显卡
+        logger.info("🚀 [Embedding] Using CUDA acceleration!")
+        return "cuda"
+    # 兜底 CPU
+    logger.info("🐢 [Embedding] No GPU detected. Using CPU.")
+    return "cpu"
+
+
+class LazyEmbeddings(Embeddings):
+    """按需加载的 Embedding 句柄：接口与 LangChain Embeddings 一致，首次调用时才加载模型"""
+
+    def __init__(self, model_name: str, device: Optional[str] = None, backend: str = "torch"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self.load_seconds: Optional[float] = None
+        self._model: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> Embeddings:
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                start = time.time()
+                if self.backend != "torch":
+                    self._model = self._load_onnx()
+                if self._model is None:
+                    self._model = self._load_torch()
+                self.load_seconds = time.time() - start
+                logger.success(f"✅ [Embedding] {self.model_name} loaded ({self.backend}) on {self.device} "
+                               f"in {self.load_seconds:.1f}s")
+        return self._model
+
+    def _load_torch(self) -> Embeddings:
+        # 设置 HF 镜像，防止国内网络下载模型超时
+        os.environ.setdefault('HF_ENDPOINT', 'https://hf-mirror.com')
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        device = self.device or detect_device()
+        model = HuggingFaceEmbeddings(
+            model_name=self.model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+        self.device = device
+        self.backend = "torch"
+        return model
+
+    def _load_onnx(self) -> Optional[Embeddings]:
+        from app.core.config import settings
+
+        try:
+            from app.core.onnx_embeddings import OnnxEmbeddings, default_onnx_dir
+
+            model = OnnxEmbeddings(
+                settings.EMBEDDING_ONNX_DIR or default_onnx_dir(self.model_name),
+                quantized=self.backend == "onnx-int8",
+                threads=settings.EMBEDDING_ONNX_THREADS,
+            )
+        except (ImportError, FileNotFoundError) as e:
+            logger.warning(f"⚠️ [Embedding] {self.backend} backend unavailable ({e}); falling back to torch")
+            return None
+        self.device = "cpu"
+        return model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+
+_registry: Dict[Tuple[str, str], LazyEmbeddings] = {}
+_registry_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str = DEFAULT_MODEL, device: Optional[str] = None,
+                   backend: Optional[str] = None) -> LazyEmbeddings:
+    """获取共享的 Embedding 句柄 (不会触发模型加载)；backend 默认取 settings.EMBEDDING_BACKEND"""
+    if backend is None:
+        from app.core.config import settings
+        backend = settings.EMBEDDING_BACKEND
+    with _registry_lock:
+        handle = _registry.get((model_name, backend))
+        if handle is None:
+            handle = LazyEmbeddings(model_name, device, backend)
+            _registry[(model_name, backend)] = handle
+        return handle
+
+
+def warmup_embeddings(model_name: str = DEFAULT_MODEL) -> LazyEmbeddings:
+    """显式预热：加载模型并跑一次前向计算 (首个真实请求不再承担加载与初始化开销)"""
+    handle = get_embeddings(model_name)
+    handle.embed_query("warmup")
+    return handle
+
+
+def get_embedding_stats() -> dict:
+    return {
+        f"{name} [{backend}]": {"loaded": h.loaded, "backend": h.backend, "device": h.device,
+                                "load_seconds": round(h.load_seconds, 2) if h.load_seconds is not None else None}
+        for (name, backend), h in _registry.items()
+    }
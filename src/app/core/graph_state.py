@@ -17,6 +17,12 @@ class AgentState(TypedDict):
     tech_stack: List[str]
     years_required: str
 
+    # --- 检索节点预取 (与 Parser 并行) ---
+    kb_context: str  # 博客知识库片段，注入 tech_lead 的 Prompt
+    reference_sources: List[str]  # 知识库片段的来源文章
+    chat_history: List[str]  # 最近一次会话的对话记录
+    user_profile: str  # 长期记忆中的用户画像
+
     # --- 各 Agent 产出 ---
     company_info: Optional[str]
     # 使用 Annotated 标记，当多个节点写入时自动合并列表 (可选，或手动管理)
@@ -26,5 +32,9 @@ class AgentState(TypedDict):
     # --- 质量控制循环 ---
     quality_score: int
     review_comment: str  # AI 质检员的具体修改建议
+    question_reviews: List[dict]  # 逐题评审结果: {"index", "score", "comment", "question"}
+    accepted_questions: List[dict]  # 已通过质检的题目，后续重写时保持不变 (targeted 模式)
+    accepted_reviews: List[dict]  # 与 accepted_questions 按位置一一对应的评审结果
+    tech_candidates: List[List[dict]]  # Best-of-N 模式下的多组候选题，由质检员批量打分选出最优
     human_feedback: Optional[str]  # 人工介入时的指令
     iteration_count: int  # 循环计数器
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import re
+import shutil
+import threading
+import time
+from typing import List, Tuple
+
+from app.core.retrieval_cache import index_version
+from app.utils.logger import logger
+
+# ==========================================
+# 版本化索引目录 + 原子切换的 CURRENT 指针
+# ==========================================
+# 构建脚本每次把新索引写进一个新的版本目录，写完后再原子地改写 CURRENT：
+#   blog_faiss_index/
+#     CURRENT                 当前版本名 (先写 CURRENT.tmp 再 os.replace)
+#     versions/v00000012-20260101-120000/   index.faiss / docstore.sqlite / bm25/ / manifest.json ...
+# 线上进程只看 CURRENT 指向的目录：已经发布的版本目录不再被修改，切换前后的读者各自看到完整的索引。
+# 没有 CURRENT 的旧布局 (索引文件直接放在根目录) 仍然可以加载，版本号取目录内文件的签名。
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3  # 发布新版本后保留的历史版本数 (含当前版本)
+_SEQ = re.compile(r"^v(\d+)-")
+
+
+def resolve_index_dir(root: str) -> Tuple[str, str]:
+    """返回 (当前版本的索引目录, 版本号)"""
+    pointer = os.path.join(root, CURRENT_FILE)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        return os.path.join(root, VERSIONS_DIR, name), name
+    return root, index_version(root)
+
+
+def new_version_dir(root: str) -> Tuple[str, str]:
+    """
+    为下一次构建分配一个空的版本目录，返回 (目录, 版本名)
+    版本名以递增序号开头 (v00000012-20260101-120000)，按名字排序即发布顺序，同一秒内多次发布也不会乱序
+    """
+    seq = max((int(m.group(1)) for m in map(_SEQ.match, list_versions(root)) if m), default=0) + 1
+    while True:
+        name = f"v{seq:08d}-{time.strftime('%Y%m%d-%H%M%S')}"
+        path = os.path.join(root, VERSIONS_DIR, name)
+        try:
+            os.makedirs(path)
+            return path, name
+        except FileExistsError:
+            seq += 1
+
+
+def publish_version(root: str, name: str, keep: int = KEEP_VERSIONS):
+    """原子切换 CURRENT 到新版本，并清理多余的旧版本"""
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    logger.info(f"📌 [Index] CURRENT -> {name}")
+    prune_versions(root, keep)
+
+
+def list_versions(root: str) -> List[str]:
+    """按发布顺序排列 (旧格式以日期开头的版本名排在 v 序号之前，最先被清理)"""
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, name)))
+
+
+def prune_versions(root: str, keep: int = KEEP_VERSIONS):
+    """
+    删除最旧的版本目录，只保留最近 keep 个 (当前版本永远保留)
+    仍在被旧进程读取的文件可以安全删除：已 mmap / 已打开的文件在关闭前不会真正释放
+    """
+    _, current = resolve_index_dir(root)
+    for name in list_versions(root)[:-keep or None]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, VERSIONS_DIR, name), ignore_errors=True)
+            logger.info(f"🧹 [Index] Pruned old version {name}")
+
+
+class IndexGeneration:
+    """
+    一个已加载的索引版本 + 读者引用计数
+    检索开始时 acquire、结束时 release；被新版本替换 (retire) 后，最后一个读者 release 时才关闭释放
+    """
+
+    def __init__(self, version: str, path: str, store):
+        self.version = version
+        self.path = path
+        self.store = store
+        self.loaded_at = time.time()
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> "IndexGeneration":
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            drained = self._retired and self._refs == 0
+        if drained:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            drained = self._refs == 0
+        if drained:
+            self._close()
+        else:
+            logger.info(f"⏳ [Index] Version {self.version} retired, waiting for {self._refs} in-flight searches")
+
+    @property
+    def readers(self) -> int:
+        return self._refs
+
+    def _close(self):
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
+        self.store = None
+        logger.info(f"🗑️ [Index] Released version {self.version}")
+
+    def info(self) -> dict:
+        return {"version": self.version, "path": self.path, "loaded_at": self.loaded_at, "readers": self._refs}
+
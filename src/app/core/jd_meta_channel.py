@@ -0,0 +1,40 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Optional
+
+from app.schemas.interview import JDMetaData
+
+# ==========================================
+# 同一 superstep 内 Parser -> Retriever 的解析结果通道
+# ==========================================
+# LangGraph 按 superstep 推进，同一步的节点互相看不到对方写入的状态。
+# Retriever 与 Parser 并行启动 (先用原始 JD 检索)，Parser 解析出技术栈后通过这里通知 Retriever
+# 追加关键词检索，两者几乎同时结束，tech_lead 启动时知识库上下文已经就绪。
+# 与 stream_manager 一样用 ContextVar 按运行隔离：Graph 里的节点任务继承运行开始时的上下文。
+
+_jd_meta: ContextVar[Optional[asyncio.Future]] = ContextVar("jd_meta", default=None)
+
+
+def bind_jd_meta_channel() -> asyncio.Future:
+    """在启动 Graph 运行前调用 (每次运行一个通道)"""
+    future = asyncio.get_running_loop().create_future()
+    _jd_meta.set(future)
+    return future
+
+
+def publish_jd_meta(meta: JDMetaData):
+    """Parser 解析完成后调用；未绑定通道 (例如人工介入后的恢复执行) 时什么都不做"""
+    future = _jd_meta.get()
+    if future is not None and not future.done():
+        future.set_result(meta)
+
+
+async def wait_jd_meta(timeout: float) -> Optional[JDMetaData]:
+    """等待本次运行的 JD 解析结果；通道未绑定或超时返回 None"""
+    future = _jd_meta.get()
+    if future is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
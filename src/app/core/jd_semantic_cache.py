@@ -0,0 +1,150 @@
+import asyncio
+import random
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from app.core.config import settings
+from app.core.llm_scheduler import Priority, set_llm_priority
+from app.schemas.interview import JDMetaData
+from app.utils.logger import logger
+
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+
+
+class SemanticJDCache:
+    """
+    JD 语义近重复缓存
+    重新发布的 JD、空白差异、改了一条要求的 JD，精确哈希缓存命中不了。
+    这里用 BGE 向量 + 独立的小型 FAISS 内积索引 (向量已归一化，内积即余弦相似度)
+    查找之前解析过的 JD，相似度超过阈值就直接复用其 JDMetaData。
+    """
+
+    def __init__(self, threshold: float, max_entries: int, audit_rate: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self._index: Optional["faiss.Index"] = None
+        self._entries: "OrderedDict[int, JDMetaData]" = OrderedDict()
+        self._next_id = 0
+        self._audit_tasks = set()
+        # 统计
+        self.lookups = 0
+        self.hits = 0
+        self.audits = 0
+        self.false_hits = 0
+
+    @staticmethod
+    async def _kb():
+        # 复用知识库已加载的 BGE 模型 (以及它的检索线程池和微批处理)，避免再加载一份
+        # 首次加载模型 / 索引要数秒 (或等待后台预热持有的加载锁)，放到线程里，不阻塞事件循环上的其他流
+        from app.core.knowledge_base import get_kb_engine
+        kb_engine = await asyncio.to_thread(get_kb_engine)
+        return kb_engine if getattr(kb_engine, "batcher", None) is not None else None
+
+    async def embed(self, jd_text: str) -> Optional["np.ndarray"]:
+        kb = await self._kb()
+        if kb is None:
+            return None
+        vector = await kb.aembed_query(jd_text)
+        # faiss / numpy 只在真正用到语义缓存时才导入，不计入服务启动时间
+        import faiss
+        import numpy as np
+
+        vec = np.asarray([vector], dtype="float32")
+        faiss.normalize_L2(vec)
+        return vec
+
+    async def lookup(self, jd_text: str) -> Tuple[Optional[JDMetaData], float, Optional["np.ndarray"]]:
+        """返回 (命中的 meta 或 None, 最高相似度, 查询向量)"""
+        vec = await self.embed(jd_text)
+        if vec is None:
+            return None, 0.0, None
+
+        with self._lock:
+            self.lookups += 1
+            if self._index is None or self._index.ntotal == 0:
+                return None, 0.0, vec
+            scores, ids = self._index.search(vec, 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            meta = self._entries.get(entry_id)
+            if meta is None or score < self.threshold:
+                return None, score, vec
+            self.hits += 1
+            self._entries.move_to_end(entry_id)
+            return meta, score, vec
+
+    def add(self, vec: Optional["np.ndarray"], meta: JDMetaData):
+        if vec is None:
+            return
+        import faiss
+        import numpy as np
+
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.asarray([entry_id], dtype="int64"))
+            self._entries[entry_id] = meta
+
+            # 超出容量时淘汰最久未命中的条目
+            if len(self._entries) > self.max_entries:
+                old_id, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.asarray([old_id], dtype="int64"))
+
+    def schedule_audit(self, jd_text: str, cached: JDMetaData, parse_fn):
+        """按采样率对命中结果重新解析一次，比对后统计误命中 (不阻塞主流程)"""
+        if random.random() >= self.audit_rate:
+            return
+
+        async def _audit():
+            set_llm_priority(Priority.BACKGROUND)
+            try:
+                fresh = await parse_fn(jd_text)
+            except Exception as e:
+                logger.warning(f"⚠️ [JD Cache] Audit parse failed: {e}")
+                return
+            false_hit = not self._same_meta(cached, fresh)
+            with self._lock:
+                self.audits += 1
+                self.false_hits += int(false_hit)
+            if false_hit:
+                logger.warning(f"⚠️ [JD Cache] False hit detected: {cached.tech_stack} vs {fresh.tech_stack}")
+
+        task = asyncio.create_task(_audit())
+        self._audit_tasks.add(task)
+        task.add_done_callback(self._audit_tasks.discard)
+
+    @staticmethod
+    def _same_meta(a: JDMetaData, b: JDMetaData) -> bool:
+        """技术栈 Jaccard >= 0.5 且公司名一致，视为同一岗位"""
+        sa = {t.strip().lower() for t in a.tech_stack}
+        sb = {t.strip().lower() for t in b.tech_stack}
+        jaccard = len(sa & sb) / len(sa | sb) if (sa | sb) else 1.0
+        return jaccard >= 0.5 and (a.company_name or "") == (b.company_name or "")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": settings.JD_SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "audits": self.audits,
+                "false_hits": self.false_hits,
+                "false_hit_rate": round(self.false_hits / self.audits, 4) if self.audits else 0.0,
+            }
+
+
+# 单例
+jd_semantic_cache = SemanticJDCache(
+    threshold=settings.JD_SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.JD_SEMANTIC_CACHE_MAX_ENTRIES,
+    audit_rate=settings.JD_SEMANTIC_CACHE_AUDIT_RATE,
+)
@@ -1,8 +1,17 @@
+import asyncio
+import functools
 import os
-import torch
-from typing import List, Dict, Any, Union, Coroutine
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union, Coroutine
+from app.core.config import settings
+from app.core.context_packer import pack_context, packing_stats, with_similarity
+from app.core.embedding_registry import get_embeddings, get_embedding_stats
+from app.core.query_batcher import EmbeddingMicroBatcher, LatencyRecorder
+from app.core.index_versions import IndexGeneration, resolve_index_dir
+from app.core.retrieval_cache import get_retrieval_cache
 from app.utils.logger import logger
 
 # 1. 确定向量库路径
@@ -12,97 +21,290 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(CURRENT_DIR)))
 DB_PATH = os.path.join(PROJECT_ROOT, "blog_faiss_index")
 
 
+def format_context(docs) -> dict[str, Union[str, list[Any]]]:
+    """把检索到的片段组装成 Prompt 上下文 (相似度过滤、同源合并去重叠、按 token 预算打包)，并汇总来源文件"""
+    return pack_context(docs)
+
+
 class BlogKnowledgeBase:
     _instance = None
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         """单例模式：确保全局只有一个知识库实例，避免重复加载模型占用内存"""
         if cls._instance is None:
-            cls._instance = super(BlogKnowledgeBase, cls).__new__(cls)
-            cls._instance._initialize()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(BlogKnowledgeBase, cls).__new__(cls)
+                    instance._initialize()
+                    cls._instance = instance
         return cls._instance
 
     def _initialize(self):
         """初始化加载模型和向量库"""
         logger.info("📚 [KB] Initializing Blog Knowledge Base...")
+        # 检索专用线程池：向量化与 FAISS 搜索都在这里执行，不阻塞事件循环
+        self.executor = ThreadPoolExecutor(max_workers=settings.KB_SEARCH_WORKERS, thread_name_prefix="kb-search")
+        self.batcher = None
+        self.latency = LatencyRecorder()
+        self.cache = get_retrieval_cache("blog_kb")
+        self.search_modes = {"vector": 0, "hybrid": 0, "lexical": 0}
+        # 当前索引版本；热切换时整体替换引用，旧版本等进行中的检索结束后释放
+        self._generation: Optional[IndexGeneration] = None
+        self._generation_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._retired: List[IndexGeneration] = []
+        self.reloads = 0
+        self.failed_version: Optional[str] = None  # 加载失败的版本，轮询时不再反复重试 (手动 reload 可强制重试)
         try:
-            # 2. 自动检测最佳硬件设备 (MPS > CUDA > CPU)
-            if torch.backends.mps.is_available():
-                # 适配 macOS M系列芯片 (M1/M2/M3/M4)
-                device = "mps"
-                logger.info("🚀 [KB] Using Apple Metal (MPS) acceleration!")
-            elif torch.cuda.is_available():
-                # 适配 NVIDIA 显卡
-                device = "cuda"
-                logger.info("🚀 [KB] Using CUDA acceleration!")
-            else:
-                # 兜底 CPU
-                device = "cpu"
-                logger.info("🐢 [KB] No GPU detected. Using CPU.")
-
-            # 3. 初始化 Embedding 模型
-            # 设置 HF 镜像，防止国内网络下载模型超时
-            os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
-
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="BAAI/bge-small-zh-v1.5",
-                # 关键修改：将 device 设置为检测到的硬件，而不是写死 'cpu'
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
+            # torch / faiss 在这里才导入，只服务 /history 之类接口的 worker 不再为它们付出启动时间
+            from app.core.mmap_store import load_vector_store
+
+            if settings.EMBEDDING_BACKEND == "torch" and settings.KB_TORCH_THREADS > 0:
+                import torch
+                # 显式限制 torch 线程数，避免与 uvicorn / 线程池抢占 CPU (ONNX 后端由 EMBEDDING_ONNX_THREADS 控制)
+                torch.set_num_threads(settings.KB_TORCH_THREADS)
+
+            # 2. 共享的 Embedding 模型 (进程内只加载一份，首次向量化时才真正加载)
+            self.embeddings = get_embeddings()
+            self.batcher = EmbeddingMicroBatcher(
+                self.embeddings.embed_documents,
+                self.executor,
+                max_batch=settings.KB_BATCH_MAX_SIZE,
+                window_ms=settings.KB_BATCH_WINDOW_MS,
             )
 
-            # 4. 加载 FAISS 向量库
-            if os.path.exists(DB_PATH):
-                self.vector_store = FAISS.load_local(
-                    DB_PATH,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                logger.success(f"✅ [KB] Vector Store loaded successfully from: {DB_PATH}")
+            # 4. 加载 FAISS 向量库 (默认优先使用 mmap 格式，只按需读取命中的片段)
+            #    DB_PATH 下有 CURRENT 指针时加载它指向的版本目录
+            path, version = resolve_index_dir(DB_PATH)
+            store = load_vector_store(path, self.embeddings, settings.KB_INDEX_FORMAT)
+            if store is not None:
+                self._swap(IndexGeneration(version, path, store))
+                logger.success(f"✅ [KB] Vector Store loaded successfully from: {path} (version {version})")
             else:
                 logger.warning(f"⚠️ [KB] Index not found at {DB_PATH}. RAG functionality disabled.")
-                self.vector_store = None
 
         except Exception as e:
+            # 不留下缺少 embeddings / batcher 的半初始化单例：异常抛给调用方 (预热据此把 kb 记为未就绪)，下次调用重新初始化
             logger.error(f"❌ [KB] Init failed: {e}")
-            self.vector_store = None
+            self.executor.shutdown(wait=False)
+            raise
+
+    @property
+    def vector_store(self):
+        generation = self._generation
+        return generation.store if generation is not None else None
+
+    @property
+    def index_version(self) -> Optional[str]:
+        generation = self._generation
+        return generation.version if generation is not None else None
+
+    def _acquire(self) -> Optional[IndexGeneration]:
+        with self._generation_lock:
+            return self._generation.acquire() if self._generation is not None else None
+
+    def _swap(self, generation: IndexGeneration):
+        with self._generation_lock:
+            old, self._generation = self._generation, generation
+        self.cache.bind_version(generation.version)
+        if old is not None:
+            self._retired = [g for g in self._retired if g.store is not None] + [old]
+            old.retire()
 
-    async def search(self, query: str, top_k: int = 3) -> dict[str, Union[str, list[Any]]]:
+    def reload(self, force: bool = False) -> dict:
         """
-        检索相关文档
-        返回格式: {"context": "拼接好的文档内容...", "sources": ["文章A.md", "文章B.md"]}
+        检查 CURRENT 指针，有新版本时在调用线程中加载，加载完成后原子替换当前版本
+        加载期间检索照常使用旧版本；旧版本在进行中的检索全部结束后关闭
+        (同步阻塞，事件循环中请用 asyncio.to_thread 调用)
         """
-        if not self.vector_store:
-            return {"context": "", "sources": []}
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "in_progress", "version": self.index_version}
+        try:
+            from app.core.mmap_store import load_vector_store
+
+            previous = self.index_version
+            path, version = resolve_index_dir(DB_PATH)
+            if version == previous and not force:
+                return {"status": "unchanged", "version": version}
+            start = time.time()
+            try:
+                store = load_vector_store(path, self.embeddings, settings.KB_INDEX_FORMAT)
+            except Exception as e:
+                self.failed_version = version
+                logger.error(f"❌ [KB] Failed to load index version {version}: {e}")
+                return {"status": "failed", "version": previous, "error": str(e)}
+            if store is None:
+                logger.warning(f"⚠️ [KB] Reload skipped: no index at {path}")
+                return {"status": "missing", "version": previous}
+            self._swap(IndexGeneration(version, path, store))
+            self.reloads += 1
+            seconds = round(time.time() - start, 2)
+            logger.success(f"🔄 [KB] Index hot-swapped {previous} -> {version} in {seconds}s")
+            return {"status": "reloaded", "previous": previous, "version": version, "seconds": seconds}
+        finally:
+            self._reload_lock.release()
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """查询向量化 (先查向量缓存，未命中的并发查询自动合并成批)，供检索和 JD 语义缓存共用"""
+        vector = self.cache.get_embedding(query)
+        if vector is None:
+            vector = await self.batcher.embed(query)
+            self.cache.set_embedding(query, vector)
+        return vector
 
+    async def search_documents(self, query: str, top_k: int = 3, filters: Optional[dict] = None) -> list:
+        """
+        检索 top-k 片段 (Document 列表)，带结果缓存；失败或索引未加载时返回空列表
+        :param filters: (可选) 元数据过滤，如 {"source": "redis.md"} 或 {"Header 1": ["Redis", "Kafka"]}；
+                        mmap 格式通过预建的倒排表 + FAISS IDSelector 在索引内部过滤
+        """
+        return (await self._search(query, top_k, filters))[0]
+
+    async def _search(self, query: str, top_k: int, filters: Optional[dict]) -> Tuple[list, Optional[str]]:
+        """返回 (片段列表, 本次检索使用的索引版本)"""
+        generation = self._acquire()
+        if generation is None:
+            return [], None
+
+        start = time.monotonic()
         try:
-            # 异步执行搜索
-            # 注意：FAISS 索引搜索是在 CPU 上进行的，但在 Web 服务中非常快
-            # Embedding 的生成（将 query 转为向量）会使用上面配置的 device (MPS/GPU)
-            docs = self.vector_store.similarity_search(query, k=top_k)
-
-            if not docs:
-                return {"context": "", "sources": []}
-
-            # 拼接内容
-            context_parts = []
-            sources = set()
-
-            for doc in docs:
-                # 获取元数据中的来源文件名，默认为"未知来源"
-                source = doc.metadata.get("source", "未知来源")
-                sources.add(source)
-                # 格式化文档内容
-                context_parts.append(f"---[引用自: {source}]---\n{doc.page_content}")
-
-            return {
-                "context": "\n\n".join(context_parts),
-                "sources": list(sources)
-            }
+            # Embedding 的生成（将 query 转为向量）会使用上面配置的 device (MPS/GPU)，并与并发查询合批
+            # FAISS 搜索同样放到检索线程池，事件循环全程不被阻塞
+            # 整个检索过程固定使用开始时的索引版本，中途发生热切换也不受影响
+            docs = self.cache.get_results(query, top_k, filters)
+            if docs is None:
+                store = generation.store
+                if self._hybrid_enabled(store):
+                    docs = await self._hybrid_search(store, query, top_k, filters)
+                else:
+                    docs = await self._vector_search(store, query, top_k, filters)
+                if generation.version == self.cache.version:  # 切换后旧版本的结果不写入新版本的缓存
+                    self.cache.set_results(query, top_k, docs, filters)
+            return docs, generation.version
         except Exception as e:
             logger.error(f"❌ [KB] Search failed: {e}")
-            return {"context": "", "sources": []}
+            return [], generation.version
+        finally:
+            generation.release()
+            self.latency.record(start)
+
+    async def _vector_search(self, store, query: str, top_k: int, filters: Optional[dict]) -> list:
+        from app.core.ann_index import to_similarity
+
+        self.search_modes["vector"] += 1
+        vector = await self.aembed_query(query)
+        loop = asyncio.get_running_loop()
+        search = functools.partial(store.similarity_search_with_score_by_vector, vector, top_k)
+        if filters:
+            search = functools.partial(search, filter=filters)
+        hits = await loop.run_in_executor(self.executor, search)
+        return [with_similarity(doc, to_similarity(store.index, score)) for doc, score in hits]
+
+    def _hybrid_enabled(self, store) -> bool:
+        return settings.KB_SEARCH_MODE == "hybrid" and getattr(store, "bm25", None) is not None
+
+    async def _hybrid_search(self, store, query: str, top_k: int, filters: Optional[dict]) -> list:
+        """BM25 与向量检索各取候选，按 RRF 融合；关键词完全命中的短查询直接用 BM25 结果"""
+        from app.core.ann_index import to_similarity
+        from app.core.bm25_index import reciprocal_rank_fusion, tokenize
+
+        allowed = store.metadata_index.resolve(filters)
+        if allowed is not None and not len(allowed):
+            return []
+        loop = asyncio.get_running_loop()
+        n_candidates = max(settings.KB_HYBRID_CANDIDATES, top_k)
+        # BM25 只是几次 numpy 运算 (亚毫秒级)，直接在事件循环里执行，不排在线程池里的前向计算后面
+        lexical, exact = store.bm25.search(query, n_candidates, allowed, exact_k=top_k)
+        if (settings.KB_LEXICAL_FAST_PATH and exact
+                and len(tokenize(query, store.bm25.tokenizer)) <= settings.KB_FAST_PATH_MAX_TERMS):
+            self.search_modes["lexical"] += 1
+            hits = await loop.run_in_executor(self.executor, store.fetch_documents, [p for p, _ in lexical[:top_k]])
+            return [doc for _, doc in hits]
+
+        self.search_modes["hybrid"] += 1
+        vector = await self.aembed_query(query)
+        dense = await loop.run_in_executor(self.executor, store.search_positions, vector, n_candidates, allowed)
+        fused = reciprocal_rank_fusion([[p for p, _ in dense], [p for p, _ in lexical]], settings.KB_RRF_K)[:top_k]
+        hits = await loop.run_in_executor(self.executor, store.fetch_documents, fused)
+        # 向量一路召回的片段记下相似度；只由 BM25 召回的片段没有可比的相似度，组装上下文时不做阈值过滤
+        distances = dict(dense)
+        return [with_similarity(doc, to_similarity(store.index, distances[pos])) if pos in distances else doc
+                for pos, doc in hits]
+
+    async def search(self, query: str, top_k: int = 3,
+                     filters: Optional[dict] = None) -> dict[str, Union[str, list[Any]]]:
+        """
+        检索相关文档 (filters 同 search_documents)
+        返回格式: {"context": "拼接好的文档内容...", "sources": ["文章A.md", "文章B.md"], "tokens": 120,
+                  "index_version": "20260101-120000-3f2a"}
+        """
+        docs, version = await self._search(query, top_k, filters)
+        result = format_context(docs)
+        result["index_version"] = version
+        return result
+
+    def metadata_values(self, field: str) -> Dict[str, int]:
+        """某个元数据字段的全部取值及片段数 (可选的过滤项)"""
+        metadata_index = getattr(self.vector_store, "metadata_index", None)
+        return metadata_index.values(field) if metadata_index is not None else {}
+
+    def stats(self) -> dict:
+        torch = sys.modules.get("torch")
+        generation = self._generation
+        store = generation.store if generation is not None else None
+        return {
+            "loaded": store is not None,
+            "index": generation.info() if generation is not None else None,
+            "reloads": self.reloads,
+            # 已被替换、仍在等待进行中的检索结束的旧版本
+            "draining": [g.info() for g in self._retired if g.store is not None],
+            "embedding_models": get_embedding_stats(),
+            "index_format": type(store).__name__ if store is not None else None,
+            "torch_threads": torch.get_num_threads() if torch is not None else None,
+            "workers": settings.KB_SEARCH_WORKERS,
+            "batching": self.batcher.stats() if self.batcher else None,
+            "search_latency_ms": self.latency.stats(),
+            "cache": self.cache.stats(),
+            "search_mode": settings.KB_SEARCH_MODE if self._hybrid_enabled(store) else "vector",
+            "search_modes": dict(self.search_modes),
+            "lexical_index": (store.bm25.meta
+                              if getattr(store, "bm25", None) is not None else None),
+            "context_packing": packing_stats.stats(),
+            "metadata_fields": (store.metadata_index.stats()
+                                if getattr(store, "metadata_index", None) is not None else None),
+        }
+
+
+def get_kb_engine() -> BlogKnowledgeBase:
+    """获取知识库单例，首次调用时才加载模型与向量库 (启动预热或第一个检索请求触发)"""
+    return BlogKnowledgeBase()
+
+
+def is_kb_initialized() -> bool:
+    return BlogKnowledgeBase._instance is not None
+
+
+async def watch_index(interval: float):
+    """
+    轮询 CURRENT 指针 (每次只读一个小文件)，构建脚本发布新版本后自动热切换
+    多 worker 部署时每个 worker 各自发现并加载；知识库尚未初始化时不做任何事 (首次加载自然会读到最新版本)
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not is_kb_initialized():
+            continue
+        kb = get_kb_engine()
+        try:
+            version = resolve_index_dir(DB_PATH)[1]
+            if version not in (kb.index_version, kb.failed_version):
+                await asyncio.to_thread(kb.reload)
+        except Exception as e:
+            logger.error(f"❌ [KB] Index reload failed: {e}")
 
 
-# 导出单例实例
-kb_engine = BlogKnowledgeBase()
\ No newline at end of file
+def __getattr__(name):
+    # 兼容旧写法 `from app.core.knowledge_base import kb_engine`：访问时才初始化
+    if name == "kb_engine":
+        return get_kb_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+from loguru import logger
+
+from app.core.config import settings
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class LLMResponseCache:
+    """
+    内容寻址的 LLM 响应缓存 (SQLite 持久化)
+    key = sha256(模型 + Prompt 模板版本 + 渲染后的输入)
+    - 按 last_access 做 LRU 淘汰，同时限制条数与总字节数
+    - 超过 TTL 的条目视为未命中并删除
+    """
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int, ttl: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(namespace: str, version: str, inputs: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"model": settings.MODEL_NAME, "ns": namespace, "v": version, "inputs": inputs},
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        """超出条数或字节上限时，从最久未访问的条目开始删除"""
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+        victims = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        db.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        count = total = 0
+        if settings.LLM_CACHE_ENABLED:  # 关闭缓存时不为了统计去创建数据库文件
+            with self._lock:
+                count, total = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+                ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.LLM_CACHE_ENABLED,
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 单例
+llm_cache = LLMResponseCache(
+    path=settings.LLM_CACHE_PATH,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_MB * 1024 * 1024,
+    ttl=settings.LLM_CACHE_TTL,
+)
+
+
+async def cached_ainvoke(chain, inputs: Dict[str, Any], *, namespace: str, version: str,
+                         output_model: Type[T]) -> T:
+    """
+    带缓存的 chain.ainvoke：仅适用于输出为 Pydantic 对象的确定性链
+    缓存读写是 SQLite 同步 I/O，放到线程中执行，不阻塞事件循环
+    :param namespace: 链名称，如 "jd_parser"
+    :param version: Prompt 模板版本号 (各链模块里的 PROMPT_VERSION)，修改该链的 Prompt 时递增即可让旧缓存失效
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return await chain.ainvoke(inputs)
+
+    key = llm_cache.make_key(namespace, version, inputs)
+    try:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            logger.debug(f"💾 [LLM Cache] Hit: {namespace}/{version}")
+            return output_model.model_validate_json(cached)
+    except Exception as e:
+        logger.warning(f"⚠️ [LLM Cache] Read failed, falling back to LLM: {e}")
+
+    result = await chain.ainvoke(inputs)
+
+    try:
+        await asyncio.to_thread(llm_cache.set, key, result.model_dump_json())
+    except Exception as e:
+        logger.warning(f"⚠️ [LLM Cache] Write failed: {e}")
+    return result
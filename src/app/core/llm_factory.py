@@ -1,12 +1,298 @@
+import asyncio
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+import httpx
 from langchain_openai import ChatOpenAI
+from loguru import logger
+
 from app.core.config import settings
+from app.core.llm_scheduler import llm_scheduler
+from app.core.run_profiler import record_llm_call
+
+# 客户端注册表：(model, base_url, temperature, streaming) -> ChatOpenAI
+# ChatOpenAI 本身是无状态的，可以被多个协程安全复用
+_ClientKey = Tuple[str, str, float, bool]
+_clients: Dict[_ClientKey, "ScheduledChatOpenAI"] = {}
+_lock = threading.RLock()
+
+
+class _PoolStats:
+    """连接池统计：请求数、响应状态、新建连接数 (用于观察 keep-alive 复用率)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.responses: Dict[str, int] = {}
+        self.connections_created = 0
+        self._seen = weakref.WeakSet()
+
+    def observe_connections(self, connections):
+        for conn in connections:
+            if conn not in self._seen:
+                self._seen.add(conn)
+                self.connections_created += 1
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    按事件循环分配连接池：httpx 的连接绑定在创建它的事件循环上，
+    服务主循环之外的调用 (如 tools.py 里 asyncio.run 开的临时循环) 各用各的连接池，循环回收后随之释放
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._pools.get(loop)
+            if transport is None:
+                transport = self._pools[loop] = httpx.AsyncHTTPTransport(**self._kwargs)
+        return transport
+
+    def transports(self) -> list:
+        with self._lock:
+            return list(self._pools.values())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        """只关闭当前循环的连接池：共享的 AsyncClient 仍然可用，之后的请求重新建立连接"""
+        with self._lock:
+            transport = self._pools.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_stats = _PoolStats()
+_async_transport: Optional[_LoopLocalTransport] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_sync_transport: Optional[httpx.HTTPTransport] = None
+_sync_http_client: Optional[httpx.Client] = None
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 依赖 h2 包，没装就退回 HTTP/1.1 keep-alive"""
+    if not settings.LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _pool_connections(transport) -> list:
+    """读取 httpcore 连接池中的连接 (私有属性，取不到时返回空列表)"""
+    pool = getattr(transport, "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+def _async_connections() -> list:
+    transports = _async_transport.transports() if _async_transport is not None else []
+    return [conn for transport in transports for conn in _pool_connections(transport)]
+
+
+async def _on_request(request: httpx.Request):
+    _stats.requests += 1
+
+
+def _on_sync_response(response: httpx.Response):
+    # 同步连接池 (线程中的 invoke) 的 429 同样反馈给准入控制器；连接复用统计只看异步连接池
+    if response.status_code == 429:
+        llm_scheduler.call_threadsafe(llm_scheduler.record_throttle)
+
+
+async def _on_response(response: httpx.Response):
+    if response.status_code == 429:
+        # 限流信号反馈给准入控制器 (包括 openai SDK 内部重试的那些 429)；可能在临时事件循环上，投递到调度器的循环
+        llm_scheduler.call_threadsafe(llm_scheduler.record_throttle)
+    bucket = f"{response.status_code // 100}xx"
+    _stats.responses[bucket] = _stats.responses.get(bucket, 0) + 1
+    _stats.observe_connections(_async_connections())
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """进程级共享的异步 HTTP 客户端 (连接池按事件循环分配，见 _LoopLocalTransport)"""
+    global _async_http_client, _async_transport
+    if _async_http_client is None:
+        with _lock:
+            if _async_http_client is None:
+                http2 = _http2_enabled()
+                _async_transport = _LoopLocalTransport(http2=http2, limits=_pool_limits())
+                _async_http_client = httpx.AsyncClient(
+                    transport=_async_transport,
+                    timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                )
+                logger.info(f"🔌 [LLM] Shared HTTP pool created (http2={http2}, "
+                            f"max_connections={settings.LLM_POOL_MAX_CONNECTIONS})")
+    return _async_http_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """同步调用 (CLI 脚本里的 chain.invoke) 使用的共享连接池"""
+    global _sync_http_client, _sync_transport
+    if _sync_http_client is None:
+        with _lock:
+            if _sync_http_client is None:
+                _sync_transport = httpx.HTTPTransport(http2=_http2_enabled(), limits=_pool_limits())
+                _sync_http_client = httpx.Client(
+                    transport=_sync_transport,
+                    timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+                    event_hooks={"response": [_on_sync_response]},
+                )
+    return _sync_http_client
+
+
+def _usage_tokens(message) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens", 0) or 0)
+
+
+# 标记当前协程 / 线程已持有准入槽位：streaming=True 时 _agenerate / _generate 内部会再走 _astream / _stream，避免重复申请
+_holding_slot: ContextVar[bool] = ContextVar("llm_holding_slot", default=False)
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """
+    所有调用都先经过全局准入控制器 (并发上限 + 优先级排队)
+    异步调用 (ainvoke / astream) 走 slot()，同步调用 (invoke / stream，如 CLI 脚本和线程中的工具调用) 走 sync_slot()
+    """
+
+    def _generate(self, *args, **kwargs):
+        if _holding_slot.get():
+            return super()._generate(*args, **kwargs)
+        start = time.monotonic()
+        tokens = 0
+        with llm_scheduler.sync_slot() as timer:
+            token = _holding_slot.set(True)
+            try:
+                result = super()._generate(*args, **kwargs)
+                tokens = sum(_usage_tokens(g.message) for g in result.generations)
+                return result
+            finally:
+                _holding_slot.reset(token)
+                record_llm_call(time.monotonic() - start, timer.waited, tokens)
+
+    def _stream(self, *args, **kwargs):
+        if _holding_slot.get():
+            yield from super()._stream(*args, **kwargs)
+            return
+        start = time.monotonic()
+        tokens = 0
+        with llm_scheduler.sync_slot() as timer:
+            try:
+                for chunk in super()._stream(*args, **kwargs):
+                    timer.mark()
+                    tokens += _usage_tokens(chunk.message)
+                    yield chunk
+            finally:
+                record_llm_call(time.monotonic() - start, timer.waited, tokens)
+
+    async def _agenerate(self, *args, **kwargs):
+        if _holding_slot.get():
+            return await super()._agenerate(*args, **kwargs)
+        start = time.monotonic()
+        tokens = 0
+        async with llm_scheduler.slot() as timer:
+            token = _holding_slot.set(True)
+            try:
+                result = await super()._agenerate(*args, **kwargs)
+                tokens = sum(_usage_tokens(g.message) for g in result.generations)
+                return result
+            finally:
+                _holding_slot.reset(token)
+                # 耗时 (含排队) 与 token 用量记到当前 Graph 节点上
+                record_llm_call(time.monotonic() - start, timer.waited, tokens)
+
+    async def _astream(self, *args, **kwargs):
+        if _holding_slot.get():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+            return
+        start = time.monotonic()
+        tokens = 0
+        async with llm_scheduler.slot() as timer:
+            try:
+                async for chunk in super()._astream(*args, **kwargs):
+                    timer.mark()  # 流式调用以首个 chunk 的延迟作为拥塞信号
+                    tokens += _usage_tokens(chunk.message)  # 开启 stream_usage 后最后一个 chunk 带用量
+                    yield chunk
+            finally:
+                record_llm_call(time.monotonic() - start, timer.waited, tokens)
+
 
 def get_llm(temperature=0.7, streaming: bool = False):
-    # 这里可以配置 DeepSeek 的 Base URL
-    return ChatOpenAI(
-        model_name=settings.MODEL_NAME, # e.g., "gpt-4" or "deepseek-chat"
-        openai_api_key=settings.OPENAI_API_KEY,
-        openai_api_base=settings.OPENAI_API_BASE,
-        temperature=temperature,
-        streaming=streaming
-    )
\ No newline at end of file
+    """
+    获取 LLM 客户端 (按 模型/地址/温度/流式 复用长连接实例)
+    """
+    key = (settings.MODEL_NAME, settings.OPENAI_API_BASE, float(temperature), bool(streaming))
+    llm = _clients.get(key)
+    if llm is None:
+        with _lock:
+            llm = _clients.get(key)
+            if llm is None:
+                # 这里可以配置 DeepSeek 的 Base URL
+                llm = ScheduledChatOpenAI(
+                    model_name=settings.MODEL_NAME,  # e.g., "gpt-4" or "deepseek-chat"
+                    openai_api_key=settings.OPENAI_API_KEY,
+                    openai_api_base=settings.OPENAI_API_BASE,
+                    temperature=temperature,
+                    streaming=streaming,
+                    # 流式输出也返回 token 用量 (请求带 stream_options)，供 Graph 运行统计；不支持该参数的兼容接口需关闭
+                    stream_usage=settings.LLM_STREAM_USAGE,
+                    http_async_client=get_async_http_client(),
+                    http_client=get_sync_http_client(),
+                )
+                _clients[key] = llm
+                logger.debug(f"🧩 [LLM] New client registered: {key}")
+    return llm
+
+
+def get_pool_stats() -> dict:
+    """连接池统计：连接复用率 = requests / connections_created"""
+    connections = _async_connections()
+    _stats.observe_connections(connections)
+    idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return {
+        "clients": len(_clients),
+        "http2": _http2_enabled(),
+        "limits": {
+            "max_connections": settings.LLM_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.LLM_POOL_MAX_KEEPALIVE,
+            "keepalive_expiry": settings.LLM_POOL_KEEPALIVE_EXPIRY,
+        },
+        "requests": _stats.requests,
+        "responses": dict(_stats.responses),
+        "connections_open": len(connections),
+        "connections_idle": idle,
+        "connections_created": _stats.connections_created,
+        "reuse_ratio": round(_stats.requests / _stats.connections_created, 2) if _stats.connections_created else 0.0,
+    }
+
+
+async def aclose_llm_clients():
+    """
+    应用关闭时释放连接池中的连接
+    缓存的 ChatOpenAI 实例仍引用共享客户端，所以只关闭连接 (不关闭客户端本身)，之后的调用会重新建立连接
+    """
+    if _async_transport is not None:
+        await _async_transport.aclose()
+    if _sync_transport is not None:
+        _sync_transport.close()
@@ -0,0 +1,278 @@
+import asyncio
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class Priority(IntEnum):
+    """数值越小优先级越高"""
+    INTERACTIVE = 0  # 对话 / 模拟面试：用户在屏幕前等待
+    GUIDE = 1  # 面试报告生成
+    BACKGROUND = 2  # 长期记忆提取等后台任务
+
+
+# 当前协程的 LLM 调用优先级 (由入口处设置，下游所有 LLM 调用自动继承)
+_current_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.GUIDE)
+
+
+def set_llm_priority(priority: Priority):
+    _current_priority.set(priority)
+
+
+def get_llm_priority() -> Priority:
+    return _current_priority.get()
+
+
+class LLMScheduler:
+    """
+    进程级 LLM 准入控制器
+    - 并发上限：同时在途的 LLM 请求数不超过 limit
+    - 优先级：排队时高优先级请求先放行，同优先级先来先服务
+    - AIMD 自适应：请求成功且延迟达标时缓慢加性增加 limit；
+      出现 429 时乘性减半，延迟超标时小幅收缩
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, initial_limit: int, latency_target: float):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial_limit)
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 调度状态只在这个事件循环上修改 (见 bind_loop)
+        # 统计
+        self.admitted = 0
+        self.throttled = 0
+        self._wait_samples: Dict[Priority, Deque[float]] = {p: deque(maxlen=1000) for p in Priority}
+
+    # --- 准入 ---
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        绑定服务的事件循环 (lifespan 启动时调用一次)：排队与槽位计数只在这个循环上修改，
+        其他线程 / 其他循环 (如 tools.py 里 asyncio.run 开的临时循环) 的申请都投递到这里排队
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        # 旧循环上的等待者已经无法唤醒
+        self._waiters = [w for w in self._waiters if not w[2].done() and w[2].get_loop() is self._loop]
+        heapq.heapify(self._waiters)
+
+    async def acquire(self, priority: Priority) -> float:
+        """申请一个执行槽位，返回排队等待的秒数"""
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed():
+            # 没有经过 lifespan 的场景 (CLI / 基准脚本)：绑定到当前循环
+            self.bind_loop(loop)
+        if loop is self._loop:
+            return await self._acquire(priority)
+        bound = self._foreign_loop()
+        if bound is None:
+            # 绑定的循环没有在运行，无法排队：直接放行
+            return self._admit_unqueued(priority)
+        cfut = asyncio.run_coroutine_threadsafe(self._acquire(priority), bound)
+        try:
+            return await asyncio.wrap_future(cfut)
+        except asyncio.CancelledError:
+            # 取消时恰好已经分到槽位：归还
+            if cfut.done() and not cfut.cancelled() and cfut.exception() is None:
+                self.call_threadsafe(self.release)
+            raise
+
+    async def _acquire(self, priority: Priority) -> float:
+        start = time.monotonic()
+        fut = self._loop.create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), fut))
+        # 有空闲槽位时会立即放行 (仍按优先级顺序)
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 已经分到槽位但调用方被取消：归还槽位
+            if fut.done() and not fut.cancelled():
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+        waited = time.monotonic() - start
+        self._record_wait(priority, waited)
+        return waited
+
+    def _admit_unqueued(self, priority: Priority) -> float:
+        """不经排队直接放行，但仍计入在途数与 AIMD 反馈"""
+        self.in_flight += 1
+        self.admitted += 1
+        self._record_wait(priority, 0.0)
+        return 0.0
+
+    def _record_wait(self, priority: Priority, waited: float):
+        self._wait_samples[priority].append(waited)
+
+    def _dispatch(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():  # 等待者已取消
+                continue
+            self.in_flight += 1
+            self.admitted += 1
+            fut.set_result(None)
+
+    def release(self, latency: Optional[float] = None, failed: bool = False):
+        """归还槽位，并根据本次延迟调整并发上限"""
+        self.in_flight -= 1
+        if latency is not None and not failed:
+            if latency <= self.latency_target:
+                # 加性增：每个 "窗口" (约 limit 次成功) 增加 1
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self._decrease(0.9, reason=f"latency {latency:.1f}s")
+        self._dispatch()
+
+    def _foreign_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """当前在工作线程里、且服务的事件循环正在运行时返回该循环 (调度状态需要投递过去修改)"""
+        loop = self._loop
+        if loop is None or not loop.is_running() or loop.is_closed():
+            return None
+        try:
+            return None if asyncio.get_running_loop() is loop else loop
+        except RuntimeError:
+            return loop
+
+    def call_threadsafe(self, fn, *args, **kwargs):
+        """从任意线程修改调度状态：有运行中的事件循环时投递到循环上执行"""
+        loop = self._foreign_loop()
+        if loop is None:
+            fn(*args, **kwargs)
+        else:
+            loop.call_soon_threadsafe(functools.partial(fn, *args, **kwargs))
+
+    def record_throttle(self):
+        """收到 429 (由 HTTP 连接池的响应钩子调用)"""
+        self.throttled += 1
+        self._decrease(0.5, reason="429 Too Many Requests")
+
+    def _decrease(self, factor: float, reason: str):
+        # 同一波拥塞信号只收缩一次，避免连续的 429 把 limit 直接压到底
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        logger.warning(f"🚦 [LLM Scheduler] Limit {old:.1f} -> {self.limit:.1f} ({reason})")
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[Priority] = None):
+        """
+        用法:
+            async with llm_scheduler.slot() as timer:
+                ...
+                timer.mark()  # 可选：流式调用在首个 chunk 到达时标记延迟
+        """
+        priority = get_llm_priority() if priority is None else priority
+        waited = await self.acquire(priority)
+        timer = _SlotTimer(waited)
+        failed = False
+        try:
+            yield timer
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.call_threadsafe(self.release, timer.latency(), failed=failed)
+
+    @contextmanager
+    def sync_slot(self, priority: Optional[Priority] = None):
+        """
+        同步调用 (线程中的 chain.invoke / 工具调用) 的准入，用法同 slot()
+        - 工作线程：申请投递到事件循环上，与异步调用按同一套优先级排队，当前线程阻塞等待 (最多 LLM_REQUEST_TIMEOUT 秒)
+        - 事件循环线程本身 / 没有运行中的事件循环 (CLI 脚本)：无法排队等待，直接放行，但仍计入在途数与 AIMD 反馈
+        """
+        priority = get_llm_priority() if priority is None else priority
+        loop = self._foreign_loop()
+        if loop is not None:
+            cfut = asyncio.run_coroutine_threadsafe(self._acquire(priority), loop)
+            try:
+                waited = cfut.result(timeout=settings.LLM_REQUEST_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                # 取消排队 (已分到的槽位由 _acquire 归还)，本次调用按超时失败；取消前刚好放行则照常执行
+                if cfut.cancel():
+                    raise TimeoutError(f"LLM scheduler: no slot within {settings.LLM_REQUEST_TIMEOUT}s")
+                waited = cfut.result()
+        else:
+            waited = self._admit_unqueued(priority)
+        timer = _SlotTimer(waited)
+        failed = False
+        try:
+            yield timer
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.call_threadsafe(self.release, timer.latency(), failed=failed)
+
+    # --- 指标 ---
+    def stats(self) -> dict:
+        queue_depth = {p.name.lower(): 0 for p in Priority}
+        for prio, _, fut in self._waiters:
+            if not fut.done():
+                queue_depth[Priority(prio).name.lower()] += 1
+
+        wait_ms = {}
+        for p, samples in self._wait_samples.items():
+            data = sorted(samples)
+            if not data:
+                wait_ms[p.name.lower()] = {"count": 0, "avg": 0.0, "p50": 0.0, "p99": 0.0}
+                continue
+            wait_ms[p.name.lower()] = {
+                "count": len(data),
+                "avg": round(sum(data) / len(data) * 1000, 2),
+                "p50": round(data[len(data) // 2] * 1000, 2),
+                "p99": round(data[min(len(data) - 1, int(len(data) * 0.99))] * 1000, 2),
+            }
+
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": queue_depth,
+            "admitted": self.admitted,
+            "throttled_429": self.throttled,
+            "wait_ms": wait_ms,
+        }
+
+
+class _SlotTimer:
+    """记录一次 LLM 调用的延迟：默认为整个调用耗时，mark() 后以首次标记为准"""
+
+    def __init__(self, waited: float = 0.0):
+        self.start = time.monotonic()
+        self.waited = waited  # 在准入控制器中排队的秒数
+        self.marked: Optional[float] = None
+
+    def mark(self):
+        if self.marked is None:
+            self.marked = time.monotonic() - self.start
+
+    def latency(self) -> float:
+        return self.marked if self.marked is not None else time.monotonic() - self.start
+
+
+# 单例
+llm_scheduler = LLMScheduler(
+    min_limit=settings.LLM_MIN_CONCURRENCY,
+    max_limit=settings.LLM_MAX_CONCURRENCY,
+    initial_limit=settings.LLM_INITIAL_CONCURRENCY,
+    latency_target=settings.LLM_LATENCY_TARGET,
+)
@@ -0,0 +1,153 @@
+import itertools
+import sqlite3
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+
+# ==========================================
+# 元数据倒排索引 (字段 -> 取值 -> 向量位置)
+# ==========================================
+# 片段元数据 (source / Header 1/2/3 / 语料入库时带的简单字段) 在建索引时就整理成倒排表，
+# 和片段文本一起存进 docstore.sqlite 的 metadata_postings 表。
+# 检索时把过滤条件解析成向量位置集合，通过 FAISS 的 IDSelector 下推到索引内部：
+# 不需要先取大 top-k 再后过滤，带过滤的检索和普通检索开销相同，也不会漏掉结果。
+#
+# 过滤条件: {"source": "redis.md"} / {"Header 1": ["Redis", "Kafka"], "source": "mq.md"}
+#   同一字段多个取值为 OR，不同字段之间为 AND
+
+POSTINGS_TABLE = "metadata_postings"
+MAX_VALUE_LENGTH = 200  # 过长的取值 (正文类字段) 不建倒排
+
+Filters = Dict[str, Union[Any, List[Any]]]
+
+
+def _indexable(value) -> bool:
+    return isinstance(value, (str, int, float, bool)) and len(str(value)) <= MAX_VALUE_LENGTH
+
+
+def iter_postings(pos: int, meta: dict) -> Iterable[Tuple[str, str, int]]:
+    """一个片段的倒排项: (字段, 取值, 向量位置)"""
+    for field, value in meta.items():
+        if _indexable(value):
+            yield field, str(value), pos
+
+
+def normalize_filters(filters: Optional[Filters]) -> Optional[Dict[str, Tuple[str, ...]]]:
+    """统一成 {字段: (取值, ...)}，取值一律转成字符串；可直接用作缓存 key 的一部分"""
+    if not filters:
+        return None
+    normalized = {}
+    for field, values in filters.items():
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        normalized[field] = tuple(sorted(str(v) for v in values))
+    return normalized
+
+
+class MetadataIndex:
+    """内存中的倒排表：{字段: {取值: 升序的向量位置数组}}"""
+
+    def __init__(self, postings: Dict[str, Dict[str, np.ndarray]]):
+        self.postings = postings
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, dict]]) -> "MetadataIndex":
+        """rows: (向量位置, 元数据)"""
+        lists: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        for pos, meta in rows:
+            for field, value, _ in iter_postings(pos, meta):
+                lists[field][value].append(pos)
+        return cls({
+            field: {value: np.unique(np.asarray(ids, dtype="int64")) for value, ids in values.items()}
+            for field, values in lists.items()
+        })
+
+    @classmethod
+    def from_langchain(cls, vector_store) -> "MetadataIndex":
+        """旧的 pickle 格式没有预建倒排表，加载时从 docstore 现建一份"""
+        return cls.build(
+            (pos, vector_store.docstore.search(doc_id).metadata)
+            for pos, doc_id in vector_store.index_to_docstore_id.items()
+        )
+
+    # --- 持久化 (docstore.sqlite 中的一张表) ---
+    def write(self, conn: sqlite3.Connection):
+        _create_postings_table(conn)
+        conn.executemany(
+            f"INSERT INTO {POSTINGS_TABLE} (field, value, ids) VALUES (?, ?, ?)",
+            [(field, value, ids.tobytes()) for field, values in self.postings.items() for value, ids in values.items()],
+        )
+
+    @classmethod
+    def read(cls, conn: sqlite3.Connection) -> Optional["MetadataIndex"]:
+        exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (POSTINGS_TABLE,)).fetchone()
+        if not exists:
+            return None
+        postings: Dict[str, Dict[str, np.ndarray]] = defaultdict(dict)
+        for field, value, blob in conn.execute(f"SELECT field, value, ids FROM {POSTINGS_TABLE}"):
+            postings[field][value] = np.frombuffer(blob, dtype="int64")
+        return cls(dict(postings))
+
+    # --- 查询 ---
+    def resolve(self, filters: Optional[Filters]) -> Optional[np.ndarray]:
+        """过滤条件 -> 满足条件的向量位置 (升序)；无过滤条件返回 None，没有匹配返回空数组"""
+        normalized = normalize_filters(filters)
+        if normalized is None:
+            return None
+        result: Optional[np.ndarray] = None
+        # 先处理命中最少的字段，交集尽快缩小
+        per_field = []
+        for field, values in normalized.items():
+            lists = [self.postings.get(field, {}).get(v) for v in values]
+            lists = [ids for ids in lists if ids is not None]
+            per_field.append(np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype="int64"))
+        for ids in sorted(per_field, key=len):
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def values(self, field: str) -> Dict[str, int]:
+        """某个字段的全部取值及片段数 (用于前端 / 运维查看可选的过滤项)"""
+        return {value: int(len(ids)) for value, ids in self.postings.get(field, {}).items()}
+
+    def stats(self) -> dict:
+        return {field: len(values) for field, values in self.postings.items()}
+
+
+def _create_postings_table(conn: sqlite3.Connection):
+    conn.execute(f"DROP TABLE IF EXISTS {POSTINGS_TABLE}")
+    conn.execute(f"CREATE TABLE {POSTINGS_TABLE} (field TEXT, value TEXT, ids BLOB, PRIMARY KEY (field, value))")
+
+
+def write_sorted_postings(conn: sqlite3.Connection, rows: Iterable[Tuple[str, str, int]]):
+    """
+    流式写出倒排表 (格式与 MetadataIndex.write 相同)
+    rows: 按 (字段, 取值, 位置) 排好序的倒排项；大语料由 SQLite 在磁盘上排序，不在内存中攒整张倒排表
+    """
+    _create_postings_table(conn)
+    for (field, value), group in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+        ids = np.unique(np.fromiter((pos for _, _, pos in group), dtype="int64"))
+        conn.execute(f"INSERT INTO {POSTINGS_TABLE} (field, value, ids) VALUES (?, ?, ?)", (field, value, ids.tobytes()))
+
+
+def search_with_selector(index: faiss.Index, vector: np.ndarray, k: int, ids: np.ndarray):
+    """
+    带 ID 过滤的 FAISS 搜索：过滤在索引内部生效 (Flat 逐个跳过、IVF 扫描倒排表时跳过、HNSW 遍历时跳过)
+    查询期参数 (nprobe / efSearch) 沿用索引上已设置的值
+    """
+    selector = faiss.IDSelectorBatch(ids)
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    if isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if isinstance(index, faiss.IndexPreTransform):
+        params = faiss.SearchParametersPreTransform(index_params=params)
+    # 过滤后剩余的向量可能少于 k
+    return index.search(vector, min(k, len(ids)), params=params)
+
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from loguru import logger
+
+from app.core.ann_index import apply_search_params, read_index_meta
+from app.core.bm25_index import BM25Index
+from app.core.metadata_index import MetadataIndex, iter_postings, search_with_selector, write_sorted_postings
+
+# ==========================================
+# 内存映射索引 + SQLite 文档库
+# ==========================================
+# FAISS.load_local 会反序列化整个 index.pkl，并把所有片段文本常驻在每个 worker 的堆里。
+# 这里的格式：
+#   index.faiss      原生 FAISS 索引，只读 mmap 打开，多个进程共享同一份页缓存
+#   docstore.sqlite  片段文本与元数据 (行号 = 向量在索引中的位置)，只读取 top-k 命中的行；
+#                    另含元数据倒排表 (metadata_postings)，用于带过滤条件的检索
+#   bm25/            BM25 词法倒排索引 (见 app/core/bm25_index.py)，用于混合检索
+# 全程不涉及 pickle，也就不需要 allow_dangerous_deserialization。
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# faiss >= 1.9 的 IO_FLAG_MMAP_IFC 对 Flat 类索引的向量数据同样使用 mmap
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def has_mmap_store(path: str) -> bool:
+    return os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(os.path.join(path, DOCSTORE_FILE))
+
+
+_CREATE_CHUNKS = "CREATE TABLE chunks (pos INTEGER PRIMARY KEY, doc_id TEXT, text TEXT, metadata TEXT)"
+_INSERT_CHUNK = "INSERT INTO chunks (pos, doc_id, text, metadata) VALUES (?, ?, ?, ?)"
+
+
+def _chunk_rows(rows: List[Tuple[int, str, str, dict]]):
+    return [(pos, doc_id, text, json.dumps(meta, ensure_ascii=False)) for pos, doc_id, text, meta in rows]
+
+
+def _fresh_db(path: str) -> sqlite3.Connection:
+    if os.path.exists(path):
+        os.remove(path)
+    return sqlite3.connect(path)
+
+
+def write_docstore(path: str, rows: List[Tuple[int, str, str, dict]]):
+    """rows: (向量位置, 文档 ID, 文本, 元数据)；先写临时文件再原子替换"""
+    db_path = os.path.join(path, DOCSTORE_FILE)
+    tmp = db_path + ".tmp"
+    conn = _fresh_db(tmp)
+    conn.execute(_CREATE_CHUNKS)
+    conn.executemany(_INSERT_CHUNK, _chunk_rows(rows))
+    # 建索引时顺带生成元数据倒排表，线上加载时直接读取
+    MetadataIndex.build((pos, meta) for pos, _, _, meta in rows).write(conn)
+    conn.commit()
+    conn.close()
+    os.replace(tmp, db_path)
+
+
+class DocstoreWriter:
+    """
+    流式写 docstore (格式与 write_docstore 相同)：片段分批追加，内存中只有当前这一批
+    元数据倒排项先写进一个临时 SQLite 表，close() 时由 SQLite 排序后逐组写出倒排表
+    """
+
+    def __init__(self, path: str):
+        self.db_path = os.path.join(path, DOCSTORE_FILE)
+        self._tmp = self.db_path + ".tmp"
+        self._postings_tmp = self.db_path + ".postings.tmp"
+        self._conn = _fresh_db(self._tmp)
+        self._conn.execute(_CREATE_CHUNKS)
+        self._postings = _fresh_db(self._postings_tmp)
+        self._postings.execute("CREATE TABLE postings (field TEXT, value TEXT, pos INTEGER)")
+        self.count = 0
+
+    def add(self, rows: List[Tuple[int, str, str, dict]]):
+        self._conn.executemany(_INSERT_CHUNK, _chunk_rows(rows))
+        self._postings.executemany("INSERT INTO postings (field, value, pos) VALUES (?, ?, ?)",
+                                   (item for pos, _, _, meta in rows for item in iter_postings(pos, meta)))
+        self._conn.commit()
+        self._postings.commit()
+        self.count += len(rows)
+
+    def close(self):
+        """写出倒排表，然后原子替换 docstore"""
+        sorted_rows = self._postings.execute("SELECT field, value, pos FROM postings ORDER BY field, value, pos")
+        write_sorted_postings(self._conn, sorted_rows)
+        self._conn.commit()
+        self._conn.close()
+        self._postings.close()
+        os.remove(self._postings_tmp)
+        os.replace(self._tmp, self.db_path)
+
+
+def write_mmap_store(path: str, index: faiss.Index, rows: List[Tuple[int, str, str, dict]]):
+    """写出完整的 mmap 格式：docstore (含元数据倒排表)、BM25 索引、原生 FAISS 索引；rows 同 write_docstore"""
+    os.makedirs(path, exist_ok=True)
+    write_docstore(path, rows)
+    BM25Index.build((pos, text) for pos, _, text, _ in rows).save(path)
+    tmp = os.path.join(path, INDEX_FILE + ".tmp")
+    faiss.write_index(index, tmp)
+    os.replace(tmp, os.path.join(path, INDEX_FILE))
+
+
+def export_langchain_faiss(vector_store, path: str):
+    """把 LangChain FAISS 对象导出为 mmap 格式 (构建脚本在 save_local 之后调用)"""
+    rows = []
+    for pos, doc_id in vector_store.index_to_docstore_id.items():
+        doc = vector_store.docstore.search(doc_id)
+        rows.append((pos, doc_id, doc.page_content, doc.metadata))
+    write_mmap_store(path, vector_store.index, rows)
+    logger.info(f"💾 [MmapStore] Exported {len(rows)} chunks to {path}")
+
+
+class MmapVectorStore:
+    """只读向量库：接口与检索用到的 LangChain FAISS 方法保持一致"""
+
+    def __init__(self, path: str, embeddings):
+        self.path = path
+        self.embeddings = embeddings
+        self.index = faiss.read_index(os.path.join(path, INDEX_FILE), _MMAP_FLAGS)
+        self._db_uri = f"file:{os.path.join(path, DOCSTORE_FILE)}?mode=ro"
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self.metadata_index = MetadataIndex.read(self._db())
+        if self.metadata_index is None:
+            # 旧版本导出的 docstore 没有倒排表：加载时现建 (重新运行 build_blog_kb.py --convert 即可预建)
+            logger.warning(f"⚠️ [MmapStore] No metadata postings in {path}, building them at load time")
+            self.metadata_index = MetadataIndex.build(
+                (pos, json.loads(meta)) for pos, meta in self._db().execute("SELECT pos, metadata FROM chunks")
+            )
+        # 没有 bm25/ 目录 (旧索引) 时为 None，检索只走向量
+        self.bm25 = BM25Index.load(path)
+
+    @classmethod
+    def load(cls, path: str, embeddings) -> "MmapVectorStore":
+        return cls(path, embeddings)
+
+    def _db(self) -> sqlite3.Connection:
+        # SQLite 连接不能跨线程共享，每个检索线程各开一个只读连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        """索引热切换后，旧版本的最后一个读者结束时调用：关闭各线程的 SQLite 连接，释放 mmap"""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+        self.index = None
+        self.bm25 = None
+
+    def _fetch(self, positions: List[int]) -> Dict[int, Document]:
+        if not positions:
+            return {}
+        rows = self._db().execute(
+            f"SELECT pos, text, metadata FROM chunks WHERE pos IN ({','.join('?' * len(positions))})",
+            positions,
+        ).fetchall()
+        return {pos: Document(page_content=text, metadata=json.loads(meta)) for pos, text, meta in rows}
+
+    def rows(self) -> List[Tuple[int, str, str, dict]]:
+        """全部片段 (位置, 文档 ID, 文本, 元数据)，按位置排序；用于在已有索引上追加后重写"""
+        return [(pos, doc_id, text, json.loads(meta)) for pos, doc_id, text, meta in
+                self._db().execute("SELECT pos, doc_id, text, metadata FROM chunks ORDER BY pos")]
+
+    def fetch_documents(self, positions: List[int]) -> List[Tuple[int, Document]]:
+        """按给定顺序取回 (位置, 片段) (混合检索融合后的位置列表)"""
+        docs = self._fetch(positions)
+        return [(i, docs[i]) for i in positions if i in docs]
+
+    def search_positions(self, embedding: List[float], k: int,
+                         allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """向量检索，只返回 (位置, 距离)；allowed 为元数据过滤解析出的位置集合"""
+        vec = np.asarray([embedding], dtype="float32")
+        if allowed is None:
+            scores, ids = self.index.search(vec, k)
+        elif not len(allowed):
+            return []
+        else:
+            # 过滤条件下推到 FAISS 内部，不做后过滤
+            scores, ids = search_with_selector(self.index, vec, k, allowed)
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        hits = self.search_positions(embedding, k, self.metadata_index.resolve(filter))
+        docs = self._fetch([i for i, _ in hits])
+        return [(docs[i], s) for i, s in hits if i in docs]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, filter, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k, filter, **kwargs)
+
+
+def load_vector_store(path: str, embeddings, index_format: str = "auto") -> Optional[object]:
+    """
+    按格式加载向量库
+    - mmap: 只加载 mmap 格式
+    - pickle: 旧的 FAISS.load_local (需要 allow_dangerous_deserialization)
+    - auto: 有 mmap 格式就用，否则回退到 pickle
+    构建时记录的查询期参数 (nprobe / efSearch) 会在加载后应用
+    """
+    if index_format in ("auto", "mmap") and has_mmap_store(path):
+        store = MmapVectorStore.load(path, embeddings)
+    elif index_format == "mmap":
+        raise FileNotFoundError(f"mmap index not found at {path}, run build_blog_kb.py --convert first")
+    elif not os.path.exists(os.path.join(path, "index.pkl")):
+        return None
+    else:
+        from langchain_community.vectorstores import FAISS
+        # pickle 格式没有倒排表，带过滤的检索走 LangChain 自带的后过滤 (fetch_k 个结果中筛选)
+        logger.warning(f"⚠️ [MmapStore] Loading pickled docstore from {path}; run build_blog_kb.py --convert to switch to mmap")
+        store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    meta = read_index_meta(path)
+    if meta:
+        apply_search_params(store.index, meta.get("search_params", ""))
+        logger.info(f"📐 [MmapStore] Index spec: {meta.get('spec')} ({meta.get('search_params') or 'default params'})")
+    return store
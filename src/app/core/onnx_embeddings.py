@@ -0,0 +1,134 @@
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+
+# ==========================================
+# ONNX Runtime 推理后端 (CPU)
+# ==========================================
+# 线上节点没有 GPU，BGE 走全精度 PyTorch 时查询向量化是检索延迟的大头。
+# 这里把同一个 BGE 模型导出为 ONNX (可选动态 int8 量化)，用 onnxruntime + tokenizers 推理：
+#   - 不依赖 torch，进程内存和启动时间都更小
+#   - 输出与 HuggingFaceEmbeddings 一致：取 [CLS] 向量并做 L2 归一化
+# 导出: python app/blog/export_onnx.py  (导出后自动做与 torch 输出的余弦相似度一致性校验)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# 默认导出目录: 项目根目录/models/<模型名>-onnx
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def default_onnx_dir(model_name: str) -> str:
+    return os.path.join(PROJECT_ROOT, "models", f"{model_name.split('/')[-1]}-onnx")
+
+
+def export_onnx_model(model_name: str, out_dir: str, quantize: bool = True, opset: int = 14) -> str:
+    """把 HuggingFace BGE 模型导出为 ONNX (动态 batch / 序列长度)，quantize=True 时额外生成 int8 版本"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.environ.setdefault('HF_ENDPOINT', 'https://hf-mirror.com')
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["导出样例", "export sample"], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + ["last_hidden_state"]}
+    start = time.time()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in INPUT_NAMES),
+            fp32_path,
+            input_names=INPUT_NAMES,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    logger.success(f"✅ [ONNX] Exported {model_name} -> {fp32_path} in {time.time() - start:.1f}s")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, INT8_FILE)
+        # 动态量化：权重离线转 int8，激活值在推理时按批动态量化，不需要校准数据
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logger.success(f"✅ [ONNX] Quantized (int8) -> {int8_path} "
+                       f"({os.path.getsize(fp32_path) / 2**20:.0f}MB -> {os.path.getsize(int8_path) / 2**20:.0f}MB)")
+    return out_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """onnxruntime 版 BGE 向量化，接口与 LangChain Embeddings 一致，可直接替换 HuggingFaceEmbeddings"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, threads: int = 0,
+                 max_length: int = 512, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at {model_path}, run app/blog/export_onnx.py first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            # 与 torch.set_num_threads 同理：限制算子内线程数，避免与 uvicorn / 检索线程池抢 CPU
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        self.model_path = model_path
+        self.quantized = quantized
+        self.batch_size = batch_size
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype="int64"),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype="int64"),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype="int64"),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        cls = hidden[:, 0]
+        return cls / np.linalg.norm(cls, axis=1, keepdims=True).clip(min=1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # 按长度排序后分批，同一批内 padding 更少
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            for i, vec in zip(idx, self._encode([texts[i] for i in idx])):
+                vectors[i] = vec.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def parity_check(reference: Embeddings, candidate: Embeddings, texts: List[str]) -> dict:
+    """一致性校验：同一批文本在两个后端下的向量余弦相似度 (向量均已归一化，内积即余弦)"""
+    ref = np.asarray(reference.embed_documents(texts), dtype="float32")
+    cand = np.asarray(candidate.embed_documents(texts), dtype="float32")
+    cosine = (ref * cand).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+    }
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Deque, List, Optional, Tuple
+
+from app.utils.logger import logger
+
+
+class EmbeddingMicroBatcher:
+    """
+    查询向量化微批处理
+    并发到达的查询先攒一个很短的窗口 (window_ms)，或攒满 max_batch 条立即触发，
+    合并成一次 embed_documents 前向计算，在专用线程池里执行，不占用事件循环。
+    只在同一个事件循环内合并；另一个事件循环 (如工具函数里的 asyncio.run) 恰好在窗口期内调用时直接单条计算。
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], executor: Executor,
+                 max_batch: int, window_ms: float):
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 统计
+        self.batches = 0
+        self.queries = 0
+        self._batch_sizes: Deque[int] = deque(maxlen=1000)
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop and not self._pending:
+            self._loop = loop
+        if loop is not self._loop:
+            vectors = await loop.run_in_executor(self.executor, self.embed_fn, [text])
+            return vectors[0]
+
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 已取消的请求不再参与计算
+        batch = [(text, fut) for text, fut in self._pending if not fut.cancelled()]
+        self._pending = []
+        if not batch:
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        self._batch_sizes.append(len(batch))
+        task = self._loop.run_in_executor(self.executor, self.embed_fn, [text for text, _ in batch])
+        task.add_done_callback(lambda t: self._resolve(t, batch))
+
+    @staticmethod
+    def _resolve(task: asyncio.Future, batch: List[Tuple[str, asyncio.Future]]):
+        if task.cancelled():
+            for _, fut in batch:
+                if not fut.done():
+                    fut.cancel()
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error(f"❌ [KB] Batched embedding failed ({len(batch)} queries): {error}")
+        for i, (_, fut) in enumerate(batch):
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(task.result()[i])
+
+    def stats(self) -> dict:
+        sizes = list(self._batch_sizes)
+        return {
+            "max_batch": self.max_batch,
+            "window_ms": round(self.window * 1000, 2),
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch_size_seen": max(sizes) if sizes else 0,
+        }
+
+
+class LatencyRecorder:
+    """记录最近 N 次耗时，输出 p50 / p99"""
+
+    def __init__(self, maxlen: int = 2000):
+        self._samples: Deque[float] = deque(maxlen=maxlen)
+
+    def record(self, start: float):
+        self._samples.append(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        data = sorted(self._samples)
+        if not data:
+            return {"count": 0, "avg": 0.0, "p50": 0.0, "p99": 0.0}
+        return {
+            "count": len(data),
+            "avg": round(sum(data) / len(data) * 1000, 2),
+            "p50": round(data[len(data) // 2] * 1000, 2),
+            "p99": round(data[min(len(data) - 1, int(len(data) * 0.99))] * 1000, 2),
+        }
@@ -1,18 +1,17 @@
 import os
+import threading
 from typing import List
-from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-from langchain_community.vectorstores import FAISS
 from loguru import logger
+from app.core.config import settings
+from app.core.ann_index import build_langchain_store
+from app.core.retrieval_cache import get_retrieval_cache, index_version
+
+from app.core.embedding_registry import get_embeddings
 
 # 1. 定义向量模型 (JD要求: BGE)
-# 第一次运行会自动从 HuggingFace 下载模型，约 100MB
-embedding_model = HuggingFaceBgeEmbeddings(
-    model_name="BAAI/bge-small-zh-v1.5",
-    model_kwargs={'device': 'cpu'},
-    encode_kwargs={'normalize_embeddings': True}
-)
+# 与博客知识库共用同一份模型，首次向量化时才加载 (第一次运行会自动从 HuggingFace 下载，约 100MB)
+embedding_model = get_embeddings()
 
 VECTOR_DB_PATH = "faiss_index"
 
@@ -20,16 +19,19 @@ VECTOR_DB_PATH = "faiss_index"
 class RAGEngine:
     def __init__(self):
         self.vector_store = None
+        self.cache = get_retrieval_cache("rag_engine")
         self._load_existing_index()
 
     def _load_existing_index(self):
         """尝试加载本地已保存的向量库"""
         if os.path.exists(VECTOR_DB_PATH):
+            from langchain_community.vectorstores import FAISS
             self.vector_store = FAISS.load_local(
                 VECTOR_DB_PATH,
                 embedding_model,
                 allow_dangerous_deserialization=True
             )
+            self.cache.bind_version(index_version(VECTOR_DB_PATH))
 
     def ingest_knowledge(self, text_content: str, source_name: str):
         """
@@ -49,10 +51,20 @@ class RAGEngine:
         if self.vector_store:
             self.vector_store.add_documents(docs)
         else:
-            self.vector_store = FAISS.from_documents(docs, embedding_model)
+            texts = [d.page_content for d in docs]
+            self.vector_store, _ = build_langchain_store(
+                settings.RAG_INDEX_SPEC,
+                list(zip(texts, embedding_model.embed_documents(texts))),
+                embedding_model,
+                [d.metadata for d in docs],
+                None,
+                settings.RAG_INDEX_SEARCH_PARAMS,
+            )
 
         # 4. 持久化保存
         self.vector_store.save_local(VECTOR_DB_PATH)
+        # 索引已变化，旧的检索结果随版本号一起失效
+        self.cache.bind_version(index_version(VECTOR_DB_PATH))
         logger.debug(f"✅ 已将 {len(docs)} 个片段存入向量库")
 
     def search(self, query: str, top_k: int = 3) -> List[str]:
@@ -62,14 +74,41 @@ class RAGEngine:
         if not self.vector_store:
             return []
 
-        # 相似度搜索
-        docs_and_scores = self.vector_store.similarity_search_with_score(query, k=top_k)
+        cached = self.cache.get_results(query, top_k)
+        if cached is not None:
+            return cached
+
+        # 相似度搜索 (相同 query 的向量直接复用)
+        vector = self.cache.get_embedding(query)
+        if vector is None:
+            vector = embedding_model.embed_query(query)
+            self.cache.set_embedding(query, vector)
+        docs_and_scores = self.vector_store.similarity_search_with_score_by_vector(vector, k=top_k)
 
         # 可以在这里加入 Rerank (重排序) 逻辑
         # ... Rerank code ...
 
-        return [doc.page_content for doc, score in docs_and_scores]
+        results = [doc.page_content for doc, score in docs_and_scores]
+        self.cache.set_results(query, top_k, results)
+        return results
+
+
+# 单例 (首次使用时才加载向量库)
+_rag_engine = None
+_rag_lock = threading.Lock()
+
+
+def get_rag_engine() -> RAGEngine:
+    global _rag_engine
+    if _rag_engine is None:
+        with _rag_lock:
+            if _rag_engine is None:
+                _rag_engine = RAGEngine()
+    return _rag_engine
 
 
-# 单例
-rag_engine = RAGEngine()
\ No newline at end of file
+def __getattr__(name):
+    # 兼容旧写法 `from app.core.rag_engine import rag_engine`
+    if name == "rag_engine":
+        return get_rag_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
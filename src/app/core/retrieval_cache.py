@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+from app.core.config import settings
+from app.utils.lru_cache import TTLLRUCache
+from app.utils.logger import logger
+
+
+def index_version(path: str) -> str:
+    """根据索引目录下文件的大小与修改时间生成版本号，索引重建后版本号随之变化"""
+    if not os.path.isdir(path):
+        return "missing"
+    h = hashlib.sha1()
+    for name in sorted(os.listdir(path)):
+        st = os.stat(os.path.join(path, name))
+        h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+class RetrievalCache:
+    """
+    两级检索缓存
+    - 一级：query -> 向量 (省掉 BGE 前向计算)
+    - 二级：(query, k, filters) -> 文档列表 (省掉向量化 + FAISS 搜索)
+    两级都绑定索引版本号：版本变化时整体失效，不会返回旧索引的结果。
+    """
+
+    def __init__(self, name: str, embed_size: int, result_size: int):
+        self.name = name
+        self.embeddings = TTLLRUCache(maxsize=embed_size)
+        self.results = TTLLRUCache(maxsize=result_size)
+        self.version: Optional[str] = None
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.split())
+
+    def bind_version(self, version: str):
+        """索引加载 / 变更后调用；版本号不同则清空两级缓存"""
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.invalidations += 1
+                logger.info(f"♻️ [Retrieval Cache:{self.name}] Index version {self.version} -> {version}, cache cleared")
+            self.version = version
+            self.embeddings.clear()
+            self.results.clear()
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return None
+        return self.embeddings.get(self._normalize(query))
+
+    def set_embedding(self, query: str, vector: List[float]):
+        if settings.RETRIEVAL_CACHE_ENABLED:
+            self.embeddings.set(self._normalize(query), vector)
+
+    @staticmethod
+    def _filters_key(filters: Optional[dict]) -> Hashable:
+        # 过滤取值可以是单个值或列表 (同字段 OR)，统一成有序元组
+        return tuple(sorted(
+            (field, tuple(sorted(map(str, v))) if isinstance(v, (list, tuple, set)) else (str(v),))
+            for field, v in (filters or {}).items()
+        ))
+
+    def _result_key(self, query: str, k: int, filters: Optional[dict]) -> Hashable:
+        return self.version, self._normalize(query), k, self._filters_key(filters)
+
+    def get_results(self, query: str, k: int, filters: Optional[dict] = None) -> Optional[List[Any]]:
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return None
+        docs = self.results.get(self._result_key(query, k, filters))
+        return list(docs) if docs is not None else None
+
+    def set_results(self, query: str, k: int, docs: List[Any], filters: Optional[dict] = None):
+        if settings.RETRIEVAL_CACHE_ENABLED:
+            self.results.set(self._result_key(query, k, filters), list(docs))
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.version,
+            "invalidations": self.invalidations,
+            "embedding": self.embeddings.stats(),
+            "result": self.results.stats(),
+        }
+
+
+_caches: Dict[str, RetrievalCache] = {}
+
+
+def get_retrieval_cache(name: str) -> RetrievalCache:
+    """每个检索入口 (博客知识库 / RAG 引擎 / 博客 CLI) 各用一个命名缓存"""
+    if name not in _caches:
+        _caches[name] = RetrievalCache(
+            name,
+            embed_size=settings.RETRIEVAL_EMBED_CACHE_SIZE,
+            result_size=settings.RETRIEVAL_RESULT_CACHE_SIZE,
+        )
+    return _caches[name]
+
+
+def get_retrieval_cache_stats() -> dict:
+    return {"enabled": settings.RETRIEVAL_CACHE_ENABLED, **{name: c.stats() for name, c in _caches.items()}}
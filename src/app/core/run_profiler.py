@@ -0,0 +1,212 @@
+import functools
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, List, Optional
+
+from app.utils.logger import logger
+
+
+class NodeSpan:
+    """单个节点的一次执行：墙钟时间 + 其中花在 LLM 上的时间"""
+
+    def __init__(self, node: str, start: float):
+        self.node = node
+        self.start = start
+        self.end: Optional[float] = None
+        self.llm_time = 0.0  # LLM 调用总耗时 (含排队)
+        self.queue_time = 0.0  # 其中在准入控制器排队的时间
+        self.llm_calls = 0
+        self.tokens = 0
+
+    @property
+    def wall(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "node": self.node,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "wall_ms": round(self.wall * 1000, 1),
+            "llm_ms": round(self.llm_time * 1000, 1),
+            "queue_ms": round(self.queue_time * 1000, 1),
+            "llm_calls": self.llm_calls,
+            "tokens": self.tokens,
+        }
+
+
+class RunTrace:
+    """一次 Graph 运行的全部节点耗时"""
+
+    def __init__(self, mode: str, **tags):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.mode = mode
+        self.tags = tags  # 例如 review_mode，用于对比不同策略
+        self.start = time.monotonic()
+        self.end: Optional[float] = None
+        self.spans: List[NodeSpan] = []
+        self.critical_path: List[str] = []
+        self.barriers: List[str] = []  # 关键路径上非依赖关系导致的等待 (superstep 屏障)
+
+    def compute_critical_path(self, dependencies: Dict[str, List[str]]) -> List[str]:
+        """
+        从最后结束的节点往回走：每一步选择 "在本节点开始前最晚结束的那次执行"，这条链就是关键路径。
+        LangGraph 按 superstep 同步推进，节点要等上一步所有节点结束才会启动，
+        所以真正卡住它的未必是声明的上游依赖；这种情况记为 barrier 等待。
+        """
+        done = [s for s in self.spans if s.end is not None]
+        if not done:
+            return []
+        current = max(done, key=lambda s: s.end)
+        path = [current]
+        self.barriers = []
+        while True:
+            # 结束时间必须严格早于当前节点，否则几乎瞬时完成的节点 (缓存命中、检索) 之间会互相回指形成死循环
+            candidates = [s for s in done if s.end < current.end and s.end <= current.start + 1e-3]
+            if not candidates:
+                break
+            blocker = max(candidates, key=lambda s: s.end)
+            if blocker.node not in dependencies.get(current.node, []):
+                self.barriers.append(f"{blocker.node} -> {current.node}")
+            current = blocker
+            path.append(current)
+        return [s.node for s in reversed(path)]
+
+    @property
+    def total(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+    @property
+    def tokens(self) -> int:
+        return sum(s.tokens for s in self.spans)
+
+    @property
+    def iterations(self) -> int:
+        """技术题生成轮数 (tech_lead 执行次数)"""
+        return sum(1 for s in self.spans if s.node == "tech_lead")
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "mode": self.mode,
+            "tags": self.tags,
+            "total_ms": round(self.total * 1000, 1),
+            "iterations": self.iterations,
+            "tokens": self.tokens,
+            "critical_path": self.critical_path,
+            "barriers": self.barriers,
+            "spans": [s.to_dict(self.start) for s in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[RunTrace]] = ContextVar("run_trace", default=None)
+_current_span: ContextVar[Optional[NodeSpan]] = ContextVar("node_span", default=None)
+
+_recent_runs: Deque[RunTrace] = deque(maxlen=100)
+_lock = threading.Lock()
+
+
+def start_run(mode: str, **tags) -> RunTrace:
+    trace = RunTrace(mode, **tags)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_run(trace: RunTrace, dependencies: Dict[str, List[str]]):
+    trace.end = time.monotonic()
+    trace.critical_path = trace.compute_critical_path(dependencies)
+    with _lock:
+        _recent_runs.append(trace)
+    logger.debug(f"⏱️ [Profiler] Run {trace.run_id} ({trace.mode}) "
+                 f"{(trace.end - trace.start) * 1000:.0f}ms, critical path: {' -> '.join(trace.critical_path)}")
+
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """包装 Graph 节点：记录节点墙钟时间，并让节点内的 LLM 调用把耗时记到该节点上"""
+
+    @functools.wraps(fn)
+    async def wrapper(state):
+        trace = _current_trace.get()
+        if trace is None:
+            return await fn(state)
+        span = NodeSpan(name, time.monotonic())
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            return await fn(state)
+        finally:
+            span.end = time.monotonic()
+            _current_span.reset(token)
+
+    return wrapper
+
+
+def record_llm_call(elapsed: float, queued: float = 0.0, tokens: int = 0):
+    """由 LLM 客户端在每次调用结束时调用"""
+    span = _current_span.get()
+    if span is not None:
+        span.llm_time += elapsed
+        span.queue_time += queued
+        span.llm_calls += 1
+        span.tokens += tokens
+
+
+def get_profile_report(limit: int = 50) -> dict:
+    """最近 N 次运行的节点耗时汇总 + 各节点出现在关键路径上的比例"""
+    with _lock:
+        runs = list(_recent_runs)[-limit:]
+
+    nodes: Dict[str, dict] = {}
+    for run in runs:
+        for span in run.spans:
+            agg = nodes.setdefault(span.node, {"executions": 0, "wall": 0.0, "llm": 0.0, "queue": 0.0,
+                                               "tokens": 0, "on_critical_path": 0})
+            agg["executions"] += 1
+            agg["tokens"] += span.tokens
+            agg["wall"] += span.wall
+            agg["llm"] += span.llm_time
+            agg["queue"] += span.queue_time
+        for node in set(run.critical_path):
+            if node in nodes:
+                nodes[node]["on_critical_path"] += 1
+
+    summary = {}
+    for node, agg in nodes.items():
+        n = agg["executions"]
+        summary[node] = {
+            "executions": n,
+            "avg_wall_ms": round(agg["wall"] / n * 1000, 1),
+            "avg_llm_ms": round(agg["llm"] / n * 1000, 1),
+            "avg_queue_ms": round(agg["queue"] / n * 1000, 1),
+            "avg_tokens": round(agg["tokens"] / n, 1),
+            "critical_path_share": round(agg["on_critical_path"] / len(runs), 3) if runs else 0.0,
+        }
+
+    # 按策略标签分组 (如 review_mode=targeted/full)，对比每次运行的轮数、token 与耗时
+    by_strategy: Dict[str, dict] = {}
+    for run in runs:
+        label = ",".join(f"{k}={v}" for k, v in sorted(run.tags.items())) or "default"
+        agg = by_strategy.setdefault(label, {"runs": 0, "iterations": 0, "tokens": 0, "total": 0.0})
+        agg["runs"] += 1
+        agg["iterations"] += run.iterations
+        agg["tokens"] += run.tokens
+        agg["total"] += run.total
+    strategies = {
+        label: {
+            "runs": agg["runs"],
+            "avg_iterations": round(agg["iterations"] / agg["runs"], 2),
+            "avg_tokens": round(agg["tokens"] / agg["runs"], 1),
+            "avg_total_ms": round(agg["total"] / agg["runs"] * 1000, 1),
+        }
+        for label, agg in by_strategy.items()
+    }
+
+    return {
+        "runs": len(runs),
+        "avg_total_ms": round(sum(r.total for r in runs) / len(runs) * 1000, 1) if runs else 0.0,
+        "strategies": strategies,
+        "nodes": summary,
+        "recent": [r.to_dict() for r in runs[-5:]],
+    }
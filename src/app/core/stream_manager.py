@@ -12,6 +12,14 @@ def init_stream_queue():
     _msg_queue.set(q)
     return q
 
+def bind_stream_sink(sink):
+    """
+    把当前上下文的消息输出绑定到任意带 async put() 的对象
+    (例如 single-flight 的广播器，一份事件分发给多个订阅者)
+    """
+    _msg_queue.set(sink)
+    return sink
+
 def get_stream_queue() -> Optional[asyncio.Queue]:
     """获取当前请求的队列"""
     return _msg_queue.get()
@@ -27,4 +35,21 @@ async def send_thought(step: str, detail: str = ""):
             "type": "thought",
             "content": f"{step} {detail}".strip()
         }
-        await q.put(data)
\ No newline at end of file
+        await q.put(data)
+
+async def send_question(question, source: str, version: Optional[int] = None):
+    """
+    单道题目生成完毕即推送给前端 (不必等整组题目生成完)
+    :param source: "tech" | "hr"
+    :param version: 技术题的版本号 (质检打回重写时递增)
+    """
+    q = get_stream_queue()
+    if q:
+        data = {
+            "type": "question",
+            "source": source,
+            "content": question.model_dump() if hasattr(question, "model_dump") else question
+        }
+        if version is not None:
+            data["version"] = version
+        await q.put(data)
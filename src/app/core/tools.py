@@ -1,5 +1,5 @@
 from langchain_core.tools import tool
-from app.core.knowledge_base import kb_engine
+from app.core.knowledge_base import get_kb_engine
 from app.chains.company_research import research_company
 
 # 1. 定义查博客工具
@@ -13,7 +13,7 @@ def search_blog_tool(query: str) -> str:
     # 注意：这里是同步调用，生产环境可用 async 工具
     import asyncio
     # 临时封装一下异步调用
-    result = asyncio.run(kb_engine.search(query))
+    result = asyncio.run(get_kb_engine().search(query))
     return result["context"]
 
 # 2. 定义查公司工具
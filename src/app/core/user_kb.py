@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.context_packer import with_similarity
+from app.core.index_versions import IndexGeneration, new_version_dir, publish_version, resolve_index_dir
+from app.utils.logger import logger
+
+# ==========================================
+# 用户私有知识库 (上传的简历 / 笔记)
+# ==========================================
+# 每个用户一个独立的小索引，格式与博客库相同 (mmap 索引 + SQLite 文档库 + BM25)，同样版本化存储：
+#   user_kb_index/<user_id>/CURRENT + versions/<版本>/
+# 上传文档 -> parse_resume_file 解析文本 -> 切片向量化 -> 与该用户已有片段一起写出新版本 (同名文件覆盖旧片段)。
+# 检索时按需加载到进程内的 LRU：常驻索引总大小超过 USER_KB_MEMORY_BUDGET_MB 时淘汰最久未用的用户，
+# 被淘汰的索引等进行中的检索结束后才关闭 (与博客库热切换共用 IndexGeneration 的引用计数)。
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+KEEP_USER_VERSIONS = 2
+
+
+def user_kb_root() -> str:
+    return settings.USER_KB_DIR or os.path.join(_PROJECT_ROOT, "user_kb_index")
+
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(user_kb_root(), str(int(user_id)))
+
+
+def user_kb_version(user_id: int) -> str:
+    """用户私有库的当前版本 (报告缓存 key 的一部分：上传新资料后，引用旧资料的报告自动失效)"""
+    if not settings.USER_KB_ENABLED:
+        return "disabled"
+    return resolve_index_dir(_user_dir(user_id))[1]
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in files)
+    return total
+
+
+# --- 写入 ---
+_write_locks: Dict[int, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _write_lock(user_id: int):
+    """
+    同一用户的 读 CURRENT -> 合并 -> 发布 必须串行：进程内用线程锁，
+    多个 uvicorn worker 之间用用户目录下 .lock 文件上的 flock (Windows 没有 fcntl，只有进程内互斥)
+    """
+    with _write_locks_guard:
+        thread_lock = _write_locks.setdefault(user_id, threading.Lock())
+    with thread_lock:
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        root = _user_dir(user_id)
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def add_user_document(user_id: int, text: str, source: Optional[str], doc_type: str = "note") -> dict:
+    """
+    把一篇文档写入用户私有库 (同步阻塞：切片 + 向量化 + 写盘，请在线程中调用)
+    已有片段的向量直接从旧索引中取回，不重新计算；同名文档的旧片段会被替换
+    source 为空 (上传时没有文件名) 时生成一个 upload-<随机串> 的名字
+    """
+    import faiss
+    import numpy as np
+
+    from app.blog.chunking import make_splitters
+    from app.core.embedding_registry import get_embeddings
+    from app.core.mmap_store import MmapVectorStore, has_mmap_store, write_mmap_store
+
+    source = source or f"upload-{uuid.uuid4().hex[:8]}"
+    _, text_splitter = make_splitters()
+    chunks = [c for c in text_splitter.split_text(text) if c.strip()]
+    if not chunks:
+        raise ValueError("文档内容为空")
+
+    embeddings = get_embeddings()
+    root = _user_dir(user_id)
+    with _write_lock(user_id):
+        # 1. 已有片段 (去掉同名文档的旧片段)
+        current_dir, _ = resolve_index_dir(root)
+        rows, vectors = [], []
+        if has_mmap_store(current_dir):
+            old = MmapVectorStore.load(current_dir, embeddings)
+            old_vectors = old.index.reconstruct_n(0, old.index.ntotal)
+            for pos, doc_id, chunk, meta in old.rows():
+                if meta.get("source") != source:
+                    rows.append((doc_id, chunk, meta))
+                    vectors.append(old_vectors[pos])
+            old.close()
+        if len(rows) + len(chunks) > settings.USER_KB_MAX_CHUNKS:
+            raise ValueError(f"私有知识库片段数超过上限 ({settings.USER_KB_MAX_CHUNKS})")
+
+        # 2. 新文档切片向量化
+        prefix = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+        meta = {"source": source, "doc_type": doc_type, "uploaded_at": int(time.time())}
+        rows.extend((f"{prefix}-{i}", chunk, dict(meta)) for i, chunk in enumerate(chunks))
+        vectors.extend(np.asarray(embeddings.embed_documents(chunks), dtype="float32"))
+
+        # 3. 写出新版本并切换 CURRENT (用户库很小，Flat 精确检索即可)
+        matrix = np.stack(vectors).astype("float32")
+        index = faiss.IndexFlatL2(matrix.shape[1])
+        index.add(matrix)
+        out_dir, version = new_version_dir(root)
+        write_mmap_store(out_dir, index, [(pos, doc_id, chunk, m) for pos, (doc_id, chunk, m) in enumerate(rows)])
+        publish_version(root, version, keep=KEEP_USER_VERSIONS)
+    user_index_cache.invalidate(user_id)  # 旧版本不再常驻，下次检索加载新版本
+
+    logger.info(f"📒 [UserKB] user={user_id} indexed {source} ({len(chunks)} chunks, {len(rows)} total) -> {version}")
+    return {"source": source, "chunks": len(chunks), "total_chunks": len(rows), "version": version}
+
+
+def list_user_documents(user_id: int) -> List[dict]:
+    """用户私有库中的文档 (按来源汇总片段数)"""
+    generation = user_index_cache.acquire(user_id)
+    if generation is None:
+        return []
+    try:
+        docs: Dict[str, dict] = {}
+        for _, _, _, meta in generation.store.rows():
+            entry = docs.setdefault(meta.get("source"), {"source": meta.get("source"), "doc_type": meta.get("doc_type"),
+                                                         "uploaded_at": meta.get("uploaded_at"), "chunks": 0})
+            entry["chunks"] += 1
+        return list(docs.values())
+    finally:
+        generation.release()
+
+
+# --- 按需加载 + LRU 常驻 ---
+class UserIndexCache:
+    """user_id -> 已加载的索引版本；按索引文件大小累计常驻字节数，超出预算淘汰最久未用的用户"""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[int, IndexGeneration]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._retired: List[IndexGeneration] = []
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def acquire(self, user_id: int) -> Optional[IndexGeneration]:
+        """
+        取得用户当前版本的索引 (引用计数 +1，用完 release)；该用户没有私有库时返回 None
+        同步阻塞 (未命中时加载索引)，事件循环中请用 asyncio.to_thread 调用
+        """
+        from app.core.mmap_store import MmapVectorStore, has_mmap_store
+
+        path, version = resolve_index_dir(_user_dir(user_id))
+        with self._lock:
+            generation = self._entries.get(user_id)
+            if generation is not None and generation.version == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return generation.acquire()
+        if not has_mmap_store(path):
+            return None
+
+        from app.core.embedding_registry import get_embeddings
+
+        loaded = IndexGeneration(version, path, MmapVectorStore.load(path, get_embeddings()))
+        size = _dir_bytes(path)
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is not None and current.version == version:
+                # 并发加载了同一版本：保留先放进去的那份
+                duplicate, loaded = loaded, current
+            else:
+                duplicate = current  # 旧版本 (用户上传了新文档) 或 None
+                self._entries[user_id] = loaded
+                self._sizes[user_id] = size
+                self.loads += 1
+            self._entries.move_to_end(user_id)
+            result = loaded.acquire()
+            evicted = self._evict_over_budget(keep=user_id)
+        for generation in ([duplicate] if duplicate is not None else []) + evicted:
+            self._retire(generation)
+        return result
+
+    def _evict_over_budget(self, keep: int) -> List[IndexGeneration]:
+        """在锁内调用：淘汰最久未用的用户直到回到预算内 (刚访问的用户即使单独超预算也保留)"""
+        evicted = []
+        while self.resident_bytes > self.budget_bytes and len(self._entries) > 1:
+            user_id, generation = next(iter(self._entries.items()))
+            if user_id == keep:
+                break
+            del self._entries[user_id]
+            self._sizes.pop(user_id, None)
+            self.evictions += 1
+            evicted.append(generation)
+        return evicted
+
+    def _retire(self, generation: IndexGeneration):
+        self._retired = [g for g in self._retired if g.store is not None] + [generation]
+        generation.retire()
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            generation = self._entries.pop(user_id, None)
+            self._sizes.pop(user_id, None)
+        if generation is not None:
+            self._retire(generation)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident_users": len(self._entries),
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "draining": [g.info() for g in self._retired if g.store is not None],
+            }
+
+
+user_index_cache = UserIndexCache(settings.USER_KB_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+async def search_user_documents(user_id: int, query: str, top_k: int = 2) -> list:
+    """
+    在用户私有库中检索 (向量检索，查询向量与博客库共用缓存和合批)；没有私有库或失败时返回空列表
+    返回的片段来源加上 "我的资料/" 前缀 (与博客文章区分，引用时一目了然)，并带 metadata["scope"] = "private"
+    """
+    from app.core.ann_index import to_similarity
+    from app.core.knowledge_base import get_kb_engine
+
+    try:
+        generation = await asyncio.to_thread(user_index_cache.acquire, user_id)
+    except Exception as e:
+        logger.error(f"❌ [UserKB] Failed to load index for user {user_id}: {e}")
+        return []
+    if generation is None:
+        return []
+    try:
+        kb = await asyncio.to_thread(get_kb_engine)
+        vector = await kb.aembed_query(query)
+        store = generation.store
+        loop = asyncio.get_running_loop()
+        hits = await loop.run_in_executor(kb.executor, store.similarity_search_with_score_by_vector, vector, top_k)
+        docs = [with_similarity(doc, to_similarity(store.index, score)) for doc, score in hits]
+        for doc in docs:
+            doc.metadata.update(source=f"我的资料/{doc.metadata.get('source', '未知来源')}", scope="private")
+        return docs
+    except Exception as e:
+        logger.error(f"❌ [UserKB] Search failed for user {user_id}: {e}")
+        return []
+    finally:
+        generation.release()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Tuple
+
+from app.utils.logger import logger
+
+# ==========================================
+# 启动预热与就绪状态
+# ==========================================
+# import app.main 不再加载任何模型；lifespan 调用 run_warmup() 依次把重型子系统加载好：
+#   embeddings  共享的 BGE 模型 (加载 + 一次前向计算)
+#   kb          博客知识库 (mmap 索引 + 检索线程池)
+#   tokenizer   检索上下文打包用的 tiktoken 编码 (首次要下载 BPE 文件)
+#   graph       编译 LangGraph (同时导入全部节点与链)
+# /readyz 根据这里记录的状态判断 worker 是否可以接流量。
+
+
+def _warm_embeddings():
+    from app.core.embedding_registry import warmup_embeddings
+    warmup_embeddings()
+
+
+def _warm_kb():
+    from app.core.knowledge_base import get_kb_engine
+    get_kb_engine()
+
+
+def _warm_tokenizer():
+    from app.core.context_packer import load_encoding
+    # 离线等加载失败的情况不阻塞就绪：打包时退回估算 token 数，之后按需重试
+    load_encoding()
+
+
+def _warm_graph():
+    from app.graph.workflow import get_app_graph
+    get_app_graph()
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("embeddings", _warm_embeddings),
+    ("kb", _warm_kb),
+    ("tokenizer", _warm_tokenizer),
+    ("graph", _warm_graph),
+]
+
+_components: Dict[str, dict] = {name: {"ready": False, "seconds": None, "error": None} for name, _ in WARMUP_STEPS}
+_state = {"started_at": None, "finished_at": None}
+
+
+async def run_warmup():
+    """在线程中逐个预热 (模型加载是同步阻塞的)；单个子系统失败只记录错误，不影响其余子系统"""
+    _state["started_at"] = time.time()
+    logger.info("🔥 [Warmup] Loading heavy subsystems...")
+    for name, step in WARMUP_STEPS:
+        start = time.time()
+        try:
+            await asyncio.to_thread(step)
+            _components[name].update(ready=True, error=None)
+        except Exception as e:
+            _components[name]["error"] = str(e)
+            logger.error(f"❌ [Warmup] {name} failed: {e}")
+        _components[name]["seconds"] = round(time.time() - start, 2)
+    _state["finished_at"] = time.time()
+    logger.success(f"✅ [Warmup] Done in {_state['finished_at'] - _state['started_at']:.1f}s: "
+                   f"{ {name: c['seconds'] for name, c in _components.items()} }")
+
+
+def mark_ready_without_warmup():
+    """STARTUP_WARMUP=off：各子系统由首个请求懒加载，worker 启动后即视为就绪"""
+    _state["started_at"] = _state["finished_at"] = time.time()
+    for component in _components.values():
+        component.update(ready=True, skipped=True)
+
+
+def readiness() -> dict:
+    from app.core.knowledge_base import get_kb_engine, is_kb_initialized
+
+    return {
+        "ready": _state["finished_at"] is not None and all(c["ready"] for c in _components.values()),
+        "warming_up": _state["started_at"] is not None and _state["finished_at"] is None,
+        "components": _components,
+        # 当前生效的知识库索引版本 (热切换后随之变化；知识库未加载时为 None)
+        "index_version": get_kb_engine().index_version if is_kb_initialized() else None,
+    }
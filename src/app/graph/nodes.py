@@ -1,15 +1,52 @@
+import asyncio
+
+from sqlmodel import Session
+
 from app.core.graph_state import AgentState
+from app.core.config import settings
+from app.core.db_auth import engine
 from app.core.llm_factory import get_llm
+from app.core.jd_semantic_cache import jd_semantic_cache
+from app.core.jd_meta_channel import publish_jd_meta, wait_jd_meta
+from app.core.knowledge_base import format_context, get_kb_engine
+from app.core.user_kb import search_user_documents
+from app.core.memory import get_recent_chat_history
+from app.services.memory_service import get_user_profile_str
 from app.chains.jd_parser import parse_jd_async
 from app.chains.company_research import research_company
 from app.chains.tech_gen import generate_tech_async
 from app.chains.hr_gen import generate_hr_async
+from app.schemas.interview import JDMetaData
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
+import re
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field, field_validator
 from loguru import logger
 # ✅ 引入我们刚才写的工具
-from app.core.stream_manager import send_thought
+from app.core.stream_manager import send_thought, send_question
+
+
+async def _parse_jd_with_semantic_cache(jd_text: str) -> JDMetaData:
+    """先查 JD 语义近重复缓存，未命中再调用 LLM 解析并写回缓存"""
+    if not settings.JD_SEMANTIC_CACHE_ENABLED:
+        return await parse_jd_async(jd_text)
+
+    try:
+        cached, score, vec = await jd_semantic_cache.lookup(jd_text)
+    except Exception as e:
+        logger.warning(f"⚠️ [JD Cache] Lookup failed: {e}")
+        return await parse_jd_async(jd_text)
+
+    if cached is not None:
+        logger.debug(f"♻️ [Agent: Parser] 命中相似 JD (similarity={score:.3f})，复用解析结果")
+        await send_thought("♻️ 发现高度相似的历史 JD", f"相似度 {score:.2f}，复用解析结果")
+        jd_semantic_cache.schedule_audit(jd_text, cached, parse_jd_async)
+        return cached
+
+    meta = await parse_jd_async(jd_text)
+    jd_semantic_cache.add(vec, meta)
+    return meta
 
 
 # --- Node 1: JD Parser ---
@@ -18,7 +55,9 @@ async def jd_parser_node(state: AgentState):
     logger.debug("🔍 [Agent: Parser] 正在分析 JD...")
     await send_thought("🔍 正在深度解析岗位 JD...", "提取技术栈与硬性要求")
 
-    meta = await parse_jd_async(state["jd_text"])
+    meta = await _parse_jd_with_semantic_cache(state["jd_text"])
+    # 通知并行运行的 Retriever：技术栈已知，可以追加关键词检索
+    publish_jd_meta(meta)
     return {
         "company_name": meta.company_name,
         "tech_stack": meta.tech_stack,
@@ -27,84 +66,445 @@ async def jd_parser_node(state: AgentState):
     }
 
 
+# --- Node 1.5: Retriever (与 Parser 并行) ---
+def _load_user_context(user_id: int) -> Tuple[List[str], str]:
+    with Session(engine) as db:
+        return get_recent_chat_history(db, user_id), get_user_profile_str(db, user_id)
+
+
+def _merge_documents(groups: List[list], limit: int) -> list:
+    """各路检索结果按名次轮流合并并去重：原始 JD 的结果优先，每个关键词至少能贡献一条"""
+    seen, merged = set(), []
+    for rank in range(max((len(g) for g in groups), default=0)):
+        for docs in groups:
+            if rank < len(docs) and docs[rank].page_content not in seen:
+                seen.add(docs[rank].page_content)
+                merged.append(docs[rank])
+    return merged[:limit]
+
+
+async def _retrieve_kb(jd_text: str, user_id: int) -> dict:
+    """
+    先用原始 JD 检索；Parser 解析出技术栈后再追加关键词检索 (与原始检索并发，查询向量自动合批)
+    用户私有库 (上传的简历 / 笔记) 同时用原始 JD 检索，结果排在博客库原始检索之后、关键词检索之前
+    """
+    kb = await asyncio.to_thread(get_kb_engine)
+    private_task = None
+    if settings.USER_KB_ENABLED and user_id:
+        private_task = asyncio.create_task(search_user_documents(user_id, jd_text, settings.USER_KB_TOP_K))
+    raw_task = None
+    if kb.vector_store is not None:
+        raw_task = asyncio.create_task(kb.search_documents(jd_text, settings.KB_RETRIEVAL_TOP_K))
+    try:
+        groups = []
+        if raw_task is not None:
+            meta = await wait_jd_meta(timeout=settings.LLM_REQUEST_TIMEOUT)
+            keywords = [k for k in (meta.tech_stack if meta else []) if k.strip()][:settings.KB_REFINE_KEYWORDS]
+            groups = list(await asyncio.gather(
+                raw_task, *[kb.search_documents(k, settings.KB_REFINE_TOP_K) for k in keywords]
+            ))
+        if private_task is not None:
+            groups.insert(1 if groups else 0, await private_task)
+    finally:
+        for task in (raw_task, private_task):
+            if task is not None:
+                task.cancel()
+    return format_context(_merge_documents(groups, settings.KB_CONTEXT_MAX_CHUNKS))
+
+
+async def retriever_node(state: AgentState):
+    """预取 tech_lead 需要的全部上下文：博客知识库片段、最近对话、用户画像 (不在关键路径上)"""
+    logger.debug("📚 [Agent: Retriever] 正在预取知识库与用户上下文...")
+
+    async def _no_kb():
+        return {"context": "", "sources": []}
+
+    kb_result, user_ctx = await asyncio.gather(
+        _retrieve_kb(state["jd_text"], state["user_id"]) if settings.KB_RETRIEVAL_ENABLED else _no_kb(),
+        asyncio.to_thread(_load_user_context, state["user_id"]),
+        return_exceptions=True,
+    )
+    if isinstance(kb_result, Exception):
+        logger.warning(f"⚠️ [Agent: Retriever] 知识库检索失败: {kb_result}")
+        kb_result = {"context": "", "sources": []}
+    if isinstance(user_ctx, Exception):
+        logger.warning(f"⚠️ [Agent: Retriever] 读取用户上下文失败: {user_ctx}")
+        user_ctx = ([], "")
+
+    if kb_result["sources"]:
+        await send_thought("📚 命中个人博客笔记", "、".join(kb_result["sources"]))
+
+    chat_history, user_profile = user_ctx
+    return {
+        "kb_context": kb_result["context"],
+        "reference_sources": kb_result["sources"],
+        "chat_history": chat_history,
+        "user_profile": user_profile,
+    }
+
+
 # --- Node 2: Researcher ---
 async def researcher_node(state: AgentState):
     company = state.get("company_name", "目标公司")
     logger.debug(f"🕵️ [Agent: Researcher] 正在背调: {company}")
     await send_thought(f"🕵️ 正在进行全网背调: {company}", "检索新闻、财报与业务动态")
 
-    info = await research_company(company)
+    if settings.GRAPH_TOPOLOGY != "rich":
+        info = await research_company(company)
+        return {"company_info": info}
+
+    # rich 模式下 HR 要等背调结果，给背调设置截止时间，避免拖长关键路径
+    try:
+        info = await asyncio.wait_for(research_company(company), timeout=settings.RESEARCH_DEADLINE)
+    except asyncio.TimeoutError:
+        logger.warning(f"⏰ [Agent: Researcher] 背调超过 {settings.RESEARCH_DEADLINE}s，跳过")
+        await send_thought("⏰ 背调超时", "HR 将不带公司背景继续出题")
+        info = ""
     return {"company_info": info}
 
 
+def _rewrite_feedback(state: AgentState) -> str:
+    """把未通过质检的题目与评语 (以及人工意见) 整理成重写提示"""
+    lines = []
+    for review in state.get("question_reviews") or []:
+        if review["score"] < settings.REVIEW_PASS_SCORE:
+            lines.append(f"- Q: {review['question']}\n  问题: {review['comment'] or '质量不达标'}")
+    if state.get("human_feedback"):
+        lines.append(f"- 人工意见: {state['human_feedback']}")
+    return "\n".join(lines)
+
+
 # --- Node 3: Tech Lead ---
 async def tech_lead_node(state: AgentState):
     iteration = state.get("iteration_count", 0)
     logger.debug(f"💻 [Agent: TechLead] 开始出题 (第 {iteration + 1} 版)...")
-    await send_thought(f"💻 技术面试官正在出题 (v{iteration + 1})", "基于技术栈构建硬核问题")
 
-    questions = await generate_tech_async(
-        state["tech_stack"],
-        state["years_required"]
-    )
+    # targeted 模式：已通过质检的题目保持不变，只补齐不合格的题目
+    accepted = list(state.get("accepted_questions") or []) if settings.REVIEW_MODE == "targeted" else []
+    count = max(settings.TECH_QUESTION_COUNT - len(accepted), 0)
+    feedback = _rewrite_feedback(state) if iteration > 0 else ""
 
-    return {
-        "tech_questions": questions,
-        "iteration_count": iteration + 1,
-        "human_feedback": None
+    if accepted:
+        await send_thought(f"💻 技术面试官正在重写不合格题目 (v{iteration + 1})",
+                           f"保留 {len(accepted)} 道已通过的题目，重写 {count} 道")
+    else:
+        await send_thought(f"💻 技术面试官正在出题 (v{iteration + 1})", "基于技术栈构建硬核问题")
+
+    async def _push(q):
+        await send_question(q, "tech", version=iteration + 1)
+
+    # Retriever 预取的知识库片段、对话记录与用户画像
+    context = {
+        "kb_context": state.get("kb_context") or "",
+        "chat_history": state.get("chat_history") or [],
+        "user_profile": state.get("user_profile") or "",
     }
 
+    update = {"iteration_count": iteration + 1, "human_feedback": None, "tech_candidates": []}
+    if count == 0:
+        update["tech_questions"] = accepted
+        return update
+
+    if settings.TECH_CANDIDATES_N <= 1:
+        new_questions = await generate_tech_async(
+            state["tech_stack"],
+            state["years_required"],
+            count=count,
+            feedback=feedback,
+            on_question=_push,
+            **context
+        )
+        update["tech_questions"] = accepted + list(new_questions)
+        return update
+
+    # Best-of-N：不同温度并发生成多组候选，由质检员一次批量打分选出最优 (选定后再推给前端)
+    temps = settings.TECH_CANDIDATE_TEMPERATURES or [0.7]
+    results = await asyncio.gather(*[
+        generate_tech_async(
+            state["tech_stack"],
+            state["years_required"],
+            count=count,
+            feedback=feedback,
+            temperature=temps[i % len(temps)],
+            **context
+        )
+        for i in range(settings.TECH_CANDIDATES_N)
+    ], return_exceptions=True)
+
+    candidates = []
+    for i, r in enumerate(results):
+        if isinstance(r, Exception):
+            logger.warning(f"⚠️ [Agent: TechLead] 候选 {i} 生成失败: {r}")
+            continue
+        candidates.append(accepted + list(r))
+    if not candidates:
+        raise results[0]
+
+    update["tech_questions"] = candidates[0]
+    update["tech_candidates"] = candidates if len(candidates) > 1 else []
+    return update
+
 
 # --- Node 4: HR Agent ---
 async def hr_node(state: AgentState):
     logger.debug("👔 [Agent: HR] 正在生成行为面试题...")
     await send_thought("👔 HR 正在构建行为面试题", "结合 STAR 法则与企业文化")
 
+    async def _push(q):
+        await send_question(q, "hr")
+
+    # fast 模式下 HR 与背调并行，此时还拿不到公司信息
+    company_info = (state.get("company_info") or "") if settings.GRAPH_TOPOLOGY == "rich" else ""
+
     questions = await generate_hr_async(
         ["沟通能力", "抗压能力"],
-        state.get("company_info", "")
+        company_info,
+        on_question=_push
     )
     return {"hr_questions": questions}
 
 
 # --- Node 5: Reviewer ---
+class QuestionReview(BaseModel):
+    index: int = Field(description="题目序号，从 0 开始")
+    score: int = Field(description="该题 0-100分")
+    comment: str = Field(description="该题的修改建议，合格则留空")
+
+
 class ReviewResult(BaseModel):
     score: int = Field(description="0-100分")
     comment: str = Field(description="具体的修改建议，如果满分则留空")
+    reviews: List[QuestionReview] = Field(default_factory=list, description="逐题评分，每道题一条")
 
 
-async def reviewer_node(state: AgentState):
-    logger.debug("⚖️ [Agent: QA] 正在审核题目质量...")
-    await send_thought("⚖️ 质检员正在审核题目质量", "评估深度、准确性与匹配度")
+class CandidateReview(ReviewResult):
+    candidate: int = Field(description="候选组序号，从 0 开始")
 
-    llm = get_llm(temperature=0.1)
+
+class BatchReviewResult(BaseModel):
+    candidates: List[CandidateReview] = Field(description="每组候选题一条评审结果")
+
+
+def _to_score(value) -> Optional[int]:
+    """LLM 给出的分数可能是 85 / "85" / "85分" / null：取出数字并限制在 0-100，无法解析时为 None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return max(0, min(100, int(value)))
+    match = re.search(r"\d+(?:\.\d+)?", str(value))
+    return max(0, min(100, int(float(match.group())))) if match else None
+
+
+def _to_int(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    match = re.search(r"\d+", str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+
+class _ParsedQuestionReview(BaseModel):
+    """逐题评分的宽松校验：字段缺失或格式不对时置空，不让整个 Graph 运行失败"""
+    index: Optional[int] = None
+    score: Optional[int] = None
+    comment: str = ""
+
+    @field_validator("index", mode="before")
+    @classmethod
+    def _parse_index(cls, v):
+        return _to_int(v)
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _parse_score(cls, v):
+        return _to_score(v)
+
+    @field_validator("comment", mode="before")
+    @classmethod
+    def _parse_comment(cls, v):
+        return "" if v is None else str(v)
+
+
+class _ParsedReview(BaseModel):
+    score: Optional[int] = None
+    comment: str = ""
+    reviews: List[_ParsedQuestionReview] = Field(default_factory=list)
+    candidate: Optional[int] = None
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _parse_score(cls, v):
+        return _to_score(v)
+
+    @field_validator("comment", mode="before")
+    @classmethod
+    def _parse_comment(cls, v):
+        return "" if v is None else str(v)
+
+    @field_validator("candidate", mode="before")
+    @classmethod
+    def _parse_candidate(cls, v):
+        return _to_int(v)
+
+    @field_validator("reviews", mode="before")
+    @classmethod
+    def _parse_reviews(cls, v):
+        return [r for r in v if isinstance(r, dict)] if isinstance(v, list) else []
+
+
+def _validate_review(raw) -> dict:
+    """
+    校验 LLM 返回的评审 JSON：单题分数缺失时按整体分处理 (见 _collect_reviews)；
+    整体分缺失时取单题最低分，两者都没有则视为解析失败 (ValueError)
+    """
+    parsed = _ParsedReview.model_validate(raw if isinstance(raw, dict) else {})
+    if parsed.score is None:
+        scores = [r.score for r in parsed.reviews if r.score is not None]
+        if not scores:
+            raise ValueError(f"review without any score: {raw!r}")
+        parsed.score = min(scores)
+    return parsed.model_dump()
+
+
+def _question_text(q) -> str:
+    return q.question if hasattr(q, "question") else str(q.get("question", q))
+
+
+def _format_questions(questions) -> str:
+    return "\n".join(f"[{i}] {q}" for i, q in enumerate(questions))
+
+
+def _collect_reviews(result: dict, to_review, pinned_reviews: List[dict]) -> List[dict]:
+    """合并逐题评分：已固定题目沿用原评分，新题缺失的评分按整体分处理 (result 已经过 _validate_review)"""
+    per_question = {r["index"]: r for r in result["reviews"] if r["index"] is not None}
+    reviews = [{**r, "index": i} for i, r in enumerate(pinned_reviews)]
+    for i, q in enumerate(to_review):
+        r = per_question.get(i, {})
+        reviews.append({
+            "index": len(pinned_reviews) + i,
+            "score": result["score"] if r.get("score") is None else r["score"],
+            "comment": r.get("comment", ""),
+            "question": _question_text(q),
+        })
+    return reviews
+
+
+def _effective_score(result: dict, reviews: List[dict]) -> int:
+    # targeted 模式下每道题都达标才算通过，取最低的单题分
+    if settings.REVIEW_MODE == "targeted" and reviews:
+        return min(r["score"] for r in reviews)
+    return result["score"]
+
+
+async def _review_single(llm, to_review, level: str) -> dict:
     parser = JsonOutputParser(pydantic_object=ReviewResult)
+    prompt = ChatPromptTemplate.from_template(
+        """
+        你是一个严格的技术面试题质检员。
+        待审核题目 (序号从 0 开始)：
+        {questions}
+        候选人职级：{level}
+        请给出整体评分 (0-100) 与修改建议，并对每道题单独评分 (reviews)。只输出 JSON。
+        {format_instructions}
+        """
+    )
+    chain = prompt | llm | parser
+    return _validate_review(await chain.ainvoke({
+        "questions": _format_questions(to_review),
+        "level": level,
+        "format_instructions": parser.get_format_instructions()
+    }))
+
 
+async def _review_batch(llm, candidates, level: str) -> List[dict]:
+    """一次调用给多组候选题打分，返回与 candidates 顺序一致的评审结果"""
+    parser = JsonOutputParser(pydantic_object=BatchReviewResult)
     prompt = ChatPromptTemplate.from_template(
         """
         你是一个严格的技术面试题质检员。
-        待审核题目：{questions}
+        下面有 {n} 组候选题目 (组号与题号均从 0 开始)，请分别审核：
+        {candidates}
         候选人职级：{level}
-        请评分 (0-100) 并给出修改建议。只输出 JSON。
+        对每组给出整体评分 (0-100) 与修改建议，并对组内每道题单独评分 (reviews)。只输出 JSON。
         {format_instructions}
         """
     )
     chain = prompt | llm | parser
+    result = await chain.ainvoke({
+        "n": len(candidates),
+        "candidates": "\n\n".join(f"### 候选 {c}\n{_format_questions(qs)}" for c, qs in enumerate(candidates)),
+        "level": level,
+        "format_instructions": parser.get_format_instructions()
+    })
+    by_id = {}
+    for raw in (result.get("candidates") if isinstance(result, dict) else None) or []:
+        try:
+            review = _validate_review(raw)
+        except ValueError:
+            continue
+        by_id.setdefault(review["candidate"], review)
+    # 漏评 (或评审结果无法解析) 的候选组记 0 分，不参与胜出
+    return [by_id.get(c, {"score": 0, "comment": "未评审", "reviews": []}) for c in range(len(candidates))]
+
+
+async def reviewer_node(state: AgentState):
+    logger.debug("⚖️ [Agent: QA] 正在审核题目质量...")
+    await send_thought("⚖️ 质检员正在审核题目质量", "评估深度、准确性与匹配度")
+
+    llm = get_llm(temperature=0.1)
+    candidates = state.get("tech_candidates") or [state["tech_questions"]]
+
+    # targeted 模式：上一轮已通过的题目原样保留在列表前部，沿用原评分 (与 accepted_questions 按位置对应)，只审核新题
+    pinned_reviews = list(state.get("accepted_reviews") or []) if settings.REVIEW_MODE == "targeted" else []
+    to_review = [c[len(pinned_reviews):] for c in candidates]
+
     try:
-        result = await chain.ainvoke({
-            "questions": str(state["tech_questions"]),
-            "level": state["years_required"],
-            "format_instructions": parser.get_format_instructions()
-        })
+        if not to_review[0]:
+            results = [{"score": 100, "comment": "", "reviews": []}]
+        elif len(candidates) == 1:
+            results = [await _review_single(llm, to_review[0], state["years_required"])]
+        else:
+            results = await _review_batch(llm, to_review, state["years_required"])
     except Exception:
-        result = {"score": 95, "comment": "解析失败，默认通过"}
+        results = [{"score": 95, "comment": "解析失败，默认通过", "reviews": []} for _ in candidates]
+
+    # Best-of-N：按有效分数选出最优的一组 (同分时比较单题平均分)
+    scored = []
+    for c, result in enumerate(results):
+        reviews = _collect_reviews(result, to_review[c], pinned_reviews)
+        mean = sum(r["score"] for r in reviews) / len(reviews) if reviews else 0
+        scored.append((_effective_score(result, reviews), mean, c, result, reviews))
+    score, _, best, result, reviews = max(scored, key=lambda x: (x[0], x[1]))
+    questions = candidates[best]
+
+    update = {
+        "tech_questions": questions,
+        "tech_candidates": [],
+        "review_comment": result.get("comment", ""),
+        "question_reviews": reviews,
+        "quality_score": score,
+    }
+    if settings.REVIEW_MODE == "targeted" and reviews:
+        # 达标的题目固定下来，下一轮不再重写；评分按位置一起带到下一轮
+        accepted = [(q, r) for q, r in zip(questions, reviews) if r["score"] >= settings.REVIEW_PASS_SCORE]
+        update["accepted_questions"] = [q for q, _ in accepted]
+        update["accepted_reviews"] = [r for _, r in accepted]
+
+    logger.debug(f"📊 [QA Result] Score: {score} | per-question: {[r['score'] for r in reviews]}")
 
-    logger.debug(f"📊 [QA Result] Score: {result['score']}")
+    if settings.TECH_CANDIDATES_N > 1:
+        # Best-of-N 模式下 tech_lead 不流式推送，选定后再把新题推给前端
+        if len(candidates) > 1:
+            await send_thought(f"🏆 从 {len(candidates)} 组候选题中选出第 {best + 1} 组",
+                               f"各组得分: {[s[0] for s in scored]}")
+        for q in questions[len(pinned_reviews):]:
+            await send_question(q, "tech", version=state.get("iteration_count", 0))
 
     # 将评分结果也推给前端
-    await send_thought(f"📊 质检完成，评分: {result['score']}", f"评语: {result.get('comment', '无')}")
+    await send_thought(f"📊 质检完成，评分: {score}", f"评语: {result.get('comment', '无')}")
 
-    return {"quality_score": result['score'], "review_comment": result['comment']}
+    return update
 
 
 # --- Node 6: Human Approval ---
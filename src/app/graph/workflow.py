@@ -1,16 +1,9 @@
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from app.core.graph_state import AgentState
+import threading
+from typing import Dict, List
 
-# ✅ 核心修复：显式导入所有节点函数
-from app.graph.nodes import (
-    jd_parser_node,
-    researcher_node,
-    tech_lead_node,
-    hr_node,
-    reviewer_node,
-    human_approval_node
-)
+from app.core.config import settings
+from app.core.graph_state import AgentState
+from app.core.run_profiler import timed_node
 
 
 # --- 路由逻辑 ---
@@ -21,57 +14,136 @@ def qa_router(state: AgentState):
         return "approved"
 
     # 2. 只有分数高才通过
-    if state["quality_score"] >= 85:
+    if state["quality_score"] >= settings.REVIEW_PASS_SCORE:
         return "approved"
 
     # 3. 分数低 -> 进入人工介入环节
     return "human_review_needed"
 
 
+# --- 拓扑定义 ---
+# 每个节点依赖的上游节点，用于关键路径分析 (与下方 build_workflow 中的边保持一致)
+NODE_DEPENDENCIES: Dict[str, Dict[str, List[str]]] = {
+    # fast: Parser 之后三路并行，HR 不等背调
+    "fast": {
+        "parser": [],
+        "retriever": [],
+        "researcher": ["parser"],
+        "hr_agent": ["parser"],
+        "tech_lead": ["parser", "retriever", "human_node"],
+        "reviewer": ["tech_lead"],
+        "human_node": ["reviewer"],
+    },
+    # rich: HR 串在背调之后，使用公司背景出题
+    "rich": {
+        "parser": [],
+        "retriever": [],
+        "researcher": ["parser"],
+        "hr_agent": ["researcher"],
+        "tech_lead": ["parser", "retriever", "human_node"],
+        "reviewer": ["tech_lead"],
+        "human_node": ["reviewer"],
+    },
+}
+
+
 # --- 构建图 ---
-workflow = StateGraph(AgentState)
-
-# 添加节点
-workflow.add_node("parser", jd_parser_node)
-workflow.add_node("researcher", researcher_node)
-workflow.add_node("tech_lead", tech_lead_node)
-workflow.add_node("hr_agent", hr_node)
-workflow.add_node("reviewer", reviewer_node)
-workflow.add_node("human_node", human_approval_node)
-
-# 编排流程
-# 1. Start -> Parser
-workflow.set_entry_point("parser")
-
-# 2. Parser -> 并行执行
-workflow.add_edge("parser", "tech_lead")
-workflow.add_edge("parser", "hr_agent")
-workflow.add_edge("parser", "researcher")
-
-# 3. 分支汇聚
-workflow.add_edge("hr_agent", END)
-workflow.add_edge("researcher", END)
-
-# 4. 质量控制循环
-workflow.add_edge("tech_lead", "reviewer")
-
-workflow.add_conditional_edges(
-    "reviewer",
-    qa_router,
-    {
-        "approved": END,
-        "human_review_needed": "human_node"
-    }
-)
-
-# 5. 人工确认后 -> 重写
-workflow.add_edge("human_node", "tech_lead")
-
-# --- 持久化配置 ---
-checkpointer = MemorySaver()
-
-# 编译图
-app_graph = workflow.compile(
-    checkpointer=checkpointer,
-    interrupt_before=["human_node"]  # 遇到 human_node 前自动暂停
-)
\ No newline at end of file
+def build_workflow(mode: str = "fast"):
+    if mode not in NODE_DEPENDENCIES:
+        raise ValueError(f"未知的 Graph 拓扑模式: {mode}")
+
+    # LangGraph 与节点 (链、Prompt、LLM 客户端) 在编译时才导入，不拖慢 app 的 import
+    from langgraph.graph import StateGraph, START, END
+    from langgraph.checkpoint.memory import MemorySaver
+
+    # ✅ 核心修复：显式导入所有节点函数
+    from app.graph.nodes import (
+        jd_parser_node,
+        retriever_node,
+        researcher_node,
+        tech_lead_node,
+        hr_node,
+        reviewer_node,
+        human_approval_node
+    )
+
+    workflow = StateGraph(AgentState)
+
+    # 添加节点 (统一包一层计时，记录每个节点的墙钟时间与 LLM 耗时)
+    workflow.add_node("parser", timed_node("parser", jd_parser_node))
+    workflow.add_node("retriever", timed_node("retriever", retriever_node))
+    workflow.add_node("researcher", timed_node("researcher", researcher_node))
+    workflow.add_node("tech_lead", timed_node("tech_lead", tech_lead_node))
+    workflow.add_node("hr_agent", timed_node("hr_agent", hr_node))
+    workflow.add_node("reviewer", timed_node("reviewer", reviewer_node))
+    workflow.add_node("human_node", timed_node("human_node", human_approval_node))
+
+    # 编排流程
+    # 1. Start -> Parser + Retriever 并行 (检索先用原始 JD，技术栈解析出来后再追加关键词检索)
+    workflow.add_edge(START, "parser")
+    workflow.add_edge(START, "retriever")
+
+    # 2. Parser -> 并行执行；tech_lead 同时等待检索结果 (两者几乎同时结束)
+    workflow.add_edge(["parser", "retriever"], "tech_lead")
+    workflow.add_edge("parser", "researcher")
+
+    # 3. 分支汇聚
+    if mode == "rich":
+        # HR 等待背调完成 (背调有截止时间，不会无限拖长关键路径)
+        workflow.add_edge("researcher", "hr_agent")
+    else:
+        workflow.add_edge("parser", "hr_agent")
+        workflow.add_edge("researcher", END)
+    workflow.add_edge("hr_agent", END)
+
+    # 4. 质量控制循环
+    workflow.add_edge("tech_lead", "reviewer")
+
+    workflow.add_conditional_edges(
+        "reviewer",
+        qa_router,
+        {
+            "approved": END,
+            "human_review_needed": "human_node"
+        }
+    )
+
+    # 5. 人工确认后 -> 重写
+    workflow.add_edge("human_node", "tech_lead")
+
+    # --- 持久化配置 ---
+    checkpointer = MemorySaver()
+
+    # 编译图
+    return workflow.compile(
+        checkpointer=checkpointer,
+        interrupt_before=["human_node"]  # 遇到 human_node 前自动暂停
+    )
+
+
+GRAPH_TOPOLOGY = settings.GRAPH_TOPOLOGY
+
+_app_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_app_graph():
+    """编译后的 Graph 单例：首次调用时才编译 (启动预热或第一个请求触发)"""
+    global _app_graph
+    if _app_graph is None:
+        with _graph_lock:
+            if _app_graph is None:
+                _app_graph = build_workflow(GRAPH_TOPOLOGY)
+    return _app_graph
+
+
+def is_graph_compiled() -> bool:
+    return _app_graph is not None
+
+
+def __getattr__(name):
+    # 兼容旧写法 `from app.graph.workflow import app_graph`
+    if name == "app_graph":
+        return get_app_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
@@ -1,5 +1,11 @@
+import asyncio
+import time
+
+_import_start = time.perf_counter()
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
@@ -11,10 +17,16 @@ from app.utils.logger import logger
 # 🔴 导入路由和数据库初始化函数
 from app.api.endpoints import router as api_router
 from app.core.db_auth import create_db_and_tables
+from app.core.llm_factory import aclose_llm_clients
+from app.core.llm_scheduler import llm_scheduler
+from app.core.config import settings
+from app.core.warmup import mark_ready_without_warmup, readiness, run_warmup
 
 # 加载 .env
 load_dotenv()
 
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
 
 # --- 生命周期管理器 (推荐的 FastAPI 新写法) ---
 @asynccontextmanager
@@ -23,10 +35,32 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 System Startup: Initializing Database...")
     create_db_and_tables()
     logger.success("✅ Database tables created successfully.")
+    logger.info(f"⏱️ app.main imported in {IMPORT_SECONDS * 1000:.0f}ms")
+    # LLM 准入控制器绑定到服务的事件循环 (线程 / 临时循环里的 LLM 调用都到这里排队)
+    llm_scheduler.bind_loop()
+
+    # 2. 预热重型子系统 (BGE 模型 / 知识库索引 / Graph)，完成前 /readyz 返回 503
+    warmup_task = None
+    if settings.STARTUP_WARMUP == "blocking":
+        await run_warmup()
+    elif settings.STARTUP_WARMUP == "background":
+        warmup_task = asyncio.create_task(run_warmup())
+    else:
+        mark_ready_without_warmup()
+
+    # 3. 轮询索引 CURRENT 指针，发布新版本后自动热切换 (不需要重启 worker)
+    watch_task = None
+    if settings.KB_INDEX_WATCH_INTERVAL > 0:
+        from app.core.knowledge_base import watch_index
+        watch_task = asyncio.create_task(watch_index(settings.KB_INDEX_WATCH_INTERVAL))
 
     yield
 
-    # 2. 关闭时 (可选)
+    # 4. 关闭时：取消未完成的预热与索引轮询，释放 LLM 共享连接池
+    for task in (warmup_task, watch_task):
+        if task is not None and not task.done():
+            task.cancel()
+    await aclose_llm_clients()
     logger.info("🛑 System Shutdown.")
 
 
@@ -69,5 +103,18 @@ async def root():
     }
 
 
+@app.get("/healthz", tags=["System"])
+async def healthz():
+    """存活探针：进程能响应即可，不依赖模型是否加载"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz", tags=["System"])
+async def readyz():
+    """就绪探针：预热完成 (模型、索引、Graph 均已加载) 才返回 200"""
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
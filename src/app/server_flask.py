@@ -1,7 +1,7 @@
 from flask import Flask, request, Response, stream_with_context
 from loguru import logger
 
-from app.core.rag_engine import rag_engine
+from app.core.rag_engine import get_rag_engine
 import json
 import time
 
@@ -21,7 +21,7 @@ def analyze_jd_flask():
     jd_text = data.get('jd_text', '')
 
     # 1. 演示 RAG：先从向量库找有没有类似的历史经验
-    related_info = rag_engine.search(query=jd_text, top_k=1)
+    related_info = get_rag_engine().search(query=jd_text, top_k=1)
     logger.debug(f"RAG 检索结果: {related_info}")
 
     # 2. 演示 SSE (服务器推送事件)
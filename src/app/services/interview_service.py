@@ -1,35 +1,111 @@
 # 确保导入了 JDMetaData
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
 from sqlmodel import Session
 
-from app.graph.workflow import app_graph
+from app.core.config import settings
+from app.core.llm_scheduler import Priority, set_llm_priority
+from app.core.stream_manager import bind_stream_sink
+from app.core.jd_meta_channel import bind_jd_meta_channel
+from app.core.run_profiler import start_run, finish_run
+from app.core.user_kb import user_kb_version
+from app.graph.workflow import get_app_graph, GRAPH_TOPOLOGY, NODE_DEPENDENCIES
 from app.schemas.interview import InterviewReport, JDRequest, JDMetaData
+from app.services.memory_service import get_user_profile_version
+from app.utils.lru_cache import TTLLRUCache
 from loguru import logger
 
-async def generate_interview_guide(request: JDRequest, db: Session, user_id: int) -> InterviewReport:
-    logger.info("🚀 [L5 Agent] Starting Multi-Agent Swarm...")
 
-    # 1. 准备初始状态
-    initial_state = {
-        "jd_text": request.jd_text,
-        "user_id": user_id,
-        "iteration_count": 0,
-        "tech_stack": [],  # 初始化空列表防止 KeyErr
-        "years_required": "",  # 初始化
-        "company_name": ""  # 初始化
-    }
+# ==========================================
+# 报告缓存 & Single-Flight 合并
+# ==========================================
+# 同一用户短时间内重复提交同一份 JD (前端重试很常见) 时：
+# - 已完成的报告直接从缓存返回
+# - 正在运行的相同请求不会再启动一次 Graph，而是挂到同一个运行上，共享结果和流式事件
+report_cache = TTLLRUCache(maxsize=settings.REPORT_CACHE_MAX_ENTRIES, ttl=settings.REPORT_CACHE_TTL)
+_inflight: Dict[str, "GuideFlight"] = {}
+_flight_stats = {"graph_runs": 0, "coalesced": 0}
+
+
+def normalize_jd(jd_text: str) -> str:
+    """归一化 JD：合并空白字符，忽略首尾空格"""
+    return re.sub(r"\s+", " ", jd_text).strip()
+
+
+def make_report_key(jd_text: str, user_id: int, profile_version: str, kb_version: str = "") -> str:
+    """
+    报告属于具体用户 (thread_id / 对话历史 / 画像都按用户区分)，key 中必须带上 user_id
+    kb_version: 用户私有知识库版本，报告会引用私有资料，上传新资料后旧报告失效
+    """
+    raw = f"{user_id}\n{normalize_jd(jd_text)}\n{profile_version}\n{kb_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GuideFlight:
+    """
+    一次正在运行 (或已完成) 的 Graph 执行
+    实现了 async put()，可以直接作为 stream_manager 的输出目标：
+    节点发出的每条事件会被记录下来并广播给所有订阅者，后加入的订阅者会先收到历史事件。
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[dict] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.done = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # 流式订阅者只消费事件、不 await future，这里主动取走异常避免 "never retrieved" 警告
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.task: Optional[asyncio.Task] = None
 
-    # 2. 运行 Graph
-    thread_id = f"user_{user_id}_job_{hash(request.jd_text)}"
-    config = {"configurable": {"thread_id": thread_id}}
+    async def put(self, event: Optional[dict]):
+        if event is None:
+            self._finish()
+            return
+        self.events.append(event)
+        for q in self.subscribers:
+            q.put_nowait(event)
 
-    # 运行到结束（或者暂停点）
-    final_state = None
-    async for event in app_graph.astream(initial_state, config=config):
-        # 这里可以加日志看进度
-        pass
+    def _finish(self):
+        self.done = True
+        for q in self.subscribers:
+            q.put_nowait(None)
 
-    # 获取最终状态快照
-    snapshot = app_graph.get_state(config)
+    def subscribe(self) -> asyncio.Queue:
+        q = asyncio.Queue()
+        for event in self.events:
+            q.put_nowait(event)
+        if self.done:
+            q.put_nowait(None)
+        else:
+            self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        """订阅者断开 (SSE 客户端关闭页面) 时移除它的队列，不再为它堆积事件"""
+        if q in self.subscribers:
+            self.subscribers.remove(q)
+
+    async def result(self) -> InterviewReport:
+        # shield：某个等待者被取消时，不影响共享的 Graph 运行
+        report = await asyncio.shield(self.future)
+        return report.model_copy(deep=True)
+
+    @classmethod
+    def completed(cls, key: str, report: InterviewReport) -> "GuideFlight":
+        """缓存命中时构造一个已完成的 flight，对调用方透明"""
+        flight = cls(key)
+        flight.future.set_result(report)
+        flight.events.append({"type": "result", "content": report.model_dump_json()})
+        flight._finish()
+        return flight
+
+
+def _build_report(snapshot) -> Tuple[InterviewReport, bool]:
+    """根据 Graph 最终状态组装报告，返回 (报告, 是否暂停等待人工介入)"""
     final_state = snapshot.values
 
     # 3. 检查是否需要人工介入
@@ -50,7 +126,7 @@ async def generate_interview_guide(request: JDRequest, db: Session, user_id: int
             system_design_question=None,
             # 利用 company_analysis 字段传达状态
             company_analysis=f"⚠️ 任务暂停：质检员建议修改 - {final_state.get('review_comment')}"
-        )
+        ), True
 
     # 4. 正常结束，组装完整报告
     # 🟢 核心修复：显式构造 meta 对象
@@ -68,5 +144,142 @@ async def generate_interview_guide(request: JDRequest, db: Session, user_id: int
         hr_questions=final_state.get("hr_questions", []),
         system_design_question=None,
         company_analysis=final_state.get("company_info", ""),
-        reference_sources=[]  # 如果有 RAG 来源可以加上
-    )
\ No newline at end of file
+        reference_sources=final_state.get("reference_sources") or []  # Retriever 节点检索到的博客文章
+    ), False
+
+
+def _dump_questions(questions) -> list:
+    return [q.model_dump() if hasattr(q, "model_dump") else q for q in (questions or [])]
+
+
+def _partial_events(node: str, update: dict, version: int = 1) -> List[dict]:
+    """
+    把单个节点的状态增量转换成前端可直接渲染的部分结果事件
+    version: 当前技术题版本 (最近一次 tech_lead 的 iteration_count)，reviewer 的增量里没有这个字段
+    """
+    if not isinstance(update, dict):
+        return []
+    if node == "parser":
+        return [{"type": "meta", "content": {
+            "company_name": update.get("company_name"),
+            "tech_stack": update.get("tech_stack", []),
+            "years_required": update.get("years_required"),
+        }}]
+    if node == "researcher":
+        return [{"type": "company_info", "content": update.get("company_info", "")}]
+    if node == "hr_agent":
+        return [{"type": "hr_questions", "content": _dump_questions(update.get("hr_questions"))}]
+    if node == "tech_lead":
+        if settings.TECH_CANDIDATES_N > 1:
+            # Best-of-N 模式下题目统一由 reviewer 下发 (即使只剩一组候选)，避免同一版本推送两次
+            return []
+        return [{"type": "tech_questions", "version": update.get("iteration_count", 1),
+                 "content": _dump_questions(update.get("tech_questions"))}]
+    if node == "reviewer":
+        events = [{"type": "review", "content": {
+            "score": update.get("quality_score"),
+            "comment": update.get("review_comment", ""),
+        }}]
+        if settings.TECH_CANDIDATES_N > 1:
+            events.insert(0, {"type": "tech_questions", "version": version,
+                              "content": _dump_questions(update.get("tech_questions"))})
+        return events
+    return []
+
+
+async def _run_graph(flight: GuideFlight, jd_text: str, user_id: int):
+    """后台执行一次 Graph，结果写入 flight (事件 + future)"""
+    # 节点内的 send_thought 全部发往 flight，由 flight 广播给所有订阅者
+    bind_stream_sink(flight)
+    # Parser 解析出技术栈后通知并行运行的 Retriever 追加关键词检索
+    bind_jd_meta_channel()
+    set_llm_priority(Priority.GUIDE)
+    trace = start_run(GRAPH_TOPOLOGY, review_mode=settings.REVIEW_MODE,
+                      candidates=settings.TECH_CANDIDATES_N)
+    _flight_stats["graph_runs"] += 1
+    try:
+        # 1. 准备初始状态
+        initial_state = {
+            "jd_text": jd_text,
+            "user_id": user_id,
+            "iteration_count": 0,
+            "tech_stack": [],  # 初始化空列表防止 KeyErr
+            "years_required": "",  # 初始化
+            "company_name": ""  # 初始化
+        }
+
+        # 2. 运行 Graph
+        thread_id = f"user_{user_id}_job_{hash(jd_text)}"
+        config = {"configurable": {"thread_id": thread_id}}
+        app_graph = get_app_graph()
+
+        # 运行到结束（或者暂停点）
+        # updates 模式：每个节点完成时拿到它的状态增量，立刻作为部分结果推送
+        version = 1
+        async for event in app_graph.astream(initial_state, config=config, stream_mode="updates"):
+            for node, update in event.items():
+                if isinstance(update, dict) and "iteration_count" in update:
+                    version = update["iteration_count"] or 1
+                for partial in _partial_events(node, update, version):
+                    await flight.put(partial)
+
+        # 获取最终状态快照
+        snapshot = app_graph.get_state(config)
+        report, paused = _build_report(snapshot)
+
+        # 暂停等待人工介入的报告不完整，不进缓存
+        if settings.REPORT_CACHE_ENABLED and not paused:
+            report_cache.set(flight.key, report)
+
+        flight.future.set_result(report)
+        await flight.put({"type": "result", "content": report.model_dump_json()})
+
+    except Exception as e:
+        logger.error(f"❌ [L5 Agent] Graph run failed: {e}")
+        if not flight.future.done():
+            flight.future.set_exception(e)
+        await flight.put({"type": "error", "content": str(e)})
+    finally:
+        finish_run(trace, NODE_DEPENDENCIES[GRAPH_TOPOLOGY])
+        _inflight.pop(flight.key, None)
+        await flight.put(None)
+
+
+def start_interview_guide(request: JDRequest, db: Session, user_id: int) -> GuideFlight:
+    """
+    获取 (或启动) 一次报告生成：
+    缓存命中 -> 已完成的 flight；相同请求运行中 -> 复用同一个 flight；否则启动新的 Graph 运行
+    """
+    key = make_report_key(request.jd_text, user_id, get_user_profile_version(db, user_id), user_kb_version(user_id))
+
+    if settings.REPORT_CACHE_ENABLED:
+        cached = report_cache.get(key)
+        if cached is not None:
+            logger.info("💾 [L5 Agent] Report cache hit, skipping graph run.")
+            return GuideFlight.completed(key, cached)
+
+    flight = _inflight.get(key)
+    if flight is not None:
+        _flight_stats["coalesced"] += 1
+        logger.info("🔗 [L5 Agent] Identical request in flight, attaching to it.")
+        return flight
+
+    logger.info("🚀 [L5 Agent] Starting Multi-Agent Swarm...")
+    flight = GuideFlight(key)
+    _inflight[key] = flight
+    flight.task = asyncio.create_task(_run_graph(flight, request.jd_text, user_id))
+    return flight
+
+
+async def generate_interview_guide(request: JDRequest, db: Session, user_id: int) -> InterviewReport:
+    flight = start_interview_guide(request, db, user_id)
+    return await flight.result()
+
+
+def get_report_cache_stats() -> dict:
+    return {
+        "enabled": settings.REPORT_CACHE_ENABLED,
+        "cache": report_cache.stats(),
+        "inflight": len(_inflight),
+        **_flight_stats,
+    }
@@ -1,6 +1,9 @@
+import hashlib
+
 from loguru import logger
 from sqlmodel import Session, select, delete
 from app.core.models import UserProfile
+from app.core.llm_scheduler import Priority, set_llm_priority
 from app.chains.memory_extractor import extract_user_profile, UserFact
 
 
@@ -8,6 +11,9 @@ async def update_long_term_memory(db: Session, user_id: int, chat_history_str: s
     """
     【写】后台任务：提取对话中的事实并存入数据库
     """
+    # 后台任务，LLM 准入时排在对话与报告生成之后
+    set_llm_priority(Priority.BACKGROUND)
+
     # 1. 调用 LLM 提取事实
     facts = await extract_user_profile(chat_history_str)
 
@@ -59,4 +65,19 @@ def get_user_profile_str(db: Session, user_id: int) -> str:
     for cat, contents in grouped.items():
         result_str += f"- {cat}: {', '.join(contents)}\n"
 
-    return result_str
\ No newline at end of file
+    return result_str
+
+
+def get_user_profile_version(db: Session, user_id: int) -> str:
+    """
+    用户画像版本号：画像内容任意变化 (新增/修改/删除) 都会得到不同的版本
+    用于报告缓存的 key，画像更新后旧报告自动失效
+    """
+    profiles = db.exec(
+        select(UserProfile).where(UserProfile.user_id == user_id).order_by(UserProfile.id)
+    ).all()
+
+    digest = hashlib.sha1()
+    for p in profiles:
+        digest.update(f"{p.id}|{p.category}|{p.content}|{p.updated_at}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
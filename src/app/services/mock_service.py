@@ -4,6 +4,7 @@ from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.core.llm_factory import get_llm
 from app.chains.mock_agents import get_interviewer_chain, get_candidate_chain
+from app.core.llm_scheduler import Priority, set_llm_priority
 
 
 def format_sse(role: str, content: str) -> str:
@@ -20,6 +21,9 @@ async def run_mock_interview_stream(jd_text: str, rounds: int = 3):
     """
     生成器函数：控制面试流程并流式输出
     """
+    # 模拟面试是实时交互，LLM 准入时优先放行
+    set_llm_priority(Priority.INTERACTIVE)
+
     # 1. 初始化 Agents
     interviewer = get_interviewer_chain()
     candidate = get_candidate_chain()
@@ -0,0 +1,107 @@
+import json
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Type, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class IncrementalJSONArrayParser:
+    """
+    增量 JSON 数组解析器
+    LLM 边生成边喂入文本片段，`"<array_key>": [ {...}, {...} ]` 中每闭合一个对象就立刻产出，
+    不用等整段 JSON 生成完。兼容 ```json 代码块包裹和直接输出顶层数组两种情况。
+    """
+
+    def __init__(self, array_key: str):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self._buf = ""
+        self._pos = -1  # 数组内的扫描位置，-1 表示还没找到数组开头
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = -1
+        self._closed = False
+
+    def _locate_array(self):
+        match = self._key_pattern.search(self._buf)
+        if match:
+            self._pos = match.end()
+            return
+        # 兜底：模型直接输出了顶层数组
+        stripped = self._buf.lstrip()
+        if stripped.startswith("```"):
+            newline = stripped.find("\n")
+            stripped = stripped[newline + 1:].lstrip() if newline != -1 else ""
+        if stripped.startswith("["):
+            self._pos = self._buf.index("[") + 1
+
+    def feed(self, text: str) -> List[dict]:
+        """喂入新文本，返回本次新闭合的对象列表"""
+        if self._closed:
+            return []
+        self._buf += text
+        if self._pos < 0:
+            self._locate_array()
+            if self._pos < 0:
+                return []
+
+        items = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start >= 0:
+                    try:
+                        items.append(json.loads(buf[self._obj_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"⚠️ [JSON Stream] Skip malformed item: {e}")
+                    self._obj_start = -1
+            elif ch == "]" and self._depth == 0:
+                self._closed = True
+                i += 1
+                break
+            i += 1
+        self._pos = i
+        return items
+
+
+async def stream_json_items(
+        chunks: AsyncIterator[str],
+        array_key: str,
+        item_model: Type[T],
+        on_item: Optional[Callable[[T], Awaitable[None]]] = None,
+) -> str:
+    """
+    消费 LLM 文本流：每解析出一个完整条目就回调 on_item，返回完整文本 (供最终解析/校验)
+    """
+    parser = IncrementalJSONArrayParser(array_key)
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        for obj in parser.feed(chunk):
+            try:
+                item = item_model.model_validate(obj)
+            except ValidationError as e:
+                logger.debug(f"⚠️ [JSON Stream] Item failed validation: {e}")
+                continue
+            if on_item is not None:
+                await on_item(item)
+    return "".join(parts)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# ANN 索引选型基准：在真实语料向量上对比各索引规格的 recall@k (以 Flat 精确检索为基准)、查询延迟、索引大小
+# 用法 (在 src 目录下):
+#   python test/benchmark/ann_bench.py                              # 使用博客索引中的向量
+#   python test/benchmark/ann_bench.py --from-cache                 # 使用片段向量磁盘缓存 (全部语料)
+#   python test/benchmark/ann_bench.py --specs "HNSW32;IVFauto,PQ16" --search-params "efSearch=64;nprobe=16"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.core.ann_index import apply_search_params, build_index, index_size_bytes  # noqa: E402
+from app.blog.embedding_cache import DEFAULT_CACHE_PATH  # noqa: E402
+from app.core.index_versions import resolve_index_dir  # noqa: E402
+
+DEFAULT_INDEX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "blog_faiss_index"))
+DEFAULT_SPECS = "Flat;HNSW32;IVFauto,Flat;IVFauto,PQ16;SQ8;PCA256,Flat;PCA256,IVFauto,PQ16"
+DEFAULT_PARAMS = ";efSearch=64;nprobe=16;nprobe=16;;;nprobe=16"
+
+
+def load_from_index(path: str) -> np.ndarray:
+    index = faiss.read_index(os.path.join(resolve_index_dir(path)[0], "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def load_from_cache(path: str) -> np.ndarray:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT vector FROM chunk_embeddings").fetchall()
+    conn.close()
+    return np.stack([np.frombuffer(blob, dtype="float32") for (blob,) in rows])
+
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))] * 1000
+
+
+def bench_spec(spec: str, params: str, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    start = time.perf_counter()
+    index, resolved = build_index(spec, corpus)
+    index.add(corpus)
+    build_s = time.perf_counter() - start
+    apply_search_params(index, params)
+
+    latencies, hits = [], 0
+    for i, q in enumerate(queries):
+        t = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t)
+        hits += len(set(ids[0].tolist()) & set(truth[i].tolist()))
+
+    return {
+        "spec": resolved,
+        "params": params or "-",
+        "recall": hits / (len(queries) * k),
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "size_mb": index_size_bytes(index) / 1024 / 1024,
+        "build_s": build_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--from-cache", action="store_true", help="从片段向量磁盘缓存读取语料向量")
+    parser.add_argument("--specs", default=DEFAULT_SPECS, help="分号分隔的索引规格")
+    parser.add_argument("--search-params", default=DEFAULT_PARAMS, help="分号分隔，与 --specs 一一对应")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = load_from_cache(DEFAULT_CACHE_PATH) if args.from_cache else load_from_index(args.index_dir)
+    corpus = np.ascontiguousarray(corpus, dtype="float32")
+    rng = np.random.default_rng(0)
+    # 查询：随机抽取语料向量并加少量扰动，模拟 "语义接近但不完全相同" 的真实查询
+    queries = corpus[rng.choice(len(corpus), min(args.queries, len(corpus)), replace=False)]
+    queries = queries + rng.normal(0, 0.02, queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatL2(corpus.shape[1])
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    specs = args.specs.split(";")
+    params = args.search_params.split(";") if args.search_params else []
+    params += [""] * (len(specs) - len(params))
+
+    print(f"corpus={len(corpus)} dim={corpus.shape[1]} queries={len(queries)} k={args.k}")
+    print(f"{'spec':<28}{'params':<14}{'recall@k':>9}{'p50 ms':>9}{'p99 ms':>9}{'size MB':>9}{'build s':>9}")
+    for spec, p in zip(specs, params):
+        try:
+            r = bench_spec(spec, p, corpus, queries, truth, args.k)
+        except Exception as e:
+            print(f"{spec:<28}failed: {e}")
+            continue
+        print(f"{r['spec']:<28}{r['params']:<14}{r['recall']:>9.3f}{r['p50']:>9.3f}{r['p99']:>9.3f}"
+              f"{r['size_mb']:>9.2f}{r['build_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import random
+import sys
+
+# 上下文组装对比：原样拼接 top-k 片段 vs 按 token 预算打包 (相似度过滤 + 同源合并 + 去重叠)
+# 指标：每次 RAG 调用注入的上下文 token 数 (平均 / p50 / p95) 与黄金集召回率
+# 黄金集为 JSONL，每行 {"query": "...", "expect": ["必须出现在上下文中的原文片段", ...], "source": "可选，期望的来源文件"}；
+# 不提供时从索引抽样生成：以片段所在的最深一级标题为查询，期望上下文中包含该片段开头的一句话
+# 用法 (在 src 目录下):
+#   python test/benchmark/context_packing_bench.py --golden golden.jsonl --k 5 --budget 1200
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.core.ann_index import to_similarity  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.context_packer import count_tokens, load_encoding, pack_context, with_similarity  # noqa: E402
+from app.core.embedding_registry import get_embeddings  # noqa: E402
+from app.core.index_versions import resolve_index_dir  # noqa: E402
+from app.core.knowledge_base import DB_PATH  # noqa: E402
+from app.core.mmap_store import MmapVectorStore  # noqa: E402
+
+HEADERS = ("Header 3", "Header 2", "Header 1")
+
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))]
+
+
+def raw_context(docs) -> str:
+    """改造前的拼接方式：top-k 片段原样拼接"""
+    return "\n\n".join(f"---[引用自: {d.metadata.get('source', '未知来源')}]---\n{d.page_content}" for d in docs)
+
+
+def load_golden(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sample_golden(store: MmapVectorStore, n: int, seed: int):
+    rng = random.Random(seed)
+    rows = store._db().execute("SELECT pos, text, metadata FROM chunks").fetchall()
+    golden = []
+    for _, text, meta in rng.sample(rows, min(n, len(rows))):
+        meta = json.loads(meta)
+        header = next((meta[h] for h in HEADERS if meta.get(h)), None)
+        sentence = text.strip().split("\n")[0][:30]
+        if header and len(sentence) >= 10:
+            golden.append({"query": header, "expect": [sentence], "source": meta.get("source")})
+    return golden
+
+
+def hit(item: dict, context: str) -> bool:
+    if item.get("source") and f"[引用自: {item['source']}]" not in context:
+        return False
+    return all(e in context for e in item.get("expect", []))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=DB_PATH)
+    parser.add_argument("--golden", default="", help="黄金集 JSONL；留空则从索引抽样生成")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=settings.KB_CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--min-similarity", type=float, default=settings.KB_MIN_SIMILARITY)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    load_encoding()  # 先加载 tiktoken，避免前几条查询按估算值计数
+    embeddings = get_embeddings()
+    store = MmapVectorStore.load(resolve_index_dir(args.index)[0], embeddings)
+    golden = load_golden(args.golden) if args.golden else sample_golden(store, args.queries, args.seed)
+
+    results = {"raw": {"tokens": [], "hits": 0}, "packed": {"tokens": [], "hits": 0}}
+    for item in golden:
+        hits = store.similarity_search_with_score_by_vector(embeddings.embed_query(item["query"]), args.k)
+        docs = [with_similarity(doc, to_similarity(store.index, score)) for doc, score in hits]
+        raw = raw_context(docs)
+        packed = pack_context(docs, max_tokens=args.budget, min_similarity=args.min_similarity)["context"]
+        for name, context in (("raw", raw), ("packed", packed)):
+            results[name]["tokens"].append(count_tokens(context) if context else 0)
+            results[name]["hits"] += hit(item, context)
+
+    print(f"index={args.index} golden={len(golden)} k={args.k} budget={args.budget} "
+          f"min_similarity={args.min_similarity}")
+    print(f"{'context':<9}{'avg tok':>9}{'p50 tok':>9}{'p95 tok':>9}{'recall':>8}")
+    for name, r in results.items():
+        if not r["tokens"]:
+            continue
+        print(f"{name:<9}{sum(r['tokens']) / len(r['tokens']):>9.1f}{percentile(r['tokens'], 0.5):>9}"
+              f"{percentile(r['tokens'], 0.95):>9}{r['hits'] / len(golden):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import time
+
+# Embedding 推理后端对比：torch 全精度 vs ONNX fp32 vs ONNX int8
+# 指标：模型加载耗时、单条查询延迟 p50 / p99、批量吞吐 (texts/sec)、与 torch 输出的余弦一致性
+# 用法 (在 src 目录下，先运行 python app/blog/export_onnx.py 导出模型):
+#   python test/benchmark/embedding_backend_bench.py
+#   python test/benchmark/embedding_backend_bench.py --backends torch,onnx-int8 --threads 2 --queries 500
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.blog.export_onnx import PARITY_TEXTS  # noqa: E402
+from app.core.embedding_registry import DEFAULT_MODEL, LazyEmbeddings  # noqa: E402
+from app.core.onnx_embeddings import OnnxEmbeddings, default_onnx_dir, parity_check  # noqa: E402
+
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))] * 1000
+
+
+def load_backend(backend: str, model_dir: str, threads: int):
+    start = time.perf_counter()
+    if backend == "torch":
+        import torch
+        if threads > 0:
+            torch.set_num_threads(threads)
+        model = LazyEmbeddings(DEFAULT_MODEL, device="cpu", backend="torch").load()
+    else:
+        model = OnnxEmbeddings(model_dir, quantized=backend == "onnx-int8", threads=threads)
+    return model, time.perf_counter() - start
+
+
+def bench(model, queries, batch_size: int) -> dict:
+    model.embed_query("warmup")
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        model.embed_query(q)
+        latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        model.embed_documents(queries[i:i + batch_size])
+    throughput = len(queries) / (time.perf_counter() - start)
+    return {"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99), "throughput": throughput}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--model-dir", default=default_onnx_dir(DEFAULT_MODEL))
+    parser.add_argument("--threads", type=int, default=4, help="torch / onnxruntime 线程数 (与线上配置保持一致)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16, help="吞吐测试的批大小 (对应 KB_BATCH_MAX_SIZE)")
+    args = parser.parse_args()
+
+    queries = [f"{PARITY_TEXTS[i % len(PARITY_TEXTS)]} ({i})" for i in range(args.queries)]
+    reference = None
+    print(f"queries={len(queries)} threads={args.threads} batch={args.batch_size}")
+    print(f"{'backend':<12}{'load s':>8}{'p50 ms':>9}{'p99 ms':>9}{'texts/s':>10}{'min cos':>10}{'mean cos':>10}")
+    for backend in args.backends.split(","):
+        try:
+            model, load_s = load_backend(backend, args.model_dir, args.threads)
+        except Exception as e:
+            print(f"{backend:<12}failed: {e}")
+            continue
+        r = bench(model, queries, args.batch_size)
+        if backend == "torch":
+            reference = model
+        parity = parity_check(reference, model, PARITY_TEXTS) if reference is not None else None
+        cos = f"{parity['min_cosine']:>10.5f}{parity['mean_cosine']:>10.5f}" if parity else f"{'-':>10}{'-':>10}"
+        print(f"{backend:<12}{load_s:>8.2f}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['throughput']:>10.1f}{cos}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# 检索方式对比：纯向量 vs 纯 BM25 vs 混合 (RRF) vs 混合 + 词法快速路径
+# 查询集由索引自动生成 (没有人工标注)：随机抽取片段，
+#   keyword: 取片段中 IDF 最高的 2~3 个词拼成短查询 (模拟 "Redis 持久化" 一类流量)
+#   header:  取片段最深一级标题 (Header 3 > Header 2 > Header 1)
+# 以源片段是否出现在 top-k 中计算 recall@k；标题查询同一标题下的任一片段都算命中
+# 用法 (在 src 目录下，先运行 python app/blog/build_blog_kb.py 生成带 bm25/ 的 mmap 索引):
+#   python test/benchmark/hybrid_search_bench.py --queries 300 --k 3
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import numpy as np  # noqa: E402
+
+from app.core.bm25_index import reciprocal_rank_fusion, tokenize  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.embedding_registry import get_embeddings  # noqa: E402
+from app.core.index_versions import resolve_index_dir  # noqa: E402
+from app.core.knowledge_base import DB_PATH  # noqa: E402
+from app.core.mmap_store import MmapVectorStore  # noqa: E402
+
+HEADERS = ("Header 3", "Header 2", "Header 1")
+
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))] * 1000
+
+
+def build_queries(store: MmapVectorStore, n: int, seed: int):
+    """返回 [(类型, 查询, 相关位置集合)]"""
+    rng = random.Random(seed)
+    bm25 = store.bm25
+    total = len(bm25.doc_len)
+    rows = store._db().execute("SELECT pos, text FROM chunks").fetchall()
+    df = np.diff(bm25.offsets)
+    queries = []
+    for pos, text in rng.sample(rows, min(n, len(rows))):
+        terms = [t for t in dict.fromkeys(tokenize(text, bm25.tokenizer)) if t in bm25.term_ids and len(t) > 1]
+        if len(terms) >= 2:
+            terms.sort(key=lambda t: df[bm25.term_ids[t]])
+            queries.append(("keyword", " ".join(terms[:rng.choice((2, 3))]), {pos}))
+        meta = store._fetch([pos]).get(pos)
+        header = next((meta.metadata[h] for h in HEADERS if meta and meta.metadata.get(h)), None)
+        if header:
+            relevant = {int(p) for p in store.metadata_index.resolve({h: meta.metadata[h] for h in HEADERS
+                                                                     if meta.metadata.get(h)})}
+            queries.append(("header", header, relevant or {pos}))
+    queries = [q for q in queries if q[2] and max(q[2]) < total]
+    return queries
+
+
+def run(mode: str, store: MmapVectorStore, embeddings, query: str, k: int, candidates: int):
+    """返回 (位置列表, 是否走了快速路径)"""
+    if mode in ("lexical", "hybrid+fast"):
+        lexical, exact = store.bm25.search(query, candidates, exact_k=k)
+        if mode == "lexical" or (exact and len(tokenize(query, store.bm25.tokenizer)) <= settings.KB_FAST_PATH_MAX_TERMS):
+            return [p for p, _ in lexical[:k]], mode != "lexical"
+    elif mode == "hybrid":
+        lexical, _ = store.bm25.search(query, candidates)
+    dense = store.search_positions(embeddings.embed_query(query), candidates if mode != "vector" else k)
+    if mode == "vector":
+        return [p for p, _ in dense], False
+    return reciprocal_rank_fusion([[p for p, _ in dense], [p for p, _ in lexical]], settings.KB_RRF_K)[:k], False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=DB_PATH)
+    parser.add_argument("--modes", default="vector,lexical,hybrid,hybrid+fast")
+    parser.add_argument("--queries", type=int, default=200, help="抽样片段数 (每个片段最多生成 2 条查询)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=settings.KB_HYBRID_CANDIDATES)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    embeddings = get_embeddings()
+    store = MmapVectorStore.load(resolve_index_dir(args.index)[0], embeddings)
+    if store.bm25 is None:
+        sys.exit(f"no bm25/ index under {args.index}; rebuild with app/blog/build_blog_kb.py")
+    queries = build_queries(store, args.queries, args.seed)
+    embeddings.embed_query("warmup")
+    print(f"index={args.index} queries={len(queries)} k={args.k} candidates={args.candidates} "
+          f"tokenizer={store.bm25.tokenizer}")
+    print(f"{'mode':<13}{'recall':>8}{'kw recall':>11}{'hdr recall':>12}{'p50 ms':>9}{'p99 ms':>9}{'fast %':>8}")
+    for mode in args.modes.split(","):
+        latencies, hits, fast = [], {"keyword": [], "header": []}, 0
+        for kind, query, relevant in queries:
+            t = time.perf_counter()
+            positions, used_fast = run(mode, store, embeddings, query, args.k, args.candidates)
+            latencies.append(time.perf_counter() - t)
+            hits[kind].append(bool(relevant & set(positions)))
+            fast += used_fast
+        all_hits = hits["keyword"] + hits["header"]
+        recall = lambda h: f"{sum(h) / len(h):.3f}" if h else "-"  # noqa: E731
+        print(f"{mode:<13}{recall(all_hits):>8}{recall(hits['keyword']):>11}{recall(hits['header']):>12}"
+              f"{percentile(latencies, 0.5):>9.2f}{percentile(latencies, 0.99):>9.2f}{fast / len(queries) * 100:>7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
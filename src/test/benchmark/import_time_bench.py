@@ -0,0 +1,75 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# 启动耗时回归检查：用 `python -X importtime` 统计 import 每个模块的耗时 (自身 / 含子模块累计)
+# 用法 (在 src 目录下):
+#   python test/benchmark/import_time_bench.py                         # 分析 import app.main
+#   python test/benchmark/import_time_bench.py --top 30 --budget-ms 3000
+#   python test/benchmark/import_time_bench.py --module app.core.knowledge_base
+# 超过 --budget-ms 时以非零状态退出，可直接放进 CI；--forbid 列出的模块被导入同样视为回归
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_FORBID = "torch,faiss,sentence_transformers,langgraph,pyttsx3"
+
+
+def measure(module: str):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "import-time-bench")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("\n".join(tail[-20:]))
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # 格式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), len(name) - len(name.lstrip())))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=0, help="总 import 耗时上限 (0 = 不检查)")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="逗号分隔，启动阶段不应被导入的顶层包")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_ms = next(cum for name, _, cum, _ in rows if name == args.module) / 1000
+    top_level = {name.split(".")[0] for name, *_ in rows}
+    forbidden = sorted(set(filter(None, args.forbid.split(","))) & top_level)
+
+    print(f"import {args.module}: {total_ms:.0f} ms, {len(rows)} modules")
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    # 按顶层包汇总自身耗时，便于定位是哪个依赖拖慢了启动
+    by_package = {}
+    for name, self_us, _, _ in rows:
+        pkg = name.split(".")[0]
+        by_package[pkg] = by_package.get(pkg, 0) + self_us
+    print("\nself time by top-level package:")
+    for pkg, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+        print(f"{us / 1000:>14.1f}  {pkg}")
+
+    failed = False
+    if forbidden:
+        print(f"\n❌ heavy packages imported at startup: {', '.join(forbidden)}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"\n❌ import time {total_ms:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
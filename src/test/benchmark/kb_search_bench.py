@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import time
+
+# 进程内压测 BlogKnowledgeBase.search：不同并发下的检索延迟 p50 / p99 与实际合批大小
+# 用法 (在 src 目录下): python test/benchmark/kb_search_bench.py [并发1,并发2,...] [每个并发的查询数]
+# 通过环境变量 KB_BATCH_MAX_SIZE / KB_BATCH_WINDOW_MS / KB_TORCH_THREADS 对比不同配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.core.knowledge_base import kb_engine  # noqa: E402
+
+QUERIES = [
+    "Redis 持久化 RDB 和 AOF 的区别",
+    "MySQL 索引失效的场景",
+    "Python GIL 对多线程的影响",
+    "Kafka 如何保证消息不丢失",
+    "FastAPI 依赖注入原理",
+    "Docker 镜像分层",
+    "TCP 三次握手与四次挥手",
+    "分布式锁的实现方式",
+]
+
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))] * 1000
+
+
+async def run_level(concurrency: int, total: int) -> dict:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    batches_before = kb_engine.batcher.batches
+    queries_before = kb_engine.batcher.queries
+
+    async def one(i: int):
+        async with sem:
+            start = time.perf_counter()
+            await kb_engine.search(f"{QUERIES[i % len(QUERIES)]} ({i})")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.perf_counter() - start
+
+    batches = kb_engine.batcher.batches - batches_before
+    return {
+        "concurrency": concurrency,
+        "qps": total / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "avg_batch": (kb_engine.batcher.queries - queries_before) / batches if batches else 0.0,
+    }
+
+
+async def main():
+    if kb_engine.vector_store is None:
+        print("⚠️ 未找到博客向量库，请先运行 blog/build_blog_kb.py")
+        return
+    levels = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 4, 16, 32]
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    await kb_engine.search("warmup")
+    print(f"batch_max={kb_engine.batcher.max_batch} window={kb_engine.batcher.window * 1000:.1f}ms")
+    for level in levels:
+        r = await run_level(level, total)
+        print(f"c={r['concurrency']:>3} | {r['qps']:7.1f} qps | p50 {r['p50']:7.2f}ms | "
+              f"p99 {r['p99']:7.2f}ms | avg batch {r['avg_batch']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
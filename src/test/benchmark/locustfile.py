@@ -1,10 +1,29 @@
+import os
+import random
+import uuid
+
 from locust import HttpUser, task, between
 
+# 重复请求比例：模拟前端重试 / 重复粘贴同一份 JD
+# 压测结束后对比 /api/v1/admin/cache/report 中的 graph_runs 与请求总数 (需用 ADMIN_USERNAMES 中的账号登录)
+DUPLICATE_RATE = float(os.getenv("DUPLICATE_RATE", "0.3"))
+HOT_JDS = [
+    "Python 后端开发，熟悉 FastAPI、Redis、MySQL，3 年以上经验",
+    "Go 高级工程师，熟悉 K8s、gRPC、微服务治理，5 年以上经验",
+    "AI 应用工程师，熟悉 LangChain、RAG、向量数据库",
+]
+
+
 class WebsiteUser(HttpUser):
     wait_time = between(1, 5)
 
     @task
     def generate_guide(self):
+        if random.random() < DUPLICATE_RATE:
+            jd_text = random.choice(HOT_JDS)
+        else:
+            jd_text = f"Python 后端开发... ({uuid.uuid4().hex[:8]})"
+
         self.client.post("/api/v1/generate-guide", json={
-            "jd_text": "Python 后端开发..."
-        })
\ No newline at end of file
+            "jd_text": jd_text
+        })
@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+import time
+
+import httpx
+
+# 测量 /stream/generate-guide 的首题时间 (Time To First Question) 与完整报告时间
+# 用法: BENCH_TOKEN=<jwt> python ttfq_bench.py [rounds]
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://localhost:8000/api/v1")
+TOKEN = os.getenv("BENCH_TOKEN", "")
+JD_TEXT = "Python 后端开发，熟悉 FastAPI、Redis、MySQL，3 年以上经验 ({n})"
+
+
+def run_once(n: int) -> dict:
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    start = time.perf_counter()
+    first_question = None
+    result_at = None
+
+    with httpx.stream("POST", f"{BASE_URL}/stream/generate-guide", headers=headers,
+                      json={"jd_text": JD_TEXT.format(n=n)}, timeout=300) as resp:
+        for line in resp.iter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            event = json.loads(line[len("data: "):])
+            elapsed = time.perf_counter() - start
+            if event.get("type") == "question" and first_question is None:
+                first_question = elapsed
+            elif event.get("type") == "result":
+                result_at = elapsed
+
+    return {"first_question": first_question, "result": result_at}
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for i in range(rounds):
+        r = run_once(i)
+        fq = f"{r['first_question']:.2f}s" if r["first_question"] else "-"
+        rs = f"{r['result']:.2f}s" if r["result"] else "-"
+        print(f"[{i}] first question: {fq} | full report: {rs}")